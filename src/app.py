@@ -4,6 +4,7 @@ import os
 from flask import Flask
 from models import db, Teacher
 from flask_bcrypt import Bcrypt
+from flask_migrate import Migrate
 from dotenv import load_dotenv
 
 # Load the .env file
@@ -23,6 +24,8 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = os.environ.get('SQLALCHEMY_TRACK_
 
 db.init_app(app)
 bcrypt = Bcrypt(app)
+# Schema changes go through the migrations in src/migrations, see init_db.py
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(__file__), 'migrations'))
 
 def check_and_insert_teacher():
     """Check if a teacher exists and insert if not."""
@@ -0,0 +1,62 @@
+import hashlib
+
+TRUNCATION_MARKER = "\n... [output truncated]"
+
+
+class OutputCapture:
+    """
+    Bounded reader for one output stream of a running program.
+
+    Only the first preview_bytes are kept in memory. Every byte is hashed,
+    and when a comparator is given the stream is compared as the chunks
+    arrive, so the full output never has to be held.
+    """
+
+    def __init__(self, preview_bytes, comparator=None):
+        self.preview_bytes = preview_bytes
+        self.comparator = comparator
+        self.size = 0
+        self._preview = bytearray()
+        self._digest = hashlib.sha256()
+
+    def feed(self, chunk):
+        """
+        Consume the next chunk of output.
+
+        Args:
+            chunk (bytes): Bytes read from the stream
+
+        Returns:
+            int: Total number of bytes seen so far
+        """
+        if self.comparator is not None:
+            self.comparator.feed(chunk)
+        self._digest.update(chunk)
+        room = self.preview_bytes - len(self._preview)
+        if room > 0:
+            self._preview += chunk[:room]
+        self.size += len(chunk)
+        return self.size
+
+    @property
+    def matches(self):
+        """Whether the whole stream equals the expected output, or None."""
+        if self.comparator is None:
+            return None
+        return self.comparator.finish()
+
+    @property
+    def truncated(self):
+        return self.size > len(self._preview)
+
+    @property
+    def digest(self):
+        """Hex SHA-256 of everything read, including what was not kept."""
+        return self._digest.hexdigest()
+
+    def preview(self):
+        """Decode the kept bytes, marking the text when output was dropped."""
+        text = self._preview.decode("utf-8", errors="replace")
+        if self.truncated:
+            return text + TRUNCATION_MARKER
+        return text
@@ -0,0 +1,76 @@
+import threading
+import time
+
+CLOSED = "closed"  # calls go through
+OPEN = "open"  # calls are refused until the cooldown is over
+HALF_OPEN = "half_open"  # one trial call decides whether to close again
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service after several consecutive failures, and
+    tries one call again once a cooldown has passed.
+    """
+
+    def __init__(self, failure_threshold, cooldown):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures that open the breaker
+            cooldown (float): Seconds the breaker stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return whether a call may be made now; count it as rejected if not."""
+        with self._lock:
+            if (
+                self.state == OPEN
+                and time.monotonic() - self.opened_at >= self.cooldown
+            ):
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_running = False
+            if (
+                self.state == HALF_OPEN
+                or self.consecutive_failures >= self.failure_threshold
+            ):
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "open_for": (
+                    time.monotonic() - self.opened_at if self.state == OPEN else 0.0
+                ),
+            }
@@ -0,0 +1,132 @@
+import difflib
+import os
+import threading
+
+# Rough size of a token for the English, C and program output we send
+CHARS_PER_TOKEN = 4
+# Token budget of each part of a prompt; longer parts keep their head and tail
+PROMPT_CODE_TOKENS = int(os.environ.get("PROMPT_CODE_TOKENS", "4000"))
+PROMPT_ERROR_TOKENS = int(os.environ.get("PROMPT_ERROR_TOKENS", "800"))
+PROMPT_INPUT_TOKENS = int(os.environ.get("PROMPT_INPUT_TOKENS", "300"))
+PROMPT_OUTPUT_TOKENS = int(os.environ.get("PROMPT_OUTPUT_TOKENS", "300"))
+PROMPT_DIFF_TOKENS = int(os.environ.get("PROMPT_DIFF_TOKENS", "400"))
+# Lines of unchanged output shown around each difference
+DIFF_CONTEXT_LINES = 2
+
+_stats = {}  # part -> {"calls", "tokens_before", "tokens_after", "truncated"}
+_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Estimate how many tokens a text takes up in a prompt."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate(text, max_tokens, part="text"):
+    """
+    Cut a text down to a token budget, keeping its beginning and end.
+
+    Args:
+        text (str): Code, errors or output to send
+        max_tokens (int): Budget for the text
+        part (str): Name the sizes are recorded under
+
+    Returns:
+        str: The text itself if it fits, else its head and tail around a
+        note saying how much was left out
+    """
+    text = text or ""
+    before = estimate_tokens(text)
+    if before <= max_tokens:
+        _record(part, before, before, False)
+        return text
+
+    keep = max_tokens * CHARS_PER_TOKEN
+    head, tail = text[: keep * 2 // 3], text[len(text) - keep // 3 :]
+    # Cut on line boundaries when there are any, so code stays readable
+    if "\n" in head:
+        head = head[: head.rfind("\n") + 1]
+    if "\n" in tail:
+        tail = tail[tail.find("\n") + 1 :]
+    omitted = text[len(head) : len(text) - len(tail)]
+    compacted = (
+        f"{head}... [{omitted.count(chr(10))} lines, {len(omitted)} characters "
+        f"omitted] ...\n{tail}"
+    )
+    _record(part, before, estimate_tokens(compacted), True)
+    return compacted
+
+
+def output_diff(actual, expected, max_tokens=PROMPT_DIFF_TOKENS):
+    """
+    Describe where a program's output departs from the expected output.
+
+    Args:
+        actual (str): Output of the program
+        expected (str): Expected output
+        max_tokens (int): Budget for the description
+
+    Returns:
+        str: Position and characters of the first difference, followed by a
+        unified diff of the differing lines, within the token budget
+    """
+    actual, expected = actual or "", expected or ""
+    actual_lines = actual.splitlines()
+    expected_lines = expected.splitlines()
+
+    position = next(
+        (idx for idx, (got, want) in enumerate(zip(actual, expected)) if got != want),
+        min(len(actual), len(expected)),
+    )
+    line = expected.count("\n", 0, position) + 1
+    column = position - (expected.rfind("\n", 0, position) + 1) + 1
+    if position == len(actual) == len(expected):
+        summary = "The outputs only differ in whitespace or line endings."
+    elif position >= len(actual):
+        summary = (
+            f"The output stops early, at line {line} column {column}; "
+            f"expected next: {expected[position : position + 20]!r}"
+        )
+    elif position >= len(expected):
+        summary = (
+            f"The output continues past the expected end: "
+            f"{actual[position : position + 20]!r}"
+        )
+    else:
+        summary = (
+            f"First difference at line {line} column {column}: expected "
+            f"{expected[position : position + 20]!r}, got "
+            f"{actual[position : position + 20]!r}"
+        )
+
+    diff = "\n".join(
+        difflib.unified_diff(
+            expected_lines,
+            actual_lines,
+            "expected",
+            "actual",
+            n=DIFF_CONTEXT_LINES,
+            lineterm="",
+        )
+    )
+    return truncate(f"{summary}\n{diff}", max_tokens, "diff")
+
+
+def get_compaction_stats():
+    """Return the estimated token counts of each prompt part before and after compaction."""
+    with _lock:
+        stats = {part: dict(counts) for part, counts in _stats.items()}
+    for counts in stats.values():
+        counts["tokens_saved"] = counts["tokens_before"] - counts["tokens_after"]
+    return stats
+
+
+def _record(part, before, after, truncated):
+    with _lock:
+        counts = _stats.setdefault(
+            part, {"calls": 0, "tokens_before": 0, "tokens_after": 0, "truncated": 0}
+        )
+        counts["calls"] += 1
+        counts["tokens_before"] += before
+        counts["tokens_after"] += after
+        counts["truncated"] += int(truncated)
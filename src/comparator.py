@@ -0,0 +1,207 @@
+from functools import lru_cache
+
+import numpy as np
+
+# Comparison modes a test case can use
+EXACT = "exact"
+WHITESPACE = "whitespace"
+CASE_INSENSITIVE = "case"
+NUMERIC = "numeric"
+
+COMPARE_MODES = {
+    EXACT: "Exact match",
+    WHITESPACE: "Ignore whitespace",
+    CASE_INSENSITIVE: "Ignore case",
+    NUMERIC: "Numeric (with tolerance)",
+}
+
+# Numeric tokens are compared this many at a time
+NUMERIC_BATCH = 4096
+# Longest token accepted before giving up on a line of output without spaces
+MAX_TOKEN_BYTES = 400
+
+
+def expected_text(output):
+    """
+    Turn a stored expected output into the text the program must print.
+
+    Args:
+        output (str): Testcase.output as entered by the teacher
+
+    Returns:
+        str: Expected output, or None when any output is accepted ("<>")
+    """
+    if output == "<>":  # Any output is acceptable
+        return None
+    if ";" in output:  # Contains multiple outputs
+        return "\n".join(output.split(";"))
+    return output
+
+
+class Expectation:
+    """An expected output prepared once for comparing many runs against."""
+
+    def __init__(self, text, mode=EXACT, abs_tol=0.0, rel_tol=0.0):
+        if mode not in COMPARE_MODES:
+            raise ValueError(f"Unknown comparison mode: {mode}")
+        self.text = text
+        self.mode = mode
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+        data = text.encode("utf-8")
+        if mode == CASE_INSENSITIVE:
+            data = data.lower()
+        self.data = data
+        self.tokens = data.split() if mode in (WHITESPACE, NUMERIC) else None
+        if mode == NUMERIC:
+            self.values = np.array([_to_float(token) for token in self.tokens])
+            self.numeric = ~np.isnan(self.values)
+        self.max_token = max([MAX_TOKEN_BYTES, *map(len, self.tokens or [])])
+
+    def comparator(self):
+        """Return a fresh streaming comparator for one run."""
+        return Comparator(self)
+
+    def matches(self, output):
+        """Compare a complete output in one go."""
+        comparator = self.comparator()
+        comparator.feed(output.encode("utf-8"))
+        return comparator.finish()
+
+
+@lru_cache(maxsize=1024)
+def get_expectation(output, mode=EXACT, abs_tol=0.0, rel_tol=0.0):
+    """
+    Build (or reuse) the Expectation for a stored expected output.
+
+    Args:
+        output (str): Testcase.output as entered by the teacher
+        mode (str): One of COMPARE_MODES
+        abs_tol (float): Absolute tolerance for numeric mode
+        rel_tol (float): Relative tolerance for numeric mode
+
+    Returns:
+        Expectation: The prepared expectation, or None when any output is accepted
+    """
+    text = expected_text(output)
+    if text is None:
+        return None
+    return Expectation(text, mode, abs_tol, rel_tol)
+
+
+def expectation_for(testcase):
+    """Return the Expectation configured on a Testcase row."""
+    return get_expectation(
+        testcase.output,
+        testcase.compare_mode or EXACT,
+        float(testcase.abs_tol or 0.0),
+        float(testcase.rel_tol or 0.0),
+    )
+
+
+class Comparator:
+    """
+    Compares a program's output with an Expectation chunk by chunk, so the
+    output never has to be held in memory. Tokens are split off lazily as
+    chunks arrive; numeric tokens are checked in vectorized batches.
+    """
+
+    def __init__(self, expectation):
+        self.expectation = expectation
+        self.ok = True
+        self._pos = 0  # bytes for exact/case modes, tokens otherwise
+        self._partial = b""
+        self._batch = []
+        self._result = None
+
+    def feed(self, chunk):
+        """Compare the next chunk of output."""
+        if not self.ok:
+            return
+        mode = self.expectation.mode
+        if mode in (EXACT, CASE_INSENSITIVE):
+            if mode == CASE_INSENSITIVE:
+                chunk = chunk.lower()
+            expected = self.expectation.data[self._pos : self._pos + len(chunk)]
+            self.ok = expected == chunk
+            self._pos += len(chunk)
+            return
+
+        tokens = (self._partial + chunk).split()
+        if tokens and not chunk[-1:].isspace():
+            # The last token may continue in the next chunk
+            self._partial = tokens.pop()
+            if len(self._partial) > self.expectation.max_token:
+                self.ok = False
+                return
+        else:
+            self._partial = b""
+        self._take(tokens)
+
+    def finish(self):
+        """
+        Compare whatever is left once the output has ended.
+
+        Returns:
+            bool: True if the whole output matched the expectation
+        """
+        if self._result is None:
+            expectation = self.expectation
+            if self.ok and expectation.tokens is not None:
+                if self._partial:
+                    self._take([self._partial])
+                    self._partial = b""
+                if self.ok and self._batch:
+                    self._flush()
+                expected_length = len(expectation.tokens)
+            else:
+                expected_length = len(expectation.data)
+            self._result = self.ok and self._pos == expected_length
+        return self._result
+
+    def _take(self, tokens):
+        if not tokens:
+            return
+        if self.expectation.mode == WHITESPACE:
+            end = self._pos + len(tokens)
+            self.ok = self.expectation.tokens[self._pos : end] == tokens
+            self._pos = end
+            return
+        self._batch.extend(tokens)
+        if len(self._batch) >= NUMERIC_BATCH:
+            self._flush()
+
+    def _flush(self):
+        batch, self._batch = self._batch, []
+        expectation = self.expectation
+        start, end = self._pos, self._pos + len(batch)
+        self._pos = end
+        if end > len(expectation.tokens):
+            self.ok = False
+            return
+
+        expected = expectation.values[start:end]
+        numeric = expectation.numeric[start:end]
+        try:
+            actual = np.array(batch).astype(np.float64)
+        except ValueError:
+            actual = np.array([_to_float(token) for token in batch])
+        tolerance = np.maximum(
+            expectation.abs_tol, expectation.rel_tol * np.abs(expected)
+        )
+        with np.errstate(invalid="ignore"):
+            close = (actual == expected) | (np.abs(actual - expected) <= tolerance)
+        if not close[numeric].all():
+            self.ok = False
+            return
+        for idx in np.flatnonzero(~numeric):
+            if batch[idx] != expectation.tokens[start + idx]:
+                self.ok = False
+                return
+
+
+def _to_float(token):
+    try:
+        return float(token)
+    except ValueError:
+        return float("nan")
@@ -0,0 +1,225 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import uuid
+from functools import lru_cache
+from subprocess import PIPE, Popen
+
+from diagnostics import diagnostics_flags, parse_gcc_output, render_diagnostics
+
+# Compiled binaries are stored here, named by the hash of what produced them.
+# A relative path is taken from the app's root_path (this directory), not
+# from wherever the server was started.
+COMPILE_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.environ.get("COMPILE_CACHE_DIR", "compile_cache"),
+)
+# Least recently used binaries are evicted once the cache grows past this size
+COMPILE_CACHE_MAX_BYTES = int(
+    os.environ.get("COMPILE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))
+)
+
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_lock = threading.Lock()
+
+
+class CompileResult:
+    """Outcome of compiling one source file."""
+
+    def __init__(
+        self,
+        returncode,
+        binary_path,
+        errors,
+        cached,
+        key=None,
+        diagnostics=(),
+        entry=None,
+    ):
+        self.returncode = returncode
+        self.binary_path = binary_path
+        self.errors = errors  # diagnostics rendered the way gcc prints them
+        self.cached = cached
+        self.key = key  # cache_key() of the source, identifies the binary
+        self.diagnostics = list(diagnostics)  # Diagnostic objects
+        self.entry = entry  # cache file binary_path was installed from
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def is_installed(self):
+        """Whether binary_path is still the very file the key was cached as."""
+        try:
+            return os.path.samestat(os.stat(self.binary_path), os.stat(self.entry))
+        except (OSError, TypeError):
+            return False
+
+    def discard(self):
+        """Remove the installed binary once it has been run."""
+        if self.binary_path is not None:
+            try:
+                os.remove(self.binary_path)
+            except FileNotFoundError:
+                pass
+
+
+@lru_cache(maxsize=1)
+def gcc_version():
+    """Return the full gcc version string, part of every cache key."""
+    try:
+        return subprocess.check_output(
+            ["gcc", "-dumpfullversion", "-dumpversion"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def cache_key(source, flags=None):
+    """
+    Hash the source bytes together with the compiler version and flags.
+
+    Args:
+        source (bytes): Contents of the C file
+        flags (tuple, optional): Extra gcc flags; diagnostics_flags() when None
+
+    Returns:
+        str: Hex SHA-256 digest identifying the binary
+    """
+    if flags is None:
+        flags = diagnostics_flags()
+    digest = hashlib.sha256()
+    digest.update(source)
+    digest.update(b"\0" + gcc_version().encode("utf-8"))
+    for flag in flags:
+        digest.update(b"\0" + flag.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def compile_source(filepath, flags=None):
+    """
+    Compile a C file next to it, reusing a cached binary when the same source
+    was already compiled with the same gcc and flags. Every call installs the
+    binary under a name of its own, so concurrent compiles of the same file
+    never swap the program out from under each other; call discard() when
+    done with it.
+
+    Args:
+        filepath (str): Path to the C file
+        flags (tuple, optional): Extra gcc flags. By default gcc reports its
+            diagnostics in a machine-readable format, so that common errors
+            get hints without the LLM
+
+    Returns:
+        CompileResult: Return code, binary path and compiler errors
+    """
+    if flags is None:
+        flags = diagnostics_flags()
+    with open(filepath, "rb") as file:
+        source = file.read()
+    key = cache_key(source, flags)
+    entry = os.path.join(COMPILE_CACHE_DIR, key)
+    binary_path = f"{os.path.splitext(filepath)[0]}.{uuid.uuid4().hex}.c.out"
+
+    if os.path.exists(entry):
+        try:
+            os.utime(entry)  # mark as recently used
+            _install(entry, binary_path)
+            with _lock:
+                _stats["hits"] += 1
+            return CompileResult(0, binary_path, "", True, key, entry=entry)
+        except FileNotFoundError:
+            pass  # evicted in the meantime, compile again
+
+    with _lock:
+        _stats["misses"] += 1
+    os.makedirs(COMPILE_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=COMPILE_CACHE_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        # Plain ASCII quotes in the messages, whatever the server's locale
+        compile_process = Popen(
+            ["gcc", *flags, filepath, "-o", tmp_path],
+            stdout=PIPE,
+            stderr=PIPE,
+            env={**os.environ, "LC_ALL": "C"},
+        )
+        _, compile_errors = compile_process.communicate()
+        diagnostics = parse_gcc_output(compile_errors.decode("utf-8", "replace"))
+        errors = render_diagnostics(diagnostics, source.decode("utf-8", "replace"))
+        if compile_process.returncode != 0:
+            return CompileResult(
+                compile_process.returncode,
+                None,
+                errors,
+                False,
+                diagnostics=diagnostics,
+            )
+        # Readable and runnable by the unprivileged user of the runner
+        os.chmod(tmp_path, 0o755)
+        os.replace(tmp_path, entry)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    _install(entry, binary_path)
+    _evict()
+    return CompileResult(0, binary_path, errors, False, key, diagnostics, entry)
+
+
+def get_cache_stats():
+    """Return hit/miss counters and the current size of the compile cache."""
+    entries = _entries()
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["entries"] = len(entries)
+    stats["size_bytes"] = sum(size for _, size, _ in entries)
+    stats["max_bytes"] = COMPILE_CACHE_MAX_BYTES
+    return stats
+
+
+def _install(entry, binary_path):
+    # Hard link so that evicting the entry never pulls a binary out from
+    # under a running grader; fall back to a copy across filesystems.
+    try:
+        os.link(entry, binary_path)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copy2(entry, binary_path)
+
+
+def _entries():
+    entries = []
+    try:
+        with os.scandir(COMPILE_CACHE_DIR) as it:
+            for item in it:
+                if item.name.endswith(".tmp") or not item.is_file():
+                    continue
+                stat = item.stat()
+                entries.append((item.path, stat.st_size, stat.st_mtime))
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _evict():
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    if total <= COMPILE_CACHE_MAX_BYTES:
+        return
+    for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        with _lock:
+            _stats["evictions"] += 1
+        total -= size
+        if total <= COMPILE_CACHE_MAX_BYTES:
+            break
@@ -0,0 +1,511 @@
+import json
+import re
+import subprocess
+import threading
+from functools import lru_cache
+
+# gcc options asking for machine-readable diagnostics on stderr, in order of
+# preference. GCC 15 dropped the JSON format; SARIF is there since GCC 13.
+DIAGNOSTICS_FLAGS = (
+    "-fdiagnostics-format=json",
+    "-fdiagnostics-format=sarif-stderr",
+)
+
+# Diagnostic kinds that make the compilation fail
+ERROR_KINDS = ("error", "fatal error")
+# SARIF result levels and the gcc kinds they stand for
+SARIF_KINDS = {"error": "error", "warning": "warning", "note": "note", "none": "note"}
+
+# A diagnostic as gcc prints it without a format flag, e.g.
+# "main.c:3:5: error: 'x' undeclared [-Wfoo]" or "cc1: fatal error: ..."
+TEXT_DIAGNOSTIC = re.compile(
+    r"(?P<file>[^\s:][^:]*):(?:(?P<line>\d+):(?:(?P<column>\d+):)?)?\s*"
+    r"(?P<kind>fatal error|error|warning|note): (?P<message>.*?)"
+    r"(?: \[(?P<option>-W[^\]]*)\])?"
+)
+# Lines of the text format that only give context: the quoted source and
+# caret, fix-it lines and the function or include a diagnostic is in
+TEXT_CONTEXT = re.compile(
+    r"\s*(?:\d+|\+\+\+)? *\||.*: (?:In|At) |In file included from|\s+from "
+)
+
+# Library functions and the header that declares them
+HEADERS = {
+    "stdio.h": (
+        "printf scanf puts gets fgets getchar putchar fprintf sprintf snprintf "
+        "fscanf sscanf fopen fclose"
+    ),
+    "stdlib.h": "malloc calloc realloc free exit atoi atof abs rand srand qsort",
+    "string.h": "strlen strcpy strncpy strcmp strncmp strcat strchr strstr memset memcpy",
+    "math.h": "sqrt pow fabs floor ceil sin cos tan log exp",
+    "ctype.h": "isdigit isalpha isspace isupper islower toupper tolower",
+    "stdbool.h": "bool true false",
+}
+HEADER_OF = {
+    name: header for header, names in HEADERS.items() for name in names.split()
+}
+
+_stats = {"covered": 0, "uncovered": 0, "rules": {}}
+_lock = threading.Lock()
+
+
+class Diagnostic:
+    """One gcc or linker diagnostic."""
+
+    def __init__(self, kind, message, file=None, line=None, column=None, option=None):
+        self.kind = kind  # error, fatal error, warning or note
+        self.message = message
+        self.file = file
+        self.line = line
+        self.column = column
+        self.option = option  # warning option, e.g. -Wformat=
+        self.children = []  # notes attached to this diagnostic
+
+    @property
+    def is_error(self):
+        return self.kind in ERROR_KINDS
+
+
+def _missing_header(name):
+    header = HEADER_OF.get(name)
+    if header is None:
+        return (
+            f"The function '{name}' is called before it is declared. Define it, "
+            "or put its prototype, above the function that calls it."
+        )
+    return (
+        f"'{name}' is declared in <{header}>. Add #include <{header}> at the top "
+        "of the file."
+    )
+
+
+def _unknown_type(name):
+    header = HEADER_OF.get(name)
+    if name == "size_t":
+        header = "stddef.h"
+    if header is None:
+        return f"'{name}' is not a known type. Check its spelling."
+    return f"'{name}' is declared in <{header}>. Add #include <{header}>."
+
+
+def _undefined_reference(name):
+    if name == "main":
+        return "The program has no main function. Check that main is spelled correctly."
+    return (
+        f"'{name}' is called but never defined. Check its spelling, and that "
+        "you wrote the function body and not only its prototype."
+    )
+
+
+# (name, pattern matched against the message, hint) in priority order. The
+# hint is a format string filled with the match groups, or a callable taking
+# them. Only errors need a rule for the hints to skip the LLM; warnings that
+# match one are explained as well.
+RULES = [
+    (
+        "implicit_declaration_typo",
+        r"implicit declaration of function '(\w+)'; did you mean '(\w+)'\?",
+        "There is no function '{0}'. Did you mean '{1}'?",
+    ),
+    (
+        "implicit_declaration",
+        r"(?:incompatible )?implicit declaration of (?:built-in )?function '(\w+)'",
+        _missing_header,
+    ),
+    (
+        "undeclared",
+        r"'(\w+)' undeclared",
+        (
+            "'{0}' is used but never declared. Declare it before its first use, "
+            "and check its spelling and that it is in scope here."
+        ),
+    ),
+    (
+        "missing_semicolon",
+        (
+            r"expected (?:'[;,]'|',' or ';'|'=', ',', ';', 'asm' or '__attribute__')"
+            r" (?:before|at end of)"
+        ),
+        (
+            "A statement or declaration is not finished. A semicolon ';' is "
+            "probably missing right before this point, or at the end of the "
+            "previous line."
+        ),
+    ),
+    (
+        "missing_bracket",
+        r"expected '([)\]}])' before",
+        (
+            "A '{0}' is missing. Check that every opening bracket has a matching "
+            "closing one."
+        ),
+    ),
+    (
+        "missing_brace",
+        r"expected declaration or statement at end of input",
+        "The file ends inside a block. A closing brace '}}' is missing.",
+    ),
+    (
+        "missing_expression",
+        r"expected expression before",
+        (
+            "An expression is missing or incomplete here, e.g. an operator "
+            "without a second operand or an extra bracket."
+        ),
+    ),
+    (
+        "unknown_type",
+        r"unknown type name '(\w+)'",
+        _unknown_type,
+    ),
+    (
+        "missing_header",
+        r"([\w./]+): No such file or directory",
+        "The header '{0}' does not exist. Check the spelling of the #include.",
+    ),
+    (
+        "unterminated_literal",
+        r"missing terminating (['\"]) character",
+        "A text or character literal is not closed. Add the missing {0}.",
+    ),
+    (
+        "stray_character",
+        r"stray '(.+?)' in program",
+        (
+            "The character '{0}' is not valid C here. It often comes from copying "
+            "code with curly quotes; retype the quotes."
+        ),
+    ),
+    (
+        "redeclaration",
+        r"(?:redeclaration|redefinition) of '(\w+)'",
+        (
+            "'{0}' is declared twice in the same scope. Remove one declaration "
+            "or rename one of the variables."
+        ),
+    ),
+    (
+        "conflicting_types",
+        r"conflicting types for '(\w+)'",
+        (
+            "'{0}' is declared with different types. Make the prototype match "
+            "the definition, and declare functions before calling them."
+        ),
+    ),
+    (
+        "argument_count",
+        r"too (few|many) arguments to function '(\w+)'",
+        (
+            "'{1}' is called with too {0} arguments. Compare the call with the "
+            "function's parameter list."
+        ),
+    ),
+    (
+        "lvalue_required",
+        (
+            r"lvalue required as (?:left operand of assignment|increment operand"
+            r"|decrement operand)"
+        ),
+        (
+            "Only a variable can be assigned to or incremented. Did you mean to "
+            "compare with '==' instead of assigning with '='?"
+        ),
+    ),
+    (
+        "not_subscriptable",
+        r"subscripted value is neither array nor pointer",
+        "'[ ]' is used on something that is not an array or a pointer.",
+    ),
+    (
+        "invalid_operands",
+        r"invalid operands to binary (\S+)",
+        (
+            "The operator {0} cannot be used with these operand types. Check "
+            "the types of both sides."
+        ),
+    ),
+    (
+        "break_outside_loop",
+        r"(break|continue) statement not within",
+        (
+            "'{0}' may only be used inside a loop"
+            " (or a switch, for break). Check the braces around it."
+        ),
+    ),
+    (
+        "else_without_if",
+        r"'else' without a previous 'if'",
+        (
+            "This else has no matching if. A semicolon right after the if "
+            "condition or a missing brace usually causes it."
+        ),
+    ),
+    (
+        "return_value",
+        r"'return' with (?:a|no) value, in function returning",
+        "The return statement does not match the function's return type.",
+    ),
+    (
+        "undefined_reference",
+        r"undefined reference to `(\w+)'",
+        _undefined_reference,
+    ),
+    (
+        "format_mismatch",
+        (
+            r"format '(%[^']*)' expects argument of type '([^']+)', but argument "
+            r"\d+ has type '([^']+)'"
+        ),
+        (
+            "{0} expects a {1} but is given a {2}. For scanf, remember the '&' "
+            "before the variable."
+        ),
+    ),
+    (
+        "uninitialized",
+        r"'(\w+)' is used uninitialized",
+        "'{0}' is read before it is given a value.",
+    ),
+    (
+        "missing_return",
+        r"control reaches end of non-void function",
+        (
+            "The function can finish without returning a value. Add a return "
+            "statement on every path."
+        ),
+    ),
+]
+RULES = [(name, re.compile(pattern), hint) for name, pattern, hint in RULES]
+
+
+@lru_cache(maxsize=1)
+def diagnostics_flags():
+    """
+    Probe once which of DIAGNOSTICS_FLAGS the installed gcc accepts.
+
+    Returns:
+        tuple: The gcc flags to compile with; empty when gcc knows neither
+        format, and its plain text output is parsed instead
+    """
+    for flag in DIAGNOSTICS_FLAGS:
+        try:
+            probe = subprocess.run(
+                ["gcc", flag, "-fsyntax-only", "-x", "c", "-"],
+                input=b"int probe;\n",
+                capture_output=True,
+            )
+        except OSError:
+            return ()
+        if probe.returncode == 0:
+            return (flag,)
+    return ()
+
+
+def parse_gcc_output(stderr):
+    """
+    Split gcc's stderr into its diagnostics and the linker's messages.
+
+    Args:
+        stderr (str): Output of gcc run with diagnostics_flags(): JSON,
+            SARIF or, without a flag, gcc's plain text
+
+    Returns:
+        list: Diagnostic for every compiler diagnostic and every undefined
+        reference reported by the linker, in order
+    """
+    diagnostics = []
+    decoder = json.JSONDecoder()
+    position = 0
+    while position < len(stderr):
+        end = stderr.find("\n", position)
+        end = len(stderr) if end == -1 else end + 1
+        if stderr[position] in "[{":
+            # A SARIF document may span several lines
+            try:
+                document, end = decoder.raw_decode(stderr, position)
+                diagnostics.extend(_from_document(document))
+                position = end
+                continue
+            except (ValueError, KeyError, TypeError, AttributeError):
+                pass
+        _from_text(stderr[position:end].rstrip("\n"), diagnostics)
+        position = end
+    return diagnostics
+
+
+def render_diagnostics(diagnostics, source=None):
+    """
+    Render diagnostics the way gcc prints them, for the student to read.
+
+    Args:
+        diagnostics (list): Diagnostic objects from parse_gcc_output
+        source (str, optional): The compiled code, to quote offending lines
+
+    Returns:
+        str: One "file:line:column: kind: message" entry per diagnostic,
+        followed by the source line and a caret where known
+    """
+    lines = source.splitlines() if source is not None else []
+    rendered = []
+
+    def render(diagnostic):
+        if diagnostic.line is None:
+            location = f"{diagnostic.file}: " if diagnostic.file else ""
+        else:
+            location = f"{diagnostic.file}:{diagnostic.line}:{diagnostic.column}: "
+        option = f" [{diagnostic.option}]" if diagnostic.option else ""
+        rendered.append(f"{location}{diagnostic.kind}: {diagnostic.message}{option}")
+        if diagnostic.line is not None and 0 < diagnostic.line <= len(lines):
+            code = lines[diagnostic.line - 1]
+            rendered.append(f"{diagnostic.line:5} | {code}")
+            rendered.append(f"{'':5} | {' ' * max(diagnostic.column - 1, 0)}^")
+        for child in diagnostic.children:
+            render(child)
+
+    for diagnostic in diagnostics:
+        render(diagnostic)
+    return "\n".join(rendered)
+
+
+def local_hints(diagnostics):
+    """
+    Explain the diagnostics with the rule table, without the LLM.
+
+    Args:
+        diagnostics (list): Diagnostic objects of a failed compilation
+
+    Returns:
+        str: One hint per distinct problem, or None when some error matches
+        no rule and the LLM has to explain it
+    """
+    hints = []
+    matched = []
+    for diagnostic in diagnostics:
+        rule = _match(diagnostic.message)
+        if rule is None:
+            if diagnostic.is_error:
+                with _lock:
+                    _stats["uncovered"] += 1
+                return None
+            continue
+        name, hint = rule
+        text = f"Line {diagnostic.line}: {hint}" if diagnostic.line else hint
+        if text not in hints:
+            hints.append(text)
+            matched.append(name)
+    if not hints or not any(diagnostic.is_error for diagnostic in diagnostics):
+        with _lock:
+            _stats["uncovered"] += 1
+        return None
+
+    with _lock:
+        _stats["covered"] += 1
+        for name in matched:
+            _stats["rules"][name] = _stats["rules"].get(name, 0) + 1
+    return "\n".join(hints)
+
+
+def get_hint_stats():
+    """Return how many failed compilations the rules explained on their own."""
+    with _lock:
+        stats = dict(_stats)
+        stats["rules"] = dict(_stats["rules"])
+    failures = stats["covered"] + stats["uncovered"]
+    stats["coverage"] = stats["covered"] / failures if failures else 0.0
+    return stats
+
+
+def _match(message):
+    for name, pattern, hint in RULES:
+        match = pattern.search(message)
+        if match:
+            if callable(hint):
+                return name, hint(*match.groups())
+            return name, hint.format(*match.groups())
+    return None
+
+
+def _from_document(document):
+    if isinstance(document, list):
+        return [_from_json(item) for item in document]
+    return [
+        _from_sarif(result)
+        for run in document["runs"]
+        for result in run.get("results", [])
+    ]
+
+
+def _from_text(text, diagnostics):
+    # The linker knows nothing of the diagnostic formats; keep its real errors
+    match = re.search(r"(\S+?):\([^)]*\): (undefined reference to .*)", text)
+    if match:
+        diagnostics.append(Diagnostic("error", match.group(2), match.group(1)))
+        return
+    if not text.strip() or "ld returned" in text or "in function" in text:
+        return
+    match = TEXT_DIAGNOSTIC.fullmatch(text)
+    if match:
+        diagnostic = Diagnostic(
+            match["kind"],
+            match["message"],
+            match["file"],
+            int(match["line"]) if match["line"] else None,
+            int(match["column"]) if match["column"] else None,
+            match["option"],
+        )
+        # Notes follow the diagnostic they belong to, as in the JSON
+        if diagnostic.kind == "note" and diagnostics:
+            diagnostics[-1].children.append(diagnostic)
+        else:
+            diagnostics.append(diagnostic)
+    elif not TEXT_CONTEXT.match(text):
+        diagnostics.append(Diagnostic("error", text.strip()))
+
+
+def _sarif_location(item):
+    location = {}
+    if item.get("locations"):
+        location = item["locations"][0].get("physicalLocation", {})
+    elif "physicalLocation" in item:
+        location = item["physicalLocation"]
+    region = location.get("region", {})
+    return (
+        location.get("artifactLocation", {}).get("uri"),
+        region.get("startLine"),
+        region.get("startColumn"),
+    )
+
+
+def _from_sarif(result):
+    rule = result.get("ruleId", "")
+    diagnostic = Diagnostic(
+        SARIF_KINDS.get(result.get("level"), "error"),
+        result.get("message", {}).get("text", ""),
+        *_sarif_location(result),
+        option=rule if rule.startswith("-W") else None,
+    )
+    diagnostic.children = [
+        Diagnostic(
+            "note",
+            related.get("message", {}).get("text", ""),
+            *_sarif_location(related),
+        )
+        for related in result.get("relatedLocations", [])
+    ]
+    return diagnostic
+
+
+def _from_json(item):
+    caret = {}
+    if item.get("locations"):
+        caret = item["locations"][0].get("caret", {})
+    diagnostic = Diagnostic(
+        item.get("kind", "error"),
+        item.get("message", ""),
+        caret.get("file"),
+        caret.get("line"),
+        caret.get("display-column", caret.get("column")),
+        item.get("option"),
+    )
+    diagnostic.children = [_from_json(child) for child in item.get("children", [])]
+    return diagnostic
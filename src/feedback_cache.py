@@ -0,0 +1,163 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# SQLite file shared by every worker process; survives restarts. A relative
+# path is taken from the app's root_path (this directory), not the cwd.
+FEEDBACK_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.environ.get("FEEDBACK_CACHE_PATH", "feedback_cache.sqlite3"),
+)
+# Seconds a stored feedback stays valid
+FEEDBACK_CACHE_TTL = int(os.environ.get("FEEDBACK_CACHE_TTL", str(7 * 24 * 3600)))
+# Feedback kept in memory in front of the SQLite store
+FEEDBACK_CACHE_MEMORY_ENTRIES = int(
+    os.environ.get("FEEDBACK_CACHE_MEMORY_ENTRIES", "1024")
+)
+# Expired rows are purged from the store once every this many writes
+PURGE_EVERY = 100
+
+_memory = OrderedDict()  # key -> (stored_at, feedback, latency)
+_stats = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "saved_seconds": 0.0,
+    "errors": 0,
+}
+_writes = 0
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def feedback_key(kind, model, rendered_prompt):
+    """
+    Hash what determines an LLM answer.
+
+    Args:
+        kind (str): Prompt kind, e.g. "code" or "compilation"
+        model (str): Model name and sampling settings
+        rendered_prompt (str): Prompt with every input filled in
+
+    Returns:
+        str: Hex SHA-256 digest identifying the feedback
+    """
+    digest = hashlib.sha256()
+    for part in (kind, model, rendered_prompt):
+        digest.update(part.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def get_feedback(key):
+    """
+    Look up feedback in memory first, then in the SQLite store.
+
+    Args:
+        key (str): Key from feedback_key()
+
+    Returns:
+        str: The cached feedback, or None
+    """
+    now = time.time()
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None and now - entry[0] <= FEEDBACK_CACHE_TTL:
+            _memory.move_to_end(key)
+            _stats["memory_hits"] += 1
+            _stats["saved_seconds"] += entry[2]
+            return entry[1]
+        _memory.pop(key, None)
+
+    try:
+        row = (
+            _connection()
+            .execute(
+                "SELECT stored_at, feedback, latency FROM feedback WHERE key = ?",
+                (key,),
+            )
+            .fetchone()
+        )
+    except sqlite3.Error as e:
+        print("Feedback cache read failed:", str(e))
+        row = None
+        with _lock:
+            _stats["errors"] += 1
+
+    with _lock:
+        if row is None or now - row[0] > FEEDBACK_CACHE_TTL:
+            _stats["misses"] += 1
+            return None
+        _stats["disk_hits"] += 1
+        _stats["saved_seconds"] += row[2]
+        _remember(key, row)
+    return row[1]
+
+
+def put_feedback(key, kind, feedback, latency):
+    """
+    Store feedback in both tiers.
+
+    Args:
+        key (str): Key from feedback_key()
+        kind (str): Prompt kind, kept for inspecting the store
+        feedback (str): Formatted feedback text
+        latency (float): Seconds the LLM call took, credited on later hits
+    """
+    global _writes
+    entry = (time.time(), feedback, latency)
+    with _lock:
+        _remember(key, entry)
+        _writes += 1
+        purge = _writes % PURGE_EVERY == 0
+    try:
+        connection = _connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO feedback VALUES (?, ?, ?, ?, ?)",
+                (key, kind, *entry),
+            )
+            if purge:
+                connection.execute(
+                    "DELETE FROM feedback WHERE stored_at < ?",
+                    (time.time() - FEEDBACK_CACHE_TTL,),
+                )
+    except sqlite3.Error as e:
+        print("Feedback cache write failed:", str(e))
+        with _lock:
+            _stats["errors"] += 1
+
+
+def get_cache_stats():
+    """Return hit/miss counters and the time saved by the feedback cache."""
+    with _lock:
+        stats = dict(_stats)
+        stats["memory_entries"] = len(_memory)
+    hits = stats["memory_hits"] + stats["disk_hits"]
+    lookups = hits + stats["misses"]
+    stats["hit_rate"] = hits / lookups if lookups else 0.0
+    stats["ttl"] = FEEDBACK_CACHE_TTL
+    return stats
+
+
+def _remember(key, entry):
+    _memory[key] = entry
+    _memory.move_to_end(key)
+    while len(_memory) > FEEDBACK_CACHE_MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def _connection():
+    # SQLite connections must stay on the thread that opened them
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        connection = sqlite3.connect(FEEDBACK_CACHE_PATH, timeout=5)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS feedback ("
+            "key TEXT PRIMARY KEY, kind TEXT, stored_at REAL, "
+            "feedback TEXT, latency REAL)"
+        )
+        _local.connection = connection
+    return connection
@@ -0,0 +1,146 @@
+import json
+import queue
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from llm import (
+    get_batch_test_case_feedback,
+    get_code_feedback,
+    get_compilation_feedback,
+    get_runtime_feedback,
+)
+
+# A run_code page must open its feedback stream within this time
+SESSION_RETENTION = timedelta(minutes=10)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class FeedbackSession:
+    """The LLM feedback a rendered run_code page is still waiting for."""
+
+    def __init__(self, student_id, source, question_id=None):
+        self.id = uuid.uuid4().hex
+        self.student_id = student_id
+        self.source = source  # the code as run, the upload itself is not kept
+        self.question_id = question_id  # shares error hints across students
+        self.error_type = None  # compilation or runtime, when hints are due
+        self.errors = None
+        self.test_input = None
+        self.mismatches = []  # (row, test_input, actual_output, expected_output)
+        self.created_at = datetime.now()
+
+
+def start_session(student_id, source, question_id=None):
+    """
+    Register the feedback for a run_code page rendered without it.
+
+    Args:
+        student_id (int): Id of the student who ran the code
+        source (str): The C code that was run
+        question_id (int, optional): Question the code answers
+
+    Returns:
+        FeedbackSession: Fill in the errors or mismatches to get hints on
+    """
+    session = FeedbackSession(student_id, source, question_id)
+    with _sessions_lock:
+        cutoff = datetime.now() - SESSION_RETENTION
+        for session_id in [
+            session_id
+            for session_id, other in _sessions.items()
+            if other.created_at < cutoff
+        ]:
+            del _sessions[session_id]
+        _sessions[session.id] = session
+    return session
+
+
+def take_session(session_id, student_id):
+    """Return a student's pending session and forget it, or None."""
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is None or session.student_id != student_id:
+            return None
+        return _sessions.pop(session_id)
+
+
+def stream_feedback(session):
+    """
+    Generate the Server-Sent Events carrying a session's feedback.
+
+    The code review streams first as "review" events, then compilation or
+    runtime hints as "hint" events. Each part ends with a "*_done" event
+    holding the formatted text. Mismatch hints come in one "hints" event,
+    since their batched answer is only usable once complete.
+
+    Args:
+        session (FeedbackSession): Session from take_session
+
+    Yields:
+        str: One SSE message at a time, ending with a "done" event
+    """
+    events = queue.Queue()
+    worker = threading.Thread(target=_produce, args=(session, events.put), daemon=True)
+    worker.start()
+    while True:
+        event = events.get()
+        if event is None:
+            break
+        name, data = event
+        yield f"event: {name}\ndata: {json.dumps(data)}\n\n"
+    yield "event: done\ndata: {}\n\n"
+
+
+def _produce(session, emit):
+    try:
+        code_analysis = get_code_feedback(
+            None,
+            on_token=lambda piece: emit(("review", {"delta": piece})),
+            source=session.source,
+        )
+        emit(("review_done", {"text": code_analysis["feedback"]}))
+        context = code_analysis["context"]
+
+        if session.error_type is not None:
+            if session.error_type == "compilation":
+                analysis = get_compilation_feedback(
+                    context,
+                    session.errors,
+                    on_token=lambda piece: emit(("hint", {"delta": piece})),
+                    question_id=session.question_id,
+                )
+            else:
+                analysis = get_runtime_feedback(
+                    context,
+                    session.errors,
+                    session.test_input,
+                    on_token=lambda piece: emit(("hint", {"delta": piece})),
+                    question_id=session.question_id,
+                )
+            emit(("hint_done", {"text": analysis["feedback"]}))
+
+        if session.mismatches:
+            analysis = get_batch_test_case_feedback(
+                context, [mismatch[1:] for mismatch in session.mismatches]
+            )
+            emit(
+                (
+                    "hints",
+                    {
+                        "hints": {
+                            str(mismatch[0]): feedback
+                            for mismatch, feedback in zip(
+                                session.mismatches, analysis["feedback"]
+                            )
+                        }
+                    },
+                )
+            )
+    except Exception as e:  # noqa: BLE001 - the page must still get "done"
+        print("Feedback stream", session.id, "failed:", str(e))
+        emit(("failed", {"message": "Unable to load feedback."}))
+    finally:
+        emit(None)
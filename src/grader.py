@@ -0,0 +1,441 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import date, datetime, timedelta
+
+from app import app, db
+from comparator import expectation_for
+from compile_cache import compile_source
+from diagnostics import local_hints
+from llm import (
+    CodeContext,
+    get_batch_test_case_feedback,
+    get_code_feedback,
+    get_compilation_feedback,
+    get_runtime_feedback,
+)
+from models import Question, Submission, SubmissionTelemetry, Testcase
+from result_cache import run_testcases_cached
+from runner import (
+    ERROR_TYPES,
+    OK,
+    RE,
+    VERDICT_FEEDBACK,
+    prepare_input,
+)
+
+# Number of grading jobs processed at the same time. Each job mostly waits
+# on gcc, its test runs and the LLM, so threads scale well here. Jobs live in
+# this process's memory, so the app must run as a single gunicorn worker
+# (see Procfile) for status polls to find them.
+GRADING_WORKERS = int(os.environ.get("GRADING_WORKERS", "4"))
+# Finished jobs are kept around this long so the status page can show them
+JOB_RETENTION = timedelta(hours=1)
+# LLM code reviews running alongside compilation and test execution
+CODE_FEEDBACK_WORKERS = int(os.environ.get("CODE_FEEDBACK_WORKERS", "4"))
+# Seconds graded results wait for a slow code review before being stored
+# without it; the review is then attached to the Submissions once it arrives
+CODE_FEEDBACK_WAIT = float(os.environ.get("CODE_FEEDBACK_WAIT", "5"))
+CODE_FEEDBACK_PENDING = "Code review in progress, it will appear here shortly."
+CODE_FEEDBACK_FAILED = "Unable to analyze code quality."
+
+_executor = ThreadPoolExecutor(max_workers=GRADING_WORKERS, thread_name_prefix="grader")
+_feedback_executor = ThreadPoolExecutor(
+    max_workers=CODE_FEEDBACK_WORKERS, thread_name_prefix="code-feedback"
+)
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class GradingJob:
+    """Progress of a single uploaded submission being graded in the background."""
+
+    def __init__(self, student_id, assignment_id, question_id, filepath):
+        self.id = uuid.uuid4().hex
+        self.student_id = student_id
+        self.assignment_id = assignment_id
+        self.question_id = question_id
+        self.filepath = filepath
+        self.status = "queued"  # queued -> running -> done | failed
+        self.stage = None  # analysis, compile, testcases
+        # compilation, runtime, timeout, memory, output or internal
+        self.error_type = None
+        self.error_message = None
+        self.error_feedback = None
+        self.marks = None
+        self.testcases = []
+        self.llm_usage = None  # Token counts of the submission's CodeContext
+        self.created_at = datetime.now()
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def to_dict(self):
+        with _jobs_lock:
+            return {
+                "id": self.id,
+                "assignment_id": self.assignment_id,
+                "question_id": self.question_id,
+                "status": self.status,
+                "stage": self.stage,
+                "error_type": self.error_type,
+                "error_message": self.error_message,
+                "error_feedback": self.error_feedback,
+                "marks": self.marks,
+                "testcases": [dict(tc) for tc in self.testcases],
+                "llm_usage": dict(self.llm_usage) if self.llm_usage else None,
+                "created_at": self.created_at.isoformat(),
+                "finished_at": (
+                    self.finished_at.isoformat() if self.finished_at else None
+                ),
+            }
+
+
+def submit_grading_job(student_id, assignment_id, question_id, filepath):
+    """
+    Queue an uploaded file for grading and return immediately.
+
+    Args:
+        student_id (int): Id of the submitting student
+        assignment_id (int): Assignment the question belongs to
+        question_id (int): Question being answered
+        filepath (str): Path of the saved .c file, see save_upload; nothing
+            else may write to it while the job runs
+
+    Returns:
+        GradingJob: The queued job
+    """
+    job = GradingJob(student_id, assignment_id, question_id, filepath)
+    with _jobs_lock:
+        _prune_jobs()
+        _jobs[job.id] = job
+    _executor.submit(_run_job, job)
+    return job
+
+
+def get_job(job_id):
+    """Return the grading job with the given id, or None if unknown."""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def get_latest_jobs(student_id, assignment_id):
+    """
+    Return the newest job of a student for every question of an assignment,
+    running or finished, keyed by question id. Finished jobs are kept for
+    JOB_RETENTION, so a failed one can still explain why nothing was stored.
+    """
+    with _jobs_lock:
+        jobs = [
+            job
+            for job in _jobs.values()
+            if job.student_id == student_id and job.assignment_id == assignment_id
+        ]
+    latest = {}
+    for job in sorted(jobs, key=lambda job: job.created_at):
+        latest[job.question_id] = job
+    return latest
+
+
+def start_code_feedback(filepath):
+    """
+    Start the LLM code review of a file in the background, so that it
+    overlaps with compiling and running the program. The file is read
+    right away; the review never goes back to it.
+
+    Args:
+        filepath (str): Path of the .c file
+
+    Returns:
+        Future: Resolves to the dict returned by get_code_feedback
+    """
+    with open(filepath, "r") as file:
+        source = file.read()
+    review = _feedback_executor.submit(get_code_feedback, filepath, source=source)
+    review.source = source  # for the hints, should the review not arrive
+    return review
+
+
+def code_feedback_text(review, timeout=None):
+    """
+    Wait for a code review started by start_code_feedback.
+
+    Args:
+        review (Future): The running review
+        timeout (float, optional): Seconds to wait; forever when None
+
+    Returns:
+        str: The feedback, or None if it did not arrive in time
+    """
+    try:
+        code_analysis = review.result(timeout=timeout)
+    except TimeoutError:
+        return None
+    except Exception as e:  # noqa: BLE001 - whatever the review raised
+        print("Code review failed:", str(e))
+        return CODE_FEEDBACK_FAILED
+    if code_analysis["status"] == "success":
+        return code_analysis["feedback"]
+    return CODE_FEEDBACK_FAILED
+
+
+def review_context(review, timeout=CODE_FEEDBACK_WAIT):
+    """
+    Wait for a code review and return its CodeContext for the error hints.
+    If the review failed, or is still running after timeout seconds, the
+    hints are asked for with a fresh context holding the code alone, so a
+    stuck review never holds up grading.
+    """
+    try:
+        return review.result(timeout=timeout)["context"]
+    except Exception:  # noqa: BLE001 - reported by code_feedback_text
+        return CodeContext(
+            code_content=review.source, code_analysis=CODE_FEEDBACK_FAILED
+        )
+
+
+def _attach_code_feedback(submission_ids, review):
+    # Runs once a review that missed CODE_FEEDBACK_WAIT finally completes
+    code_feedback = code_feedback_text(review)
+    with app.app_context():
+        try:
+            for submission in Submission.query.filter(
+                Submission.id.in_(submission_ids)
+            ):
+                submission.feedback = submission.feedback.replace(
+                    CODE_FEEDBACK_PENDING, code_feedback, 1
+                )
+            db.session.commit()
+        except Exception as e:  # noqa: BLE001 - runs in a worker thread
+            db.session.rollback()
+            print("Attaching code feedback failed:", str(e))
+        finally:
+            db.session.remove()
+
+
+def _track_llm_usage(job, review):
+    # The context keeps counting as the error and test case hints come in
+    if review.exception() is None:
+        with _jobs_lock:
+            job.llm_usage = review.result()["context"].usage
+
+
+def _prune_jobs():
+    cutoff = datetime.now() - JOB_RETENTION
+    for job_id in [
+        job_id
+        for job_id, job in _jobs.items()
+        if job.finished_at and job.finished_at < cutoff
+    ]:
+        del _jobs[job_id]
+
+
+def _finish(job, status, error_type=None, error_message=None, error_feedback=None):
+    with _jobs_lock:
+        job.status = status
+        job.error_type = error_type
+        job.error_message = error_message
+        job.error_feedback = error_feedback
+        job.finished_at = datetime.now()
+
+
+def _set_testcase(job, idx, **fields):
+    _set_testcases(job, [idx], **fields)
+
+
+def _set_testcases(job, indices, **fields):
+    with _jobs_lock:
+        for idx in indices:
+            job.testcases[idx].update(fields)
+
+
+def _run_job(job):
+    with app.app_context():
+        try:
+            grade_submission(job)
+        except Exception as e:  # noqa: BLE001 - the job must still finish
+            db.session.rollback()
+            print("Grading job", job.id, "failed:", str(e))
+            _finish(job, "failed", "internal", f"Grading failed: {e!s}")
+        finally:
+            db.session.remove()
+
+
+def grade_submission(job):
+    """
+    Compile the job's file, run it against every test case of the question
+    and store one Submission row per test case. Progress is recorded on the job.
+
+    Args:
+        job (GradingJob): The job to grade
+    """
+    filepath = job.filepath
+    with _jobs_lock:
+        job.status = "running"
+        job.stage = "compile"
+
+    # The AI code review runs while the program is compiled and tested
+    review = start_code_feedback(filepath)
+    review.add_done_callback(lambda review: _track_llm_usage(job, review))
+    compiled = compile_source(filepath)
+    if not compiled.ok:
+        # Common errors are explained by the hint rules, the rest by the LLM
+        compilation_feedback = local_hints(compiled.diagnostics)
+        if compilation_feedback is None:
+            # Get AI feedback on compilation errors, building on the review
+            error_analysis = get_compilation_feedback(
+                review_context(review), compiled.errors, question_id=job.question_id
+            )
+            if error_analysis["status"] == "success":
+                compilation_feedback = error_analysis["feedback"]
+            else:
+                compilation_feedback = "Unable to analyze compilation errors."
+        _finish(job, "failed", "compilation", compiled.errors, compilation_feedback)
+        return
+
+    # Now, run the compiled program with test cases
+    test_cases = Testcase.query.filter_by(ques_id=job.question_id).all()
+    question_data = Question.query.filter_by(id=job.question_id).first()
+    with _jobs_lock:
+        job.stage = "testcases"
+        job.testcases = [
+            {"id": tc.id, "status": "pending", "marks": None} for tc in test_cases
+        ]
+
+    inputs = [prepare_input(tc.case) for tc in test_cases]
+    expected_outputs = [expectation_for(tc) for tc in test_cases]
+    _set_testcases(job, range(len(test_cases)), status="running")
+    # Every test case runs concurrently; results are then handled in order so
+    # the first failed run (timeout, runtime error, ...) still ends grading.
+    results = run_testcases_cached(compiled, test_cases, inputs, expected_outputs)
+    compiled.discard()
+    review_deadline = time.monotonic() + CODE_FEEDBACK_WAIT
+    code_feedback = None
+    waiting_for_review = []  # Submission ids stored before the review arrived
+    test_inputs = [
+        stdin_data if stdin_data is not None else tc.case
+        for stdin_data, tc in zip(inputs, test_cases)
+    ]
+
+    # Test cases up to the first failed run get graded; all of their output
+    # mismatches are analyzed together in a single LLM request
+    graded = next(
+        (idx for idx, result in enumerate(results) if result.verdict != OK),
+        len(results),
+    )
+    mismatches = [
+        idx
+        for idx in range(graded)
+        if expected_outputs[idx] is not None and not results[idx].output_matches
+    ]
+    mismatch_feedback = {}
+    if mismatches:
+        code_feedback = code_feedback_text(
+            review, max(0.0, review_deadline - time.monotonic())
+        )
+        mismatch_analysis = get_batch_test_case_feedback(
+            review_context(review, max(0.0, review_deadline - time.monotonic())),
+            [
+                (test_inputs[idx], results[idx].output, expected_outputs[idx].text)
+                for idx in mismatches
+            ],
+        )
+        if mismatch_analysis["status"] == "success":
+            mismatch_feedback = dict(zip(mismatches, mismatch_analysis["feedback"]))
+
+    total_marks = 0.0
+    for idx, (test_case_row, result) in enumerate(zip(test_cases, results)):
+        test_case = test_inputs[idx]
+        test_case_feedback = ""
+        output, errors = result.output, result.errors
+        if result.verdict != OK:
+            if result.verdict == RE:
+                # Get AI feedback on runtime errors
+                error_analysis = get_runtime_feedback(
+                    review_context(
+                        review, max(0.0, review_deadline - time.monotonic())
+                    ),
+                    errors,
+                    test_case,
+                    question_id=job.question_id,
+                )
+                if error_analysis["status"] == "success":
+                    error_feedback = error_analysis["feedback"]
+                else:
+                    error_feedback = "Unable to analyze runtime errors."
+            else:
+                error_feedback = VERDICT_FEEDBACK[result.verdict]
+            _set_testcases(job, range(idx + 1, len(test_cases)), status="pending")
+            _set_testcase(job, idx, status="error", verdict=result.verdict)
+            _finish(
+                job,
+                "failed",
+                ERROR_TYPES[result.verdict],
+                result.message,
+                error_feedback,
+            )
+            return
+
+        expectation = expected_outputs[idx]
+        # stdout was compared against the expected output while it streamed
+        passed = expectation is None or result.output_matches
+
+        if passed:
+            marks = float(question_data.marks) / len(test_cases)
+        else:
+            print(
+                f"Code Output - Desired Output Mismatch\nCode output:\t{output}\nDesired output:\t{expectation.text}"
+            )
+            test_case_feedback += mismatch_feedback.get(
+                idx, "Unable to analyze test case mismatch."
+            )
+            marks = 0.0
+
+        if code_feedback is None:
+            code_feedback = code_feedback_text(
+                review, max(0.0, review_deadline - time.monotonic())
+            )
+        final_feedback = (
+            "Code Feedback:\n"
+            + (code_feedback or CODE_FEEDBACK_PENDING)
+            + "\n\nTest Case Feedback:\n"
+            + test_case_feedback
+        )
+        submission = Submission(
+            st_id=job.student_id,
+            date=date.today(),
+            ass_id=job.assignment_id,
+            ques_id=job.question_id,
+            marks=marks,
+            test_case_id=test_case_row.id,
+            output=output,
+            feedback=final_feedback,
+            source_file=os.path.basename(filepath),
+        )
+        # A cached result keeps its output summary; its resource usage was
+        # measured on an earlier run, which has its own telemetry row
+        submission.telemetry = SubmissionTelemetry(**result.telemetry())
+        db.session.add(submission)
+        db.session.commit()
+        if code_feedback is None:
+            waiting_for_review.append(submission.id)
+        total_marks += marks
+        _set_testcase(
+            job,
+            idx,
+            status="passed" if passed else "failed",
+            marks=marks,
+            wall_time=result.wall_time,
+        )
+
+    if waiting_for_review:
+        review.add_done_callback(
+            lambda review: _attach_code_feedback(waiting_for_review, review)
+        )
+    with _jobs_lock:
+        job.marks = total_marks
+    _finish(job, "done")
@@ -1,10 +1,20 @@
+from flask_migrate import stamp, upgrade
+from sqlalchemy import inspect
+
 from app import app, db
 
+# First revision in migrations/versions: the schema db.create_all() used to build
+BASELINE_REVISION = "19ec23388b18"
+
 
 def init_db():
     with app.app_context():
-        # Create all tables
-        db.create_all()
+        tables = inspect(db.engine).get_table_names()
+        if "student" in tables and "alembic_version" not in tables:
+            # Created by db.create_all() before there were migrations
+            stamp(revision=BASELINE_REVISION)
+        # Create or update all tables
+        upgrade()
         print("Database tables created successfully!")
 
 
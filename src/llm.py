@@ -1,11 +1,98 @@
 from langchain_anthropic import ChatAnthropic
+import json
+import os
 import textwrap
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from langchain_core.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
 
+from circuit_breaker import CircuitBreaker
+
+from compaction import (
+    PROMPT_CODE_TOKENS,
+    PROMPT_ERROR_TOKENS,
+    PROMPT_INPUT_TOKENS,
+    PROMPT_OUTPUT_TOKENS,
+    get_compaction_stats,
+    output_diff,
+    truncate,
+)
+from feedback_cache import feedback_key, get_feedback, put_feedback
+from shared_feedback import get_shared, put_shared
+
 # Load environment variables
 load_dotenv()
 
+# Opening of every prompt about a submission. Together with the code and, in
+# the follow-up prompts, its analysis it forms a prefix that is marked for the
+# provider's prompt cache, so only the error or test case part that follows is
+# processed anew on each call about the same submission.
+MENTOR_INSTRUCTIONS = """You are a programming mentor helping a student with their C code.
+Never provide the complete solution, only guidance that helps the student learn.
+Provide only the feedback and nothing else."""
+CODE_BLOCK = "Code:\n{code}"
+ANALYSIS_BLOCK = "Previous code analysis:\n{code_analysis}"
+
+# Models of the two tiers: the large one writes the open-ended code review,
+# the fast one the short hints
+LLM_LARGE_MODEL = os.environ.get("LLM_LARGE_MODEL", "claude-sonnet-4-20250514")
+LLM_FAST_MODEL = os.environ.get("LLM_FAST_MODEL", "claude-haiku-4-5-20251001")
+TIER_MODELS = {"large": LLM_LARGE_MODEL, "fast": LLM_FAST_MODEL}
+# Tier, temperature and max_tokens of each prompt kind. The tier of a kind
+# can be changed with LLM_TIER_<KIND>, e.g. LLM_TIER_MISMATCHES=large.
+PROMPT_SETTINGS = {
+    "code": ("large", 0.5, 1024),
+    "compilation": ("fast", 0.3, 512),
+    "runtime": ("fast", 0.3, 512),
+    "mismatches": ("fast", 0.3, 2048),
+}
+PROMPT_SETTINGS = {
+    kind: (os.environ.get(f"LLM_TIER_{kind.upper()}", tier), temperature, max_tokens)
+    for kind, (tier, temperature, max_tokens) in PROMPT_SETTINGS.items()
+}
+# Seconds after which a large-tier request is also sent to the fast tier, the
+# first answer winning; 0 turns hedging off. Streamed requests are not hedged.
+LLM_HEDGE_AFTER = float(os.environ.get("LLM_HEDGE_AFTER", "0"))
+
+# Model calls in flight at once across all threads
+LLM_MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", "8"))
+# Seconds a call waits for a free slot before falling back
+LLM_QUEUE_WAIT = float(os.environ.get("LLM_QUEUE_WAIT", "10"))
+# Seconds allowed for one request to the model, and retries after a failure
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "1"))
+# Consecutive failed calls that stop all calls for LLM_BREAKER_COOLDOWN seconds
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+
+LLM_UNAVAILABLE = (
+    "AI feedback is temporarily unavailable. Please try again in a few minutes."
+)
+RUNTIME_FALLBACK = (
+    "Your program stopped with a runtime error. Check array indices against "
+    "the array sizes, pointers that may be NULL or uninitialized, divisions "
+    "by zero, and that scanf is given the addresses (&) of your variables."
+)
+
+# Token counts of every model call, by prompt kind
+_usage = {}
+_usage_lock = threading.Lock()
+
+_in_flight = threading.BoundedSemaphore(LLM_MAX_IN_FLIGHT)
+_breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+_limiter_stats = {"in_flight": 0, "peak_in_flight": 0, "queue_timeouts": 0}
+_tier_usage = {}  # tier -> counters as in empty_usage() plus seconds
+_hedge_stats = {"hedged": 0, "fast_wins": 0}
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=LLM_MAX_IN_FLIGHT, thread_name_prefix="llm-hedge"
+)
+
+
+class LLMUnavailable(Exception):
+    """The model was not called: too busy, or failing too often lately."""
+
 
 def format_response(text):
     """
@@ -45,77 +132,440 @@ def format_response(text):
     return f"{formatted_text}"
 
 
+def chunk_text(content):
+    """Return the text of a streamed message chunk, whatever its shape."""
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+def parse_hints(text, count):
+    """
+    Pull the per-test-case hints out of a batched mismatch analysis.
+
+    Args:
+        text (str): Model response holding a JSON array of
+            {"testcase": number, "hint": text} objects
+        count (int): Number of test cases that were analyzed
+
+    Returns:
+        list: Formatted hint for each test case, in order
+
+    Raises:
+        ValueError: If the response holds no JSON array
+    """
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end < start:
+        raise ValueError("No JSON array in the mismatch analysis")
+    # Starts with "[" and ends with "]", so it is a list or not JSON at all
+    items = json.loads(text[start : end + 1])
+    hints = ["Unable to analyze test case mismatch."] * count
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        try:
+            number = int(item.get("testcase", position + 1))
+        except (TypeError, ValueError):
+            number = position + 1
+        if 1 <= number <= count and item.get("hint"):
+            hints[number - 1] = format_response(str(item["hint"]))
+    return hints
+
+
+def submission_prompt(task, with_analysis=True):
+    """
+    Build a prompt whose system message is the cacheable submission prefix.
+
+    Args:
+        task (str): Human message template with the instructions and inputs
+            specific to this prompt
+        with_analysis (bool): Whether the prefix includes the code analysis
+
+    Returns:
+        ChatPromptTemplate: The prompt
+    """
+    blocks = [{"type": "text", "text": MENTOR_INSTRUCTIONS}, _cached_block(CODE_BLOCK)]
+    if with_analysis:
+        blocks.append(_cached_block(ANALYSIS_BLOCK))
+    return ChatPromptTemplate.from_messages([("system", blocks), ("human", task)])
+
+
+def prompt_code(context):
+    """Return the code of a submission as sent in every prompt about it."""
+    return truncate(context.code_content, PROMPT_CODE_TOKENS, "code")
+
+
+def mismatch_details(test_input, actual_output, expected_output):
+    """
+    Describe one failing test case within the prompt's token budget.
+
+    Args:
+        test_input (str): Input provided to the program
+        actual_output (str): Output produced by the program
+        expected_output (str): Expected output for the test case
+
+    Returns:
+        str: The input, both outputs cut to their budget, and a local diff
+        pointing at the first difference
+    """
+    return (
+        f"Input: {truncate(test_input, PROMPT_INPUT_TOKENS, 'input')}\n"
+        f"Actual output: {truncate(actual_output, PROMPT_OUTPUT_TOKENS, 'output')}\n"
+        f"Expected output: {truncate(expected_output, PROMPT_OUTPUT_TOKENS, 'output')}\n"
+        f"Difference:\n{output_diff(actual_output, expected_output)}"
+    )
+
+
+def mismatch_fallback(actual_output, expected_output):
+    """Point at the first output difference when the model cannot be asked."""
+    difference = output_diff(actual_output, expected_output).split("\n", 1)[0]
+    return f"{difference}\n{LLM_UNAVAILABLE}"
+
+
+def _cached_block(text):
+    # Everything up to and including this block may be served from the cache
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+def empty_usage():
+    """Return zeroed token counters."""
+    return {
+        "calls": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_read_tokens": 0,
+        "cache_creation_tokens": 0,
+    }
+
+
+def token_usage(message):
+    """
+    Read the token counts of a model response.
+
+    Args:
+        message (AIMessage): Response, or the sum of its streamed chunks
+
+    Returns:
+        dict: Counters as in empty_usage() for this one call; input_tokens
+        includes the tokens read from and written to the prompt cache
+    """
+    usage = empty_usage()
+    usage["calls"] = 1
+    metadata = message.usage_metadata or {}
+    details = metadata.get("input_token_details") or {}
+    usage["input_tokens"] = metadata.get("input_tokens") or 0
+    usage["output_tokens"] = metadata.get("output_tokens") or 0
+    usage["cache_read_tokens"] = details.get("cache_read") or 0
+    usage["cache_creation_tokens"] = details.get("cache_creation") or 0
+    return usage
+
+
+def get_usage_stats():
+    """
+    Return the token counts of all model calls, by prompt kind, by tier and
+    in total, the latency of each tier, and the estimated tokens each prompt
+    part took before and after compaction.
+    """
+    with _usage_lock:
+        stats = {kind: dict(usage) for kind, usage in _usage.items()}
+    total = empty_usage()
+    for usage in stats.values():
+        _add_usage(total, usage)
+    stats["total"] = total
+    for usage in stats.values():
+        usage["cache_read_rate"] = (
+            usage["cache_read_tokens"] / usage["input_tokens"]
+            if usage["input_tokens"]
+            else 0.0
+        )
+    stats["compaction"] = get_compaction_stats()
+    stats["breaker"] = _breaker.to_dict()
+    with _usage_lock:
+        stats["tiers"] = {tier: dict(usage) for tier, usage in _tier_usage.items()}
+        stats["hedging"] = dict(_hedge_stats, after=LLM_HEDGE_AFTER)
+        stats["limiter"] = dict(_limiter_stats, max_in_flight=LLM_MAX_IN_FLIGHT)
+    for tier, usage in stats["tiers"].items():
+        usage["model"] = TIER_MODELS[tier]
+        usage["avg_seconds"] = usage["seconds"] / usage["calls"]
+    return stats
+
+
+def _record_usage(kind, tier, message, started, context=None):
+    # Counts an answered call towards its prompt kind, tier and submission
+    if message is None:
+        return
+    usage = token_usage(message)
+    with _usage_lock:
+        _add_usage(_usage.setdefault(kind, empty_usage()), usage)
+        tier_usage = _tier_usage.setdefault(tier, dict(empty_usage(), seconds=0.0))
+        _add_usage(tier_usage, dict(usage, seconds=time.monotonic() - started))
+        if context is not None:
+            _add_usage(context.usage, usage)
+
+
+def _record_call(kind, tier, future, started, context):
+    # A hedged request that loses the race still spent its tokens
+    if future.exception() is None:
+        _record_usage(kind, tier, future.result()[0], started, context)
+
+
+def _model_settings(llm):
+    # The model and sampling settings an answer depends on
+    return f"{llm.model}:{llm.temperature}:{llm.max_tokens}"
+
+
+def _add_usage(totals, usage):
+    for name in totals:
+        totals[name] += usage[name]
+
+
+class CodeContext:
+    """
+    The code of one submission and its analysis. Every prompt about that
+    submission receives it, so nothing about a submission lives on the
+    shared analyzer. It also adds up the tokens spent on the submission.
+    """
+
+    def __init__(self, code_content=None, code_analysis=None):
+        self.code_content = code_content
+        self.code_analysis = code_analysis
+        self.usage = empty_usage()
+
+
 class CodeAnalyzer:
+    """
+    Sends feedback prompts to the model. Holds only the model client, so a
+    single instance is safely shared by every thread.
+    """
+
     def __init__(self):
-        """Initialize the code analyzer with a single model instance."""
-        self.llm = ChatAnthropic(
-            model="claude-sonnet-4-20250514",  # type: ignore
-            temperature=0.5,
-            max_tokens=2048,  # type: ignore
-            timeout=None,
-            max_retries=2,
+        """Initialize one model client per prompt kind, and its fast hedge."""
+        self.llms = {}
+        self.hedges = {}
+        for kind, (tier, temperature, max_tokens) in PROMPT_SETTINGS.items():
+            self.llms[kind] = self._client(TIER_MODELS[tier], temperature, max_tokens)
+            if tier != "fast":
+                self.hedges[kind] = self._client(
+                    LLM_FAST_MODEL, temperature, max_tokens
+                )
+
+    @staticmethod
+    def _client(model, temperature, max_tokens):
+        return ChatAnthropic(
+            model=model,  # type: ignore
+            temperature=temperature,
+            max_tokens=max_tokens,  # type: ignore
+            timeout=LLM_TIMEOUT,
+            max_retries=LLM_MAX_RETRIES,
         )
-        self.code_content = None
-        self.code_analysis = None
 
-    def load_code(self, filepath, debug=False):
+    def _invoke(
+        self,
+        kind,
+        prompt,
+        inputs,
+        debug=False,
+        formatter=format_response,
+        on_token=None,
+        context=None,
+    ):
+        """
+        Run a prompt through the model, reusing the answer to an identical
+        earlier prompt from the feedback cache.
+
+        Args:
+            kind (str): Prompt kind, part of the cache key
+            prompt (ChatPromptTemplate): The prompt to run
+            inputs (dict): Values for the prompt's variables
+            debug (bool): Whether to print debug information
+            formatter (callable): Turns the response text into what is
+                cached and returned; raising keeps the answer out of the cache
+            on_token (callable, optional): Called with each piece of the
+                response as it streams in; a cached answer arrives as one piece
+            context (CodeContext, optional): Submission the tokens are
+                counted towards
+
+        Returns:
+            str: Formatted response text
+
+        Raises:
+            LLMUnavailable: If the model could not be called right now
+        """
+        llm = self.llms[kind]
+        rendered_prompt = prompt.format(**inputs)
+        key = feedback_key(kind, _model_settings(llm), rendered_prompt)
+        feedback = get_feedback(key)
+        if feedback is not None:
+            if debug:
+                print("Feedback cache hit:", kind)
+            if on_token is not None:
+                on_token(feedback)
+            return feedback
+
+        started = time.monotonic()
+        if on_token is None and LLM_HEDGE_AFTER > 0 and kind in self.hedges:
+            message, text, llm = self._call_hedged(kind, prompt, inputs, context)
+            # Stored under the model that answered, so a fast-tier answer is
+            # never served later as the large model's
+            key = feedback_key(kind, _model_settings(llm), rendered_prompt)
+        else:
+            message, text = self._call(prompt | llm, inputs, on_token)
+            _record_usage(kind, PROMPT_SETTINGS[kind][0], message, started, context)
+        if debug:
+            print("Answered in", time.monotonic() - started, "seconds")
+        feedback = formatter(text)
+        put_feedback(key, kind, feedback, time.monotonic() - started)
+        return feedback
+
+    def _call(self, chain, inputs, on_token):
+        # Bounded by the in-flight limit, a deadline and the circuit breaker
+        if not _in_flight.acquire(timeout=LLM_QUEUE_WAIT):
+            with _usage_lock:
+                _limiter_stats["queue_timeouts"] += 1
+            raise LLMUnavailable("Too many feedback requests in progress")
+        with _usage_lock:
+            _limiter_stats["in_flight"] += 1
+            _limiter_stats["peak_in_flight"] = max(
+                _limiter_stats["peak_in_flight"], _limiter_stats["in_flight"]
+            )
+        try:
+            if not _breaker.allow():
+                raise LLMUnavailable("The model keeps failing, not calling it")
+            try:
+                if on_token is None:
+                    message = chain.invoke(inputs)
+                    text = message.content
+                else:
+                    deadline = time.monotonic() + LLM_TIMEOUT
+                    message, pieces = None, []
+                    for chunk in chain.stream(inputs):
+                        if time.monotonic() > deadline:
+                            raise TimeoutError("The model response took too long")
+                        message = chunk if message is None else message + chunk
+                        piece = chunk_text(chunk.content)
+                        if piece:
+                            pieces.append(piece)
+                            on_token(piece)
+                    text = "".join(pieces)
+            except Exception:
+                _breaker.record_failure()
+                raise
+            _breaker.record_success()
+            return message, text
+        finally:
+            with _usage_lock:
+                _limiter_stats["in_flight"] -= 1
+            _in_flight.release()
+
+    def _call_hedged(self, kind, prompt, inputs, context):
+        # Race the fast tier against a large-tier request that is running late.
+        # Returns the message and text of the first answer, and its client.
+        started = time.monotonic()
+        tier = PROMPT_SETTINGS[kind][0]
+        primary = _hedge_executor.submit(
+            self._call, prompt | self.llms[kind], inputs, None
+        )
+        primary.add_done_callback(
+            lambda future: _record_call(kind, tier, future, started, context)
+        )
+        clients = {primary: self.llms[kind]}
+        if not wait([primary], timeout=LLM_HEDGE_AFTER).done:
+            hedge = _hedge_executor.submit(
+                self._call, prompt | self.hedges[kind], inputs, None
+            )
+            hedge.add_done_callback(
+                lambda future: _record_call(kind, "fast", future, started, context)
+            )
+            clients[hedge] = self.hedges[kind]
+            with _usage_lock:
+                _hedge_stats["hedged"] += 1
+            pending = {primary, hedge}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            with _usage_lock:
+                                _hedge_stats["fast_wins"] += 1
+                        return (*future.result(), clients[future])
+        # Neither answered; report the large tier's failure
+        return (*primary.result(), clients[primary])
+
+    def load_code(self, filepath, debug=False, on_token=None, source=None):
         """
         Load and analyze the code file.
 
         Args:
             filepath (str): Path to the C file to analyze
             debug (bool): Whether to print debug information
+            on_token (callable, optional): Receives the response as it streams
+            source (str, optional): The code itself, read instead of filepath
 
         Returns:
-            bool: True if code was loaded and analyzed successfully
+            tuple: (True if code was loaded and analyzed successfully,
+            CodeContext for the prompts that follow)
         """
+        context = CodeContext()
         try:
-            with open(filepath, "r") as file:
-                self.code_content = file.read()
+            if source is None:
+                with open(filepath, "r") as file:
+                    source = file.read()
+            context.code_content = source
             if debug:
                 print("Loaded file:", filepath)
-                print("Code content length:", len(self.code_content))
+                print("Code content length:", len(context.code_content))
 
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        """Please analyze the following C code and provide feedback within 200 words overall on the following points:
+            prompt = submission_prompt(
+                """Please analyze the above C code and provide feedback within 200 words overall on the following points:
                 1. Code structure and organization
                 2. Naming conventions
                 3. Error handling
                 4. Memory management
-                5. Best practices         
+                5. Best practices
                 Please provide a comprehensive analysis focusing on these aspects.
                 Provide only the feedback and nothing else.""",
-                    ),
-                    ("human", "Code to analyze:\n{code}"),
-                ]
+                with_analysis=False,
             )
 
+            inputs = {"code": prompt_code(context)}
             if debug:
-                print(prompt.invoke({"code": self.code_content}))
-
-            chain = prompt | self.llm
-            response = chain.invoke({"code": self.code_content})
-            self.code_analysis = format_response(response.content)
+                print(prompt.invoke(inputs))
+
+            context.code_analysis = self._invoke(
+                "code",
+                prompt,
+                inputs,
+                debug,
+                on_token=on_token,
+                context=context,
+            )
             if debug:
                 print("Code analysis completed")
-            return True
+            return True, context
 
+        except LLMUnavailable as e:
+            context.code_analysis = LLM_UNAVAILABLE
+            print("Code analysis skipped:", str(e))
+            return False, context
         except Exception as e:
-            self.code_analysis = f"Error analyzing code: {str(e)}"
+            context.code_analysis = f"Error analyzing code: {str(e)}"
             if debug:
                 print("Error in load_code:", str(e))
-            return False
+            return False, context
 
-    def analyze_compilation_error(self, compile_errors, debug=False):
+    def analyze_compilation_error(
+        self, context, compile_errors, debug=False, on_token=None, question_id=None
+    ):
         """
         Analyze compilation errors with context from the code analysis.
 
         Args:
+            context (CodeContext): Code and analysis from load_code
             compile_errors (str): Compilation error output from gcc
             debug (bool): Whether to print debug information
+            on_token (callable, optional): Receives the response as it streams
+            question_id (int, optional): Share the hints with the students of
+                this question who make the same error
 
         Returns:
             str: Hints for fixing the compilation errors
@@ -125,11 +575,17 @@ class CodeAnalyzer:
                 print("Analyzing compilation errors")
                 print("Error length:", len(compile_errors))
 
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        """As a programming mentor, analyze the following C compilation errors in the context of the code 
+            if question_id is not None:
+                feedback = get_shared(question_id, "compilation", compile_errors)
+                if feedback is not None:
+                    if debug:
+                        print("Shared feedback hit")
+                    if on_token is not None:
+                        on_token(feedback)
+                    return feedback
+
+            prompt = submission_prompt(
+                """Analyze the following C compilation errors in the context of the above code
                 and its previous analysis. Provide helpful hints for fixing them. DO NOT provide the complete solution, 
                 only give hints that will help the student learn and understand how to fix the errors themselves.
 
@@ -141,59 +597,63 @@ class CodeAnalyzer:
                 5. Relating the error to the code structure and patterns identified in the analysis
                 Provide the feedback within 100 words.
                 Remember: Provide only hints and guidance, not complete solutions.
-                Provide only the feedback and nothing else.""",
-                    ),
-                    (
-                        "human",
-                        """Previous code analysis:
-                {code_analysis}
-
-                Code:
-                {code}
+                Provide only the feedback and nothing else.
 
                 Compilation errors:
-                {errors}""",
-                    ),
-                ]
+                {errors}"""
             )
 
+            inputs = {
+                "code": prompt_code(context),
+                "code_analysis": context.code_analysis,
+                "errors": truncate(compile_errors, PROMPT_ERROR_TOKENS, "errors"),
+            }
             if debug:
-                print(
-                    prompt.invoke(
-                        {
-                            "code": self.code_content,
-                            "code_analysis": self.code_analysis,
-                            "errors": compile_errors,
-                        }
-                    )
-                )
-
-            chain = prompt | self.llm
-            response = chain.invoke(
-                {
-                    "code": self.code_content,
-                    "code_analysis": self.code_analysis,
-                    "errors": compile_errors,
-                }
+                print(prompt.invoke(inputs))
+
+            feedback = self._invoke(
+                "compilation",
+                prompt,
+                inputs,
+                debug,
+                on_token=on_token,
+                context=context,
             )
+            if question_id is not None:
+                put_shared(question_id, "compilation", compile_errors, feedback)
 
             if debug:
                 print("Compilation error analysis completed")
-            return format_response(response.content)
+            return feedback
 
+        except LLMUnavailable as e:
+            print("Compilation error analysis skipped:", str(e))
+            return LLM_UNAVAILABLE
         except Exception as e:
             if debug:
                 print("Error in analyze_compilation_error:", str(e))
             return f"Error analyzing compilation errors: {str(e)}"
 
-    def analyze_runtime_error(self, runtime_errors, test_input=None, debug=False):
+    def analyze_runtime_error(
+        self,
+        context,
+        runtime_errors,
+        test_input=None,
+        debug=False,
+        on_token=None,
+        question_id=None,
+    ):
         """
         Analyze runtime errors with context from the code analysis.
 
         Args:
+            context (CodeContext): Code and analysis from load_code
             runtime_errors (str): Runtime error output from the program
             test_input (str, optional): Input that caused the runtime error
             debug (bool): Whether to print debug information
+            on_token (callable, optional): Receives the response as it streams
+            question_id (int, optional): Share the hints with the students of
+                this question who fail the same way on the same input
 
         Returns:
             str: Hints for fixing the runtime errors
@@ -204,11 +664,19 @@ class CodeAnalyzer:
                 print("Error length:", len(runtime_errors))
                 print("Test input:", test_input if test_input else "No input provided")
 
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        """As a programming mentor, analyze the following C runtime errors in the context of the code 
+            if question_id is not None:
+                feedback = get_shared(
+                    question_id, "runtime", runtime_errors, test_input
+                )
+                if feedback is not None:
+                    if debug:
+                        print("Shared feedback hit")
+                    if on_token is not None:
+                        on_token(feedback)
+                    return feedback
+
+            prompt = submission_prompt(
+                """Analyze the following C runtime errors in the context of the above code
                 and its previous analysis. Provide helpful hints for fixing them. DO NOT provide the complete solution, 
                 only give hints that will help the student learn and understand how to fix the errors themselves.
 
@@ -225,176 +693,145 @@ class CodeAnalyzer:
                 5. Mentioning relevant C programming concepts to review
                 6. Relating the error to the code structure and patterns identified in the analysis
                 Provide the feedback withing 100 words.
-                Remember: Provide only hints and guidance, not complete solutions.""",
-                    ),
-                    (
-                        "human",
-                        """Previous code analysis:
-                {code_analysis}
-
-                Code:
-                {code}
+                Remember: Provide only hints and guidance, not complete solutions.
 
                 Runtime errors:
                 {errors}
 
                 Test input (if any):
-                {input}""",
-                    ),
-                ]
+                {input}"""
             )
 
+            inputs = {
+                "code": prompt_code(context),
+                "code_analysis": context.code_analysis,
+                "errors": truncate(runtime_errors, PROMPT_ERROR_TOKENS, "errors"),
+                "input": (
+                    truncate(test_input, PROMPT_INPUT_TOKENS, "input")
+                    if test_input
+                    else "No input provided"
+                ),
+            }
             if debug:
-                print(
-                    prompt.invoke(
-                        {
-                            "code": self.code_content,
-                            "code_analysis": self.code_analysis,
-                            "errors": runtime_errors,
-                            "input": test_input if test_input else "No input provided",
-                        }
-                    )
-                )
-
-            chain = prompt | self.llm
-            response = chain.invoke(
-                {
-                    "code": self.code_content,
-                    "code_analysis": self.code_analysis,
-                    "errors": runtime_errors,
-                    "input": test_input if test_input else "No input provided",
-                }
+                print(prompt.invoke(inputs))
+
+            feedback = self._invoke(
+                "runtime",
+                prompt,
+                inputs,
+                debug,
+                on_token=on_token,
+                context=context,
             )
+            if question_id is not None:
+                put_shared(question_id, "runtime", runtime_errors, feedback, test_input)
 
             if debug:
                 print("Runtime error analysis completed")
-            return format_response(response.content)
+            return feedback
 
+        except LLMUnavailable as e:
+            print("Runtime error analysis skipped:", str(e))
+            return RUNTIME_FALLBACK
         except Exception as e:
             if debug:
                 print("Error in analyze_runtime_error:", str(e))
             return f"Error analyzing runtime errors: {str(e)}"
 
-    def analyze_test_case_mismatch(
-        self, test_input, actual_output, expected_output, debug=False
-    ):
+    def analyze_test_case_mismatches(self, context, mismatches, debug=False):
         """
-        Analyze test case mismatch with context from the code analysis.
+        Analyze every failing test case of a submission in one request.
 
         Args:
-            test_input (str): Input provided to the program
-            actual_output (str): Output produced by the program
-            expected_output (str): Expected output for the test case
+            context (CodeContext): Code and analysis from load_code
+            mismatches (list): (test_input, actual_output, expected_output)
+                tuples, one per failing test case
             debug (bool): Whether to print debug information
 
         Returns:
-            str: Hints for fixing the output mismatch
+            list: Hints for each mismatch, in the same order
         """
-        try:
-            if debug:
-                print("Analyzing test case mismatch")
-                print("Test input:", test_input)
-                print("Actual output:", actual_output)
-                print("Expected output:", expected_output)
-
-            prompt = ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        """As a programming mentor, analyze the following test case mismatch in the context of the code 
-                and its previous analysis. Provide helpful hints for fixing the output. DO NOT provide the complete solution, 
-                only give hints that will help the student learn and understand how to fix the issue themselves.
+        if debug:
+            print("Analyzing", len(mismatches), "test case mismatches")
 
-                Focus on:
-                1. Highlighting the key differences between actual and expected output
+        prompt = submission_prompt(
+            """Analyze the following failing test cases in the context of the above code
+                and its previous analysis. Provide helpful hints for fixing the output of each one. DO NOT provide the 
+                complete solution, only give hints that will help the student learn and understand how to fix the issue themselves.
+
+                For each test case focus on:
+                1. Highlighting the key differences between actual and expected output, using the Difference computed for you
                 2. Suggesting areas to check in the code based on the previous analysis
                 3. Providing hints about potential logical issues
-                4. Mentioning relevant programming concepts to review
-                5. Relating the output mismatch to the code structure and patterns identified in the analysis
-                Provide the feedback within 100 words.
+                Keep the hints for each test case within 60 words.
                 Remember: Provide only hints and guidance, not complete solutions.
-                Provide only the feedback and nothing else.""",
-                    ),
-                    (
-                        "human",
-                        """Previous code analysis:
-                {code_analysis}
-
-                Code:
-                {code}
-
-                Test case details:
-                Input: {input}
-                Actual output: {actual}
-                Expected output: {expected}""",
-                    ),
-                ]
-            )
+                Respond with only a JSON array holding one object per test case, in order:
+                [{{"testcase": <test case number>, "hint": "<hints>"}}]
 
-            if debug:
-                print(
-                    prompt.invoke(
-                        {
-                            "code": self.code_content,
-                            "code_analysis": self.code_analysis,
-                            "input": test_input,
-                            "actual": actual_output,
-                            "expected": expected_output,
-                        }
-                    )
-                )
-
-            chain = prompt | self.llm
-            response = chain.invoke(
+                Failing test cases:
+                {cases}"""
+        )
+        cases = "\n\n".join(
+            f"Test case {number}:\n{mismatch_details(*mismatch)}"
+            for number, mismatch in enumerate(mismatches, 1)
+        )
+        try:
+            hints = self._invoke(
+                "mismatches",
+                prompt,
                 {
-                    "code": self.code_content,
-                    "code_analysis": self.code_analysis,
-                    "input": test_input,
-                    "actual": actual_output,
-                    "expected": expected_output,
-                }
+                    "code": prompt_code(context),
+                    "code_analysis": context.code_analysis,
+                    "cases": cases,
+                },
+                debug,
+                formatter=lambda text: json.dumps(parse_hints(text, len(mismatches))),
+                context=context,
             )
-
-            if debug:
-                print("Test case mismatch analysis completed")
-            return format_response(response.content)
-
-        except Exception as e:
-            if debug:
-                print("Error in analyze_test_case_mismatch:", str(e))
-            return f"Error analyzing test case mismatch: {str(e)}"
+        except LLMUnavailable as e:
+            print("Test case mismatch analysis skipped:", str(e))
+            return [mismatch_fallback(*mismatch[1:]) for mismatch in mismatches]
+        if debug:
+            print("Test case mismatch analysis completed")
+        return json.loads(hints)
 
 
-# Global analyzer instance
+# Global analyzer instance, shared by all threads
 _analyzer = None
+_analyzer_lock = threading.Lock()
 
 
 def get_analyzer():
     """Get or create the global analyzer instance."""
     global _analyzer
     if _analyzer is None:
-        _analyzer = CodeAnalyzer()
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = CodeAnalyzer()
     return _analyzer
 
 
-def get_code_feedback(filepath, debug=False):
+def get_code_feedback(filepath, debug=False, on_token=None, source=None):
     """
     Wrapper function to get code feedback and handle any errors.
 
     Args:
         filepath (str): Path to the C file to analyze
         debug (bool): Whether to print debug information
+        on_token (callable, optional): Receives the feedback as it streams
+        source (str, optional): The code itself, read instead of filepath
 
     Returns:
-        dict: Dictionary containing feedback and status
+        dict: Dictionary containing feedback and status, and the CodeContext
+        to pass to the other feedback functions for this submission
     """
     # try:
     analyzer = get_analyzer()
     if debug:
         print("Analyzer loaded")
-    if analyzer.load_code(filepath, debug):
-        return {"status": "success", "feedback": analyzer.code_analysis}
-    return {"status": "error", "feedback": analyzer.code_analysis}
+    loaded, context = analyzer.load_code(filepath, debug, on_token, source)
+    status = "success" if loaded else "error"
+    return {"status": status, "feedback": context.code_analysis, "context": context}
     # except Exception as e:
     #     if debug:
     #         print("Error in get_code_feedback:", str(e))
@@ -404,13 +841,19 @@ def get_code_feedback(filepath, debug=False):
     #     }
 
 
-def get_compilation_feedback(compile_errors, debug=False):
+def get_compilation_feedback(
+    context, compile_errors, debug=False, on_token=None, question_id=None
+):
     """
     Wrapper function to get compilation error feedback.
 
     Args:
+        context (CodeContext): Returned by get_code_feedback for this code
         compile_errors (str): Compilation error output from gcc
         debug (bool): Whether to print debug information
+        on_token (callable, optional): Receives the feedback as it streams
+        question_id (int, optional): Reuse the hints other students of this
+            question got for the same normalized errors
 
     Returns:
         dict: Dictionary containing feedback and status
@@ -419,7 +862,9 @@ def get_compilation_feedback(compile_errors, debug=False):
         analyzer = get_analyzer()
         if debug:
             print("Getting compilation feedback")
-        feedback = analyzer.analyze_compilation_error(compile_errors, debug)
+        feedback = analyzer.analyze_compilation_error(
+            context, compile_errors, debug, on_token, question_id
+        )
         return {"status": "success", "feedback": feedback}
     except Exception as e:
         if debug:
@@ -430,14 +875,25 @@ def get_compilation_feedback(compile_errors, debug=False):
         }
 
 
-def get_runtime_feedback(runtime_errors, test_input=None, debug=False):
+def get_runtime_feedback(
+    context,
+    runtime_errors,
+    test_input=None,
+    debug=False,
+    on_token=None,
+    question_id=None,
+):
     """
     Wrapper function to get runtime error feedback.
 
     Args:
+        context (CodeContext): Returned by get_code_feedback for this code
         runtime_errors (str): Runtime error output from the program
         test_input (str, optional): Input that caused the runtime error
         debug (bool): Whether to print debug information
+        on_token (callable, optional): Receives the feedback as it streams
+        question_id (int, optional): Reuse the hints other students of this
+            question got for the same normalized errors on the same input
 
     Returns:
         dict: Dictionary containing feedback and status
@@ -446,7 +902,9 @@ def get_runtime_feedback(runtime_errors, test_input=None, debug=False):
         analyzer = get_analyzer()
         if debug:
             print("Getting runtime feedback")
-        feedback = analyzer.analyze_runtime_error(runtime_errors, test_input, debug)
+        feedback = analyzer.analyze_runtime_error(
+            context, runtime_errors, test_input, debug, on_token, question_id
+        )
         return {"status": "success", "feedback": feedback}
     except Exception as e:
         if debug:
@@ -457,31 +915,31 @@ def get_runtime_feedback(runtime_errors, test_input=None, debug=False):
         }
 
 
-def get_test_case_feedback(test_input, actual_output, expected_output, debug=False):
+def get_batch_test_case_feedback(context, mismatches, debug=False):
     """
-    Wrapper function to get test case mismatch feedback.
+    Wrapper function to get feedback on all failing test cases in one call.
 
     Args:
-        test_input (str): Input provided to the program
-        actual_output (str): Output produced by the program
-        expected_output (str): Expected output for the test case
+        context (CodeContext): Returned by get_code_feedback for this code
+        mismatches (list): (test_input, actual_output, expected_output)
+            tuples, one per failing test case
         debug (bool): Whether to print debug information
 
     Returns:
-        dict: Dictionary containing feedback and status
+        dict: Dictionary containing status and a list of feedback, one per
+        mismatch
     """
     try:
         analyzer = get_analyzer()
         if debug:
-            print("Getting test case feedback")
-        feedback = analyzer.analyze_test_case_mismatch(
-            test_input, actual_output, expected_output, debug
-        )
+            print("Getting batched test case feedback")
+        feedback = analyzer.analyze_test_case_mismatches(context, mismatches, debug)
         return {"status": "success", "feedback": feedback}
     except Exception as e:
         if debug:
-            print("Error in get_test_case_feedback:", str(e))
+            print("Error in get_batch_test_case_feedback:", str(e))
         return {
             "status": "error",
-            "feedback": f"Failed to analyze test case mismatch: {str(e)}",
+            "feedback": [f"Failed to analyze test case mismatch: {str(e)}"]
+            * len(mismatches),
         }
@@ -0,0 +1,56 @@
+"""Index submission lookups and foreign keys
+
+Revision ID: 3274f51554f2
+Revises: 8d1f5c0a7b42
+Create Date: 2026-10-18 14:29:46.040807
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3274f51554f2"
+down_revision = "8d1f5c0a7b42"
+branch_labels = None
+depends_on = None
+
+# (name, table, columns); tests/test_indexes.py checks the queries using them
+INDEXES = [
+    (
+        "ix_submission_st_id_ques_id_test_case_id_id",
+        "submission",
+        ["st_id", "ques_id", "test_case_id", "id"],
+    ),
+    ("ix_submission_st_id_ass_id", "submission", ["st_id", "ass_id"]),
+    ("ix_submission_ass_id", "submission", ["ass_id"]),
+    ("ix_submission_ques_id", "submission", ["ques_id"]),
+    ("ix_submission_test_case_id", "submission", ["test_case_id"]),
+    ("ix_assignment_date1", "assignment", ["date1"]),
+    ("ix_assignment_date2", "assignment", ["date2"]),
+    ("ix_question_ass_id", "question", ["ass_id"]),
+    ("ix_testcase_ques_id", "testcase", ["ques_id"]),
+    ("ix_student_assignment_score_ass_id", "student_assignment_score", ["ass_id"]),
+]
+
+
+def upgrade():
+    # CONCURRENTLY keeps submissions writable while PostgreSQL builds the
+    # indexes; it cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True, if_exists=True
+            )
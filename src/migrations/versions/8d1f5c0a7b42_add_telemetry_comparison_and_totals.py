@@ -0,0 +1,114 @@
+"""Add run telemetry, comparison settings and assignment totals
+
+Revision ID: 8d1f5c0a7b42
+Revises: 19ec23388b18
+Create Date: 2026-10-18 16:02:11.415207
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8d1f5c0a7b42"
+down_revision = "19ec23388b18"
+branch_labels = None
+depends_on = None
+
+
+def testcase_columns():
+    return [
+        sa.Column(
+            "compare_mode", sa.String(length=20), nullable=False, server_default="exact"
+        ),
+        sa.Column("abs_tol", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("rel_tol", sa.Float(), nullable=False, server_default="0"),
+    ]
+
+
+def upgrade():
+    # Databases made by db.create_all() are stamped at the initial schema, but
+    # may already have some of what follows depending on when they were made
+    inspector = sa.inspect(op.get_bind())
+    tables = inspector.get_table_names()
+    existing = {column["name"] for column in inspector.get_columns("testcase")}
+
+    with op.batch_alter_table("testcase", schema=None) as batch_op:
+        for column in testcase_columns():
+            if column.name not in existing:
+                batch_op.add_column(column)
+
+    if "submission_telemetry" not in tables:
+        op.create_table(
+            "submission_telemetry",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("submission_id", sa.Integer(), nullable=False),
+            sa.Column("wall_time", sa.Float(), nullable=True),
+            sa.Column("user_time", sa.Float(), nullable=True),
+            sa.Column("sys_time", sa.Float(), nullable=True),
+            sa.Column("max_rss_kb", sa.Integer(), nullable=True),
+            sa.Column("output_size", sa.Integer(), nullable=True),
+            sa.Column("output_digest", sa.String(length=64), nullable=True),
+            sa.ForeignKeyConstraint(["submission_id"], ["submission.id"]),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("submission_id"),
+        )
+
+    if "student_assignment_score" not in tables:
+        op.create_table(
+            "student_assignment_score",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("st_id", sa.Integer(), nullable=False),
+            sa.Column("ass_id", sa.Integer(), nullable=False),
+            sa.Column("marks", sa.Numeric(precision=7, scale=2), nullable=False),
+            sa.ForeignKeyConstraint(["ass_id"], ["assignment.id"]),
+            sa.ForeignKeyConstraint(["st_id"], ["student.id"]),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("st_id", "ass_id"),
+        )
+    backfill_scores()
+
+
+def backfill_scores():
+    # Same totals as scores.rebuild_scores: the latest attempt at every test
+    # case that still exists, summed per student and assignment
+    submission = sa.table(
+        "submission",
+        sa.column("id"),
+        sa.column("st_id"),
+        sa.column("ass_id"),
+        sa.column("ques_id"),
+        sa.column("test_case_id"),
+        sa.column("marks"),
+    )
+    testcase = sa.table("testcase", sa.column("id"))
+    score = sa.table(
+        "student_assignment_score",
+        sa.column("st_id"),
+        sa.column("ass_id"),
+        sa.column("marks"),
+    )
+    latest = (
+        sa.select(sa.func.max(submission.c.id).label("id"))
+        .group_by(submission.c.st_id, submission.c.ques_id, submission.c.test_case_id)
+        .subquery()
+    )
+    totals = (
+        sa.select(
+            submission.c.st_id, submission.c.ass_id, sa.func.sum(submission.c.marks)
+        )
+        .join(latest, submission.c.id == latest.c.id)
+        .join(testcase, testcase.c.id == submission.c.test_case_id)
+        .where(submission.c.st_id.isnot(None), submission.c.ass_id.isnot(None))
+        .group_by(submission.c.st_id, submission.c.ass_id)
+    )
+    op.execute(score.delete())
+    op.execute(score.insert().from_select(["st_id", "ass_id", "marks"], totals))
+
+
+def downgrade():
+    op.drop_table("student_assignment_score")
+    op.drop_table("submission_telemetry")
+    with op.batch_alter_table("testcase", schema=None) as batch_op:
+        for column in reversed(testcase_columns()):
+            batch_op.drop_column(column.name)
@@ -0,0 +1,28 @@
+"""Store which upload each submission graded
+
+Revision ID: b61e0f3d9a27
+Revises: 3274f51554f2
+Create Date: 2026-10-18 17:12:40.283516
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b61e0f3d9a27"
+down_revision = "3274f51554f2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("submission", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("source_file", sa.String(length=255), nullable=True)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("submission", schema=None) as batch_op:
+        batch_op.drop_column("source_file")
@@ -42,8 +42,9 @@ class Teacher(UserMixin, db.Model):
 class Assignment(db.Model):
     __tablename__ = "assignment"  # Changed to lowercase for PostgreSQL convention
     id = db.Column(db.Integer, primary_key=True)
-    date1 = db.Column(db.Date)
-    date2 = db.Column(db.Date)
+    # Indexed for the dashboard, which lists the assignments released so far
+    date1 = db.Column(db.Date, index=True)
+    date2 = db.Column(db.Date, index=True)
     due_date1 = db.Column(db.Date)
     due_date2 = db.Column(db.Date)
     topic = db.Column(db.String(255), nullable=False)
@@ -61,7 +62,7 @@ class Question(db.Model):
     __tablename__ = "question"  # Changed to lowercase for PostgreSQL convention
     id = db.Column(db.Integer, primary_key=True)
     ass_id = db.Column(
-        db.Integer, db.ForeignKey("assignment.id")
+        db.Integer, db.ForeignKey("assignment.id"), index=True
     )  # Updated foreign key reference
     question = db.Column(db.Text, nullable=False)
     marks = db.Column(db.Numeric(5, 2))  # Changed back to Numeric for PostgreSQL
@@ -78,10 +79,16 @@ class Testcase(db.Model):
     __tablename__ = "testcase"  # Changed to lowercase for PostgreSQL convention
     id = db.Column(db.Integer, primary_key=True)
     ques_id = db.Column(
-        db.Integer, db.ForeignKey("question.id")
+        db.Integer, db.ForeignKey("question.id"), index=True
     )  # Updated foreign key reference
     case = db.Column(db.Text, nullable=False)
     output = db.Column(db.Text, nullable=False)
+    # How program output is compared with `output`, see comparator.py
+    compare_mode = db.Column(
+        db.String(20), nullable=False, default="exact", server_default="exact"
+    )
+    abs_tol = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
+    rel_tol = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
 
     def __repr__(self):
         return f"<Testcase {self.id}>"  # Changed from self.name to self.id
@@ -89,24 +96,84 @@ class Testcase(db.Model):
 
 class Submission(db.Model):
     __tablename__ = "submission"  # Changed to lowercase for PostgreSQL convention
+    __table_args__ = (
+        # Latest attempt at a test case: filter on the first three, newest id first
+        db.Index(
+            "ix_submission_st_id_ques_id_test_case_id_id",
+            "st_id",
+            "ques_id",
+            "test_case_id",
+            "id",
+        ),
+        # A student's submissions for an assignment, as on the assignment page
+        db.Index("ix_submission_st_id_ass_id", "st_id", "ass_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     st_id = db.Column(
         db.Integer, db.ForeignKey("student.id")
-    )  # Updated foreign key reference
+    )  # Updated foreign key reference; indexed through the composites above
     date = db.Column(db.Date)
     ass_id = db.Column(
-        db.Integer, db.ForeignKey("assignment.id")
+        db.Integer, db.ForeignKey("assignment.id"), index=True
     )  # Updated foreign key reference
     ques_id = db.Column(
-        db.Integer, db.ForeignKey("question.id")
+        db.Integer, db.ForeignKey("question.id"), index=True
     )  # Updated foreign key reference
     test_case_id = db.Column(
-        db.Integer, db.ForeignKey("testcase.id")
+        db.Integer, db.ForeignKey("testcase.id"), index=True
     )  # Updated foreign key reference
     output = db.Column(db.String(1000))
     num_test_cases_passed = db.Column(db.Integer)
     marks = db.Column(db.Numeric(5, 2))  # Changed back to Numeric for PostgreSQL
     feedback = db.Column(db.Text, nullable=True)
+    # Name of the graded .c file in the upload folder, what a regrade re-runs
+    source_file = db.Column(db.String(255), nullable=True)
+    telemetry = db.relationship(
+        "SubmissionTelemetry",
+        backref="submission",
+        cascade="all, delete",
+        lazy=True,
+        uselist=False,
+    )
 
     def __repr__(self):
         return f"<Submission {self.id}>"  # Changed from self.name to self.id
+
+
+class SubmissionTelemetry(db.Model):
+    """Resource usage and full-output summary of the run behind a Submission."""
+
+    __tablename__ = "submission_telemetry"
+    id = db.Column(db.Integer, primary_key=True)
+    submission_id = db.Column(
+        db.Integer, db.ForeignKey("submission.id"), unique=True, nullable=False
+    )
+    wall_time = db.Column(db.Float)  # seconds
+    user_time = db.Column(db.Float)  # seconds of user CPU
+    sys_time = db.Column(db.Float)  # seconds of system CPU
+    max_rss_kb = db.Column(db.Integer)  # peak resident set size
+    # Submission.output only holds a preview; these describe the whole stdout
+    output_size = db.Column(db.Integer)  # bytes
+    output_digest = db.Column(db.String(64))  # SHA-256 hex
+
+    def __repr__(self):
+        return f"<SubmissionTelemetry {self.submission_id}>"
+
+
+class StudentAssignmentScore(db.Model):
+    """
+    A student's total for an assignment: the marks of their latest attempt at
+    every test case. Kept up to date as Submissions are written, see scores.py.
+    """
+
+    __tablename__ = "student_assignment_score"
+    __table_args__ = (db.UniqueConstraint("st_id", "ass_id"),)
+    id = db.Column(db.Integer, primary_key=True)
+    st_id = db.Column(db.Integer, db.ForeignKey("student.id"), nullable=False)
+    ass_id = db.Column(
+        db.Integer, db.ForeignKey("assignment.id"), nullable=False, index=True
+    )
+    marks = db.Column(db.Numeric(7, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<StudentAssignmentScore {self.st_id}:{self.ass_id}>"
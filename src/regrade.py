@@ -0,0 +1,368 @@
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+
+import click
+
+from app import app, db
+from comparator import get_expectation
+from compile_cache import compile_source
+from diagnostics import local_hints
+from llm import (
+    get_batch_test_case_feedback,
+    get_code_feedback,
+    get_compilation_feedback,
+    get_runtime_feedback,
+)
+from models import Question, Submission, SubmissionTelemetry, Testcase
+from runner import (
+    ERROR_TYPES,
+    OK,
+    RE,
+    VERDICT_FEEDBACK,
+    prepare_input,
+    run_testcases,
+)
+
+# Processes compiling and running stored sources during a regrade
+REGRADE_WORKERS = int(os.environ.get("REGRADE_WORKERS", str(os.cpu_count() or 1)))
+# Submission rows written per transaction
+REGRADE_BATCH_SIZE = int(os.environ.get("REGRADE_BATCH_SIZE", "200"))
+
+REGRADE_NOTE = "Regraded after the test cases of this question changed."
+MISMATCH_NOTE = "Your output did not match the expected output."
+# Separates the code review from the test case part of Submission.feedback
+TEST_CASE_HEADING = "\n\nTest Case Feedback:\n"
+
+# Regrades started from the web UI run one at a time in the background
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="regrade")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class RegradeJob:
+    """A regrade started by a teacher, with its report once finished."""
+
+    def __init__(self, question_id=None, assignment_id=None, with_feedback=False):
+        self.id = uuid.uuid4().hex
+        self.question_id = question_id
+        self.assignment_id = assignment_id
+        self.with_feedback = with_feedback
+        self.status = "queued"  # queued -> running -> done | failed
+        self.error = None
+        self.report = None
+        self.created_at = datetime.now()
+
+    def to_dict(self):
+        with _jobs_lock:
+            return {
+                "id": self.id,
+                "question_id": self.question_id,
+                "assignment_id": self.assignment_id,
+                "with_feedback": self.with_feedback,
+                "status": self.status,
+                "error": self.error,
+                "report": self.report,
+                "created_at": self.created_at.isoformat(),
+            }
+
+
+def source_path(submission):
+    """Return the path of the source a Submission graded, or None if unknown."""
+    if not submission.source_file:
+        return None  # graded before sources were recorded
+    return os.path.join(app.config["UPLOAD_FOLDER"], submission.source_file)
+
+
+def grade_source(filepath, testcases):
+    """
+    Compile a stored source and run it against the given test cases. Runs in
+    a worker process, so it only takes and returns plain data.
+
+    Args:
+        filepath (str): Path to the C file
+        testcases (list): (case, output, compare_mode, abs_tol, rel_tol)
+            tuples, one per test case
+
+    Returns:
+        tuple: (compiler errors or None, their rule-based hints or None,
+        list of RunResult)
+    """
+    compiled = compile_source(filepath)
+    if not compiled.ok:
+        return compiled.errors, local_hints(compiled.diagnostics), []
+    inputs = [prepare_input(case) for case, *_ in testcases]
+    expected_outputs = [get_expectation(*tc[1:]) for tc in testcases]
+    results = run_testcases(compiled.binary_path, inputs, expected_outputs)
+    compiled.discard()
+    return None, None, results
+
+
+def regrade(question_id=None, assignment_id=None, with_feedback=False, workers=None):
+    """
+    Re-run the stored sources of every student who submitted to a question
+    (or to every question of an assignment) against the current test cases
+    and update their marks. Must be called inside an app context.
+
+    The latest Submission of each student and test case is updated in place;
+    test cases added since the student submitted get a new row.
+
+    Args:
+        question_id (int, optional): Question to regrade
+        assignment_id (int, optional): Assignment whose questions are regraded
+        with_feedback (bool): Ask the LLM for feedback on failed test cases
+        workers (int, optional): Size of the process pool
+
+    Returns:
+        dict: Counts and throughput of the regrade
+    """
+    started = time.monotonic()
+    if question_id is not None:
+        questions = Question.query.filter_by(id=question_id).all()
+    else:
+        questions = Question.query.filter_by(ass_id=assignment_id).all()
+    question_ids = [question.id for question in questions]
+    testcases = {question.id: [] for question in questions}
+    for testcase in (
+        Testcase.query.filter(Testcase.ques_id.in_(question_ids))
+        .order_by(Testcase.id)
+        .all()
+    ):
+        testcases[testcase.ques_id].append(testcase)
+
+    # Latest row per (student, question, test case) and per (student,
+    # question), whose source is the one regraded; rows come oldest first
+    latest = {}
+    newest = {}
+    for submission in (
+        Submission.query.filter(Submission.ques_id.in_(question_ids))
+        .order_by(Submission.id)
+        .all()
+    ):
+        key = (submission.st_id, submission.ques_id, submission.test_case_id)
+        latest[key] = submission
+        newest[key[:2]] = submission
+    questions = {question.id: question for question in questions}
+
+    report = {"submissions": 0, "testcases": 0, "missing_sources": 0}
+    pending = 0
+    # Spawned, not forked: this process runs request and grading threads.
+    # Each worker imports the app first, as the web server does, so that
+    # unpickling grade_source does not import regrade ahead of it.
+    with ProcessPoolExecutor(
+        max_workers=workers or REGRADE_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=importlib.import_module,
+        initargs=("app",),
+    ) as executor:
+        futures = {}
+        for (st_id, ques_id), submission in sorted(newest.items()):
+            filepath = source_path(submission)
+            if not testcases[ques_id]:
+                continue
+            if filepath is None or not os.path.exists(filepath):
+                report["missing_sources"] += 1
+                continue
+            cases = [
+                (tc.case, tc.output, tc.compare_mode, tc.abs_tol, tc.rel_tol)
+                for tc in testcases[ques_id]
+            ]
+            futures[executor.submit(grade_source, filepath, cases)] = submission
+
+        for future in as_completed(futures):
+            source = futures[future]
+            compile_errors, compile_hints, results = future.result()
+            context = None
+            if with_feedback:
+                # The hints below build on the analysis of this student's code
+                context = get_code_feedback(source_path(source))["context"]
+            for submission in _store_results(
+                source,
+                questions[source.ques_id],
+                testcases[source.ques_id],
+                compile_errors,
+                compile_hints,
+                results,
+                latest,
+                context,
+            ):
+                db.session.add(submission)
+                pending += 1
+                report["testcases"] += 1
+            report["submissions"] += 1
+            if pending >= REGRADE_BATCH_SIZE:
+                db.session.commit()
+                pending = 0
+    db.session.commit()
+
+    elapsed = time.monotonic() - started
+    report["seconds"] = elapsed
+    report["submissions_per_sec"] = report["submissions"] / elapsed if elapsed else 0.0
+    return report
+
+
+def _store_results(
+    source, question, testcases, compile_errors, compile_hints, results, latest, context
+):
+    # Mirrors grade_submission: the first failed run ends grading, so every
+    # later test case scores zero as well. LLM feedback is only asked for
+    # when a CodeContext is given. The code review of the regraded source
+    # (source is its newest Submission) is kept in every row.
+    st_id = source.st_id
+    review, heading, _ = (source.feedback or "").partition(TEST_CASE_HEADING)
+    review = review + heading if heading else TEST_CASE_HEADING.lstrip()
+    marks_per_testcase = float(question.marks) / len(testcases)
+    stopped = None  # feedback for test cases that were not run
+    if compile_errors is not None:
+        stopped = compile_hints or "Your code no longer compiles."
+        if compile_hints is None and context is not None:
+            analysis = get_compilation_feedback(
+                context, compile_errors, question_id=question.id
+            )
+            if analysis["status"] == "success":
+                stopped = analysis["feedback"]
+
+    test_inputs = [prepare_input(tc.case) or tc.case for tc in testcases]
+    expectations = [
+        get_expectation(tc.output, tc.compare_mode, tc.abs_tol, tc.rel_tol)
+        for tc in testcases
+    ]
+    mismatch_feedback = {}
+    if context is not None and stopped is None:
+        # Output mismatches before the first failed run, in one LLM request
+        graded = next(
+            (idx for idx, result in enumerate(results) if result.verdict != OK),
+            len(results),
+        )
+        mismatches = [
+            idx
+            for idx in range(graded)
+            if expectations[idx] is not None and not results[idx].output_matches
+        ]
+        if mismatches:
+            analysis = get_batch_test_case_feedback(
+                context,
+                [
+                    (test_inputs[idx], results[idx].output, expectations[idx].text)
+                    for idx in mismatches
+                ],
+            )
+            if analysis["status"] == "success":
+                mismatch_feedback = dict(zip(mismatches, analysis["feedback"]))
+
+    for idx, testcase in enumerate(testcases):
+        test_case = test_inputs[idx]
+        result = results[idx] if stopped is None else None
+        if result is None:
+            marks, output, note = 0.0, None, stopped
+        elif result.verdict != OK:
+            marks, output = 0.0, result.output
+            note = VERDICT_FEEDBACK.get(result.verdict, result.message)
+            if result.verdict == RE and context is not None:
+                analysis = get_runtime_feedback(
+                    context, result.errors, test_case, question_id=question.id
+                )
+                if analysis["status"] == "success":
+                    note = analysis["feedback"]
+            note = f"{ERROR_TYPES[result.verdict].capitalize()} error: {note}"
+            stopped = "Not run because an earlier test case failed."
+        else:
+            output = result.output
+            if expectations[idx] is None or result.output_matches:
+                marks, note = marks_per_testcase, ""
+            else:
+                marks, note = 0.0, mismatch_feedback.get(idx, MISMATCH_NOTE)
+
+        submission = latest.get((st_id, question.id, testcase.id))
+        if submission is None:
+            submission = Submission(
+                st_id=st_id,
+                ass_id=question.ass_id,
+                ques_id=question.id,
+                test_case_id=testcase.id,
+            )
+        submission.date = date.today()
+        submission.marks = marks
+        submission.output = output
+        submission.feedback = review + REGRADE_NOTE + ("\n" + note if note else "")
+        submission.source_file = source.source_file
+        if result is not None:
+            if submission.telemetry is None:
+                submission.telemetry = SubmissionTelemetry()
+            for field, value in result.telemetry().items():
+                setattr(submission.telemetry, field, value)
+        elif submission.telemetry is not None:
+            db.session.delete(submission.telemetry)
+        yield submission
+
+
+def start_regrade(question_id=None, assignment_id=None, with_feedback=False):
+    """
+    Queue a regrade in the background and return immediately.
+
+    Args:
+        question_id (int, optional): Question to regrade
+        assignment_id (int, optional): Assignment whose questions are regraded
+        with_feedback (bool): Ask the LLM for feedback on failed test cases
+
+    Returns:
+        RegradeJob: The queued job
+    """
+    job = RegradeJob(question_id, assignment_id, with_feedback)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    _executor.submit(_run_job, job)
+    return job
+
+
+def get_regrade_job(job_id):
+    """Return the regrade job with the given id, or None if unknown."""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def _run_job(job):
+    with app.app_context():
+        with _jobs_lock:
+            job.status = "running"
+        try:
+            report = regrade(job.question_id, job.assignment_id, job.with_feedback)
+        except Exception as e:  # noqa: BLE001 - reported in the job status
+            db.session.rollback()
+            print("Regrade job", job.id, "failed:", str(e))
+            with _jobs_lock:
+                job.status = "failed"
+                job.error = str(e)
+        else:
+            print("Regrade job", job.id, "done:", report)
+            with _jobs_lock:
+                job.status = "done"
+                job.report = report
+        finally:
+            db.session.remove()
+
+
+@app.cli.command("regrade")
+@click.option("--question", "question_id", type=int, help="Question to regrade")
+@click.option("--assignment", "assignment_id", type=int, help="Assignment to regrade")
+@click.option("--workers", type=int, help="Number of grading processes")
+@click.option(
+    "--with-feedback", is_flag=True, help="Ask the LLM for feedback on failures"
+)
+def regrade_command(question_id, assignment_id, workers, with_feedback):
+    """Re-run stored submissions against the current test cases."""
+    if (question_id is None) == (assignment_id is None):
+        raise click.UsageError("Give exactly one of --question or --assignment")
+    report = regrade(question_id, assignment_id, with_feedback, workers)
+    click.echo(
+        f"Regraded {report['submissions']} submissions "
+        f"({report['testcases']} test case results) in {report['seconds']:.2f}s, "
+        f"{report['submissions_per_sec']:.2f} submissions/sec"
+    )
+    if report["missing_sources"]:
+        click.echo(f"Skipped {report['missing_sources']} with no stored source")
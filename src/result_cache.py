@@ -0,0 +1,156 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from models import Testcase
+from runner import (
+    RUN_MEMORY_LIMIT,
+    RUN_OUTPUT_LIMIT,
+    RUN_TIMEOUT,
+    TLE,
+    run_testcases,
+)
+
+# Seconds a remembered test case result stays valid
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", "3600"))
+# Results kept in memory; the least recently used are dropped first
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "5000"))
+
+_results = OrderedDict()  # key -> (stored_at, testcase_id, RunResult)
+_by_testcase = {}  # testcase_id -> set of keys
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+_lock = threading.Lock()
+
+
+def result_key(binary_key, testcase, timeout=RUN_TIMEOUT):
+    """
+    Hash a compiled binary together with everything about a test case that
+    affects its verdict.
+
+    Args:
+        binary_key (str): CompileResult.key of the binary
+        testcase (Testcase): The test case row
+        timeout (int): Seconds the run may take
+
+    Returns:
+        str: Hex SHA-256 digest identifying the result
+    """
+    digest = hashlib.sha256(binary_key.encode("utf-8"))
+    for part in (
+        testcase.case,
+        testcase.output,
+        testcase.compare_mode,
+        testcase.abs_tol,
+        testcase.rel_tol,
+        timeout,
+        RUN_MEMORY_LIMIT,
+        RUN_OUTPUT_LIMIT,
+    ):
+        digest.update(b"\0" + str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def run_testcases_cached(
+    compiled, test_cases, inputs, expected_outputs, timeout=RUN_TIMEOUT
+):
+    """
+    Like run_testcases, but reuse the result of any test case this exact
+    binary already ran, e.g. from run_code followed by upload_submission or
+    from a classmate with identical code. Only the rest are executed, and
+    their results are only remembered if the program that ran is still the
+    cached binary compiled.key names (not a copy, nor a file replaced since).
+
+    Args:
+        compiled (CompileResult): The compiled program
+        test_cases (list): Testcase rows, in the same order as inputs
+        inputs (list): Program inputs as returned by prepare_input
+        expected_outputs (list): Expectation (or None) per input
+        timeout (int): Seconds before each run is killed
+
+    Returns:
+        list: RunResult for every input, in the same order as inputs
+    """
+    keys = [result_key(compiled.key, tc, timeout) for tc in test_cases]
+    results = [_get(key) for key in keys]
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    if missing:
+        ran = run_testcases(
+            compiled.binary_path,
+            [inputs[idx] for idx in missing],
+            [expected_outputs[idx] for idx in missing],
+            timeout,
+        )
+        cacheable = compiled.is_installed()
+        for idx, result in zip(missing, ran):
+            results[idx] = result
+            # A timeout may only mean the host was busy, so run it again
+            if cacheable and result.verdict != TLE:
+                _put(keys[idx], test_cases[idx].id, result)
+    return results
+
+
+def invalidate_testcase(testcase_id):
+    """Forget every result computed for a test case."""
+    with _lock:
+        for key in _by_testcase.pop(testcase_id, ()):
+            if _results.pop(key, None) is not None:
+                _stats["invalidations"] += 1
+
+
+def get_cache_stats():
+    """Return hit/miss counters and the current size of the result cache."""
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_results)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["max_entries"] = RESULT_CACHE_MAX_ENTRIES
+    stats["ttl"] = RESULT_CACHE_TTL
+    return stats
+
+
+def _get(key):
+    with _lock:
+        entry = _results.get(key)
+        if entry is not None and time.monotonic() - entry[0] > RESULT_CACHE_TTL:
+            _remove(key)
+            _stats["evictions"] += 1
+            entry = None
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        _results.move_to_end(key)
+        _stats["hits"] += 1
+    result = copy.copy(entry[2])
+    result.cached = True
+    return result
+
+
+def _put(key, testcase_id, result):
+    with _lock:
+        _results[key] = (time.monotonic(), testcase_id, result)
+        _results.move_to_end(key)
+        _by_testcase.setdefault(testcase_id, set()).add(key)
+        while len(_results) > RESULT_CACHE_MAX_ENTRIES:
+            _remove(next(iter(_results)))
+            _stats["evictions"] += 1
+
+
+def _remove(key):
+    _, testcase_id, _ = _results.pop(key)
+    keys = _by_testcase.get(testcase_id)
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del _by_testcase[testcase_id]
+
+
+@event.listens_for(Testcase, "after_update")
+@event.listens_for(Testcase, "after_delete")
+def _testcase_changed(mapper, connection, target):
+    invalidate_testcase(target.id)
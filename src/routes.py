@@ -1,5 +1,3 @@
-import subprocess
-
 from flask import (
     render_template,
     request,
@@ -8,6 +6,9 @@ from flask import (
     flash,
     session,
     Response,
+    jsonify,
+    abort,
+    stream_with_context,
 )
 from flask_login import (
     LoginManager,
@@ -17,21 +18,43 @@ from flask_login import (
     current_user,
 )
 from werkzeug.utils import secure_filename
-from subprocess import Popen, PIPE
-from sqlalchemy.sql import func
+from markupsafe import Markup
+from sqlalchemy.sql import and_, func
 
 from forms import StudentSignUpForm, StudentLoginForm, TeacherLoginForm
-from models import Student, Teacher, Assignment, Question, Testcase, Submission
+from models import (
+    Student,
+    Teacher,
+    Assignment,
+    Question,
+    Testcase,
+    Submission,
+    SubmissionTelemetry,
+)
 from app import app, db, bcrypt
 from datetime import datetime
 from io import StringIO
 import os
 import csv
-from llm import (
-    get_code_feedback,
-    get_compilation_feedback,
-    get_test_case_feedback,
-    get_runtime_feedback,
+import uuid
+import zlib
+from llm import get_usage_stats
+from grader import get_job, get_latest_jobs, submit_grading_job
+from regrade import start_regrade, get_regrade_job
+from compile_cache import compile_source, get_cache_stats
+from diagnostics import get_hint_stats, local_hints
+from shared_feedback import get_all_shared_stats, get_shared_stats
+from scores import EXPORT_BATCH_SIZE, get_gradebook, iter_group_marks
+from result_cache import run_testcases_cached, get_cache_stats as get_result_stats
+from feedback_cache import get_cache_stats as get_feedback_stats
+from feedback_stream import start_session, stream_feedback, take_session
+from comparator import COMPARE_MODES, EXACT, expectation_for
+from runner import (
+    ERROR_TYPES,
+    OK,
+    RE,
+    VERDICT_FEEDBACK,
+    prepare_input,
 )
 
 
@@ -49,6 +72,22 @@ login_manager.login_message = "Please log in to access this page."
 login_manager.login_message_category = "info"
 
 
+def save_upload(file, assignment_id, student_id, question_id):
+    """
+    Save an uploaded .c file under a name of its own, so that a Run started
+    while a submission is queued never replaces the code being graded.
+
+    Returns:
+        str: Path of the saved file
+    """
+    filename = secure_filename(
+        f"{assignment_id}_{student_id}_{question_id}_{uuid.uuid4().hex}.c"
+    )
+    filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+    file.save(filepath)
+    return filepath
+
+
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -272,6 +311,27 @@ def add_questions(assignment_id):
     )
 
 
+def comparison_settings(form):
+    """
+    Read a test case's output comparison settings from a submitted form.
+
+    Args:
+        form: request.form of the add/edit test case forms
+
+    Returns:
+        dict: compare_mode, abs_tol and rel_tol for the Testcase
+    """
+    compare_mode = form.get("compare_mode", EXACT)
+    if compare_mode not in COMPARE_MODES:
+        compare_mode = EXACT
+    try:
+        abs_tol = max(0.0, float(form.get("abs_tol") or 0.0))
+        rel_tol = max(0.0, float(form.get("rel_tol") or 0.0))
+    except ValueError:
+        abs_tol = rel_tol = 0.0
+    return {"compare_mode": compare_mode, "abs_tol": abs_tol, "rel_tol": rel_tol}
+
+
 @app.route("/add_test_cases/<int:question_id>", methods=["GET", "POST"])
 @login_required
 def add_test_cases(question_id):
@@ -284,7 +344,12 @@ def add_test_cases(question_id):
         output = request.form["output"]
 
         # Create a Testcase object
-        new_testcase = Testcase(ques_id=question_id, case=case_input, output=output)
+        new_testcase = Testcase(
+            ques_id=question_id,
+            case=case_input,
+            output=output,
+            **comparison_settings(request.form),
+        )
 
         db.session.add(new_testcase)
         db.session.commit()
@@ -296,7 +361,10 @@ def add_test_cases(question_id):
     testcases = Testcase.query.filter_by(ques_id=question_id).all()
 
     return render_template(
-        "add_test_cases.html", question=question, testcases=testcases
+        "add_test_cases.html",
+        question=question,
+        testcases=testcases,
+        compare_modes=COMPARE_MODES,
     )
 
 
@@ -336,7 +404,10 @@ def edit_question(question_id):
         print("New output:", new_output)
         if new_case and new_output:
             new_testcase = Testcase(
-                ques_id=question.id, case=new_case, output=new_output
+                ques_id=question.id,
+                case=new_case,
+                output=new_output,
+                **comparison_settings(request.form),
             )
             db.session.add(new_testcase)
             db.session.commit()
@@ -348,7 +419,12 @@ def edit_question(question_id):
     # Retrieve all existing test cases for the question
     testcases = Testcase.query.filter_by(ques_id=question_id).all()
 
-    return render_template("edit_question.html", question=question, testcases=testcases)
+    return render_template(
+        "edit_question.html",
+        question=question,
+        testcases=testcases,
+        compare_modes=COMPARE_MODES,
+    )
 
 
 @app.route("/edit_testcase/<int:testcase_id>", methods=["GET", "POST"])
@@ -363,6 +439,8 @@ def edit_testcase(testcase_id):
     if request.method == "POST":
         testcase.case = request.form["case"]
         testcase.output = request.form["output"]
+        for field, value in comparison_settings(request.form).items():
+            setattr(testcase, field, value)
 
         db.session.commit()
         flash("Test case updated successfully!", "success")
@@ -370,7 +448,9 @@ def edit_testcase(testcase_id):
             url_for("view_assignment", assignment_id=testcase.question.ass_id)
         )
 
-    return render_template("edit_testcase.html", testcase=testcase)
+    return render_template(
+        "edit_testcase.html", testcase=testcase, compare_modes=COMPARE_MODES
+    )
 
 
 @app.route("/view_assignment/<int:assignment_id>", methods=["GET"])
@@ -383,6 +463,45 @@ def view_assignment(assignment_id):
     assignment = Assignment.query.get_or_404(assignment_id)
     questions = Question.query.filter_by(ass_id=assignment_id).all()
 
+    # Resource usage of graded runs, aggregated per test case
+    telemetry_rows = (
+        db.session.query(
+            Submission.test_case_id,
+            func.count(SubmissionTelemetry.wall_time),
+            func.avg(SubmissionTelemetry.wall_time),
+            func.max(SubmissionTelemetry.wall_time),
+            func.avg(SubmissionTelemetry.user_time + SubmissionTelemetry.sys_time),
+            func.max(SubmissionTelemetry.max_rss_kb),
+        )
+        .join(SubmissionTelemetry, SubmissionTelemetry.submission_id == Submission.id)
+        .filter(Submission.ass_id == assignment_id)
+        .group_by(Submission.test_case_id)
+        .all()
+    )
+    telemetry = {
+        test_case_id: {
+            "runs": runs,
+            "avg_wall_time": avg_wall,
+            "max_wall_time": max_wall,
+            "avg_cpu_time": avg_cpu,
+            "max_rss_kb": max_rss,
+        }
+        for test_case_id, runs, avg_wall, max_wall, avg_cpu, max_rss in telemetry_rows
+    }
+    # The heaviest individual runs, to spot submissions hogging the host
+    slowest_runs = (
+        db.session.query(Submission, SubmissionTelemetry, Student)
+        .join(SubmissionTelemetry, SubmissionTelemetry.submission_id == Submission.id)
+        .join(Student, Student.id == Submission.st_id)
+        .filter(
+            Submission.ass_id == assignment_id,
+            SubmissionTelemetry.wall_time.isnot(None),
+        )
+        .order_by(SubmissionTelemetry.wall_time.desc())
+        .limit(10)
+        .all()
+    )
+
     question_details = []
     total_question_marks = 0
     for question in questions:
@@ -401,6 +520,8 @@ def view_assignment(assignment_id):
         question_details=question_details,
         total_marks=total_question_marks,
         submission_details=None,
+        telemetry=telemetry,
+        slowest_runs=slowest_runs,
     )
 
 
@@ -413,7 +534,6 @@ def view_assignment_student(assignment_id):
 
     current_student_id = current_user.id
     assignment = Assignment.query.get_or_404(assignment_id)
-    questions = Question.query.filter_by(ass_id=assignment_id).all()
     student_data = current_user
     student_group = student_data.group
     current_date = datetime.today().date()
@@ -421,40 +541,74 @@ def view_assignment_student(assignment_id):
         is_due_date_passed = True if current_date > assignment.due_date1 else False
     else:
         is_due_date_passed = True if current_date > assignment.due_date2 else False
-    question_details = []
-    total_maks_gained = 0
-    for question in questions:
-        testcases = Testcase.query.filter_by(ques_id=question.id).all()
-        testcase_submissions = {}
-        for testcase in testcases:
-            submission = (
-                Submission.query.filter_by(
-                    st_id=current_student_id,
-                    ques_id=question.id,
-                    test_case_id=testcase.id,
-                )
-                .order_by(Submission.id.desc())
-                .first()
+    # Latest attempt of the student at every test case of the assignment
+    latest = (
+        db.session.query(
+            Submission.id,
+            Submission.ques_id,
+            Submission.test_case_id,
+            Submission.output,
+            Submission.marks,
+            Submission.feedback,
+            func.row_number()
+            .over(
+                partition_by=(Submission.ques_id, Submission.test_case_id),
+                order_by=Submission.id.desc(),
             )
-            if submission:
-                total_maks_gained += submission.marks
-                testcase_submissions[testcase.id] = (
-                    submission.output,
-                    submission.marks,
-                    submission.feedback,
-                )
-            else:
-                testcase_submissions[testcase.id] = (
-                    None  # No submission found for this test case
-                )
+            .label("attempt"),
+        )
+        .filter(
+            Submission.st_id == current_student_id,
+            Submission.ass_id == assignment_id,
+        )
+        .subquery()
+    )
+    # Questions, their test cases and those attempts in a single query
+    rows = (
+        db.session.query(
+            Question,
+            Testcase,
+            latest.c.id,
+            latest.c.output,
+            latest.c.marks,
+            latest.c.feedback,
+        )
+        .outerjoin(Testcase, Testcase.ques_id == Question.id)
+        .outerjoin(
+            latest,
+            and_(
+                latest.c.ques_id == Question.id,
+                latest.c.test_case_id == Testcase.id,
+                latest.c.attempt == 1,
+            ),
+        )
+        .filter(Question.ass_id == assignment_id)
+        .order_by(Question.id, Testcase.id)
+        .all()
+    )
 
-        question_details.append(
+    details_by_question = {}
+    total_maks_gained = 0
+    for question, testcase, submission_id, output, marks, feedback in rows:
+        detail = details_by_question.setdefault(
+            question.id,
             {
                 "question": question,
-                "testcases": testcases,
-                "testcase_submissions": testcase_submissions,  # Storing test case outputs
-            }
+                "testcases": [],
+                "testcase_submissions": {},  # Storing test case outputs
+            },
         )
+        if testcase is None:
+            continue
+        detail["testcases"].append(testcase)
+        if submission_id is not None:
+            total_maks_gained += marks
+            detail["testcase_submissions"][testcase.id] = (output, marks, feedback)
+        else:
+            detail["testcase_submissions"][testcase.id] = (
+                None  # No submission found for this test case
+            )
+    question_details = list(details_by_question.values())
     # print(question_details)
     return render_template(
         "view_assignment_student.html",
@@ -463,6 +617,12 @@ def view_assignment_student(assignment_id):
         student_id=current_student_id,
         total_marks_gained=total_maks_gained,
         due_date_passed=is_due_date_passed,
+        grading_jobs={
+            question_id: job.to_dict()
+            for question_id, job in get_latest_jobs(
+                current_student_id, assignment_id
+            ).items()
+        },
     )
 
 
@@ -528,189 +688,110 @@ def upload_submission(question_id, assignment_id):
         return redirect(url_for("view_assignment_student", assignment_id=assignment_id))
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(
-            f"{assignment_id}_{current_student_id}_{question_id}.c"
-        )
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        file.save(filepath)
+        filepath = save_upload(file, assignment_id, current_student_id, question_id)
 
-        # Get AI feedback on code quality
-        code_analysis = get_code_feedback(filepath)
-        if code_analysis["status"] == "success":
-            code_feedback = code_analysis["feedback"]
-        else:
-            code_feedback = "Unable to analyze code quality."
-
-        # Run the .c file evaluation (this is an example, adjust it to your system)
-        compile_process = Popen(
-            ["gcc", filepath, "-o", filepath + ".out"], stdout=PIPE, stderr=PIPE
+        # Grading runs in the background; the page polls the job status
+        job = submit_grading_job(
+            current_student_id, assignment_id, question_id, filepath
+        )
+        flash(
+            Markup(
+                'File uploaded. Grading job {} queued. <a href="{}">View progress</a>'
+            ).format(job.id, url_for("grading_status", job_id=job.id))
         )
-        compile_output, compile_errors = compile_process.communicate()
-
-        if compile_process.returncode != 0:
-            # Get AI feedback on compilation errors
-            error_analysis = get_compilation_feedback(compile_errors.decode("utf-8"))
-            if error_analysis["status"] == "success":
-                compilation_feedback = error_analysis["feedback"]
-            else:
-                compilation_feedback = "Unable to analyze compilation errors."
-            flash(
-                f"Compilation error: {compile_errors.decode('utf-8')}\n\nFeedback: {compilation_feedback}",
-                "error",
-            )
-            return redirect(
-                url_for("view_assignment_student", assignment_id=assignment_id)
-            )
-        else:
-            print("Compile output:", compile_output)
-
-        # Now, run the compiled program with test cases
-        test_cases = Testcase.query.filter_by(ques_id=question_id).all()
-        question_data = Question.query.filter_by(id=question_id).first()
-        test_cases_passed = 0
-        output = None
-        for idx, test_case_row in enumerate(test_cases):
-            print(f"TEST CASE {idx + 1}:")
-            test_case = test_case_row.case
-            test_case_feedback = ""
-            if "<>" in test_case:  # No input required
-                print("Running program:", filepath + ".out")
-                run_process = Popen(
-                    [filepath + ".out"],
-                    stdin=PIPE,
-                    stdout=PIPE,
-                    stderr=PIPE,
-                    encoding="utf-8",
-                )
-                try:
-                    output, errors = run_process.communicate(timeout=10)
-                except subprocess.TimeoutExpired:
-                    flash("Code Timeout during runtime", "error")
-                    return redirect(
-                        url_for("view_assignment_student", assignment_id=assignment_id)
-                    )
-            elif ";" in test_case:  # Contains multiple inputs
-                test_case = "\n".join(test_case.split(";"))
-                print("Running program:", filepath + ".out", "<", test_case)
-                run_process = Popen([filepath + ".out"], text=True, encoding="utf-8")
-                try:
-                    output, errors = run_process.communicate(
-                        timeout=10, input=test_case
-                    )
-                except subprocess.TimeoutExpired:
-                    flash("Code Timeout during runtime", "error")
-                    return redirect(
-                        url_for("view_assignment_student", assignment_id=assignment_id)
-                    )
-                # run_process = run([filepath + '.out'], capture_output=True, text=True,
-                #                   input=test_case, encoding='utf-8')
-            else:  # Contains single input
-                print("Running program:", filepath + ".out", "<", test_case)
-                run_process = Popen(
-                    [filepath + ".out"],
-                    stdin=PIPE,
-                    stdout=PIPE,
-                    stderr=PIPE,
-                    text=True,
-                    encoding="utf-8",
-                )
-                try:
-                    output, errors = run_process.communicate(
-                        timeout=10, input=test_case
-                    )
-                except subprocess.TimeoutExpired:
-                    flash("Code Timeout during runtime", "error")
-                    return redirect(
-                        url_for("view_assignment_student", assignment_id=assignment_id)
-                    )
-            desired_output = test_case_row.output
-            if run_process.returncode != 0:
-                # Get AI feedback on runtime errors
-                error_analysis = get_runtime_feedback(errors, test_case)
-                if error_analysis["status"] == "success":
-                    runtime_err_feedback = error_analysis["feedback"]
-                else:
-                    runtime_err_feedback = "Unable to analyze runtime errors."
-                flash(
-                    f"Runtime error: {errors}\n\nFeedback: {runtime_err_feedback}",
-                    "error",
-                )
-                return redirect(
-                    url_for("view_assignment_student", assignment_id=assignment_id)
-                )
-            else:  # Code ran without runtime errors
-                # output = output.decode('utf-8')
-                if desired_output == "<>":  # Any output is acceptable
-                    marks = float(question_data.marks) / len(test_cases)
-                    test_cases_passed += 1
-                elif ";" in desired_output:  # Contains multiple outputs
-                    desired_output = "\n".join(desired_output.split(";"))
-                    if output == desired_output:
-                        test_cases_passed += 1
-                        marks = float(question_data.marks) / len(test_cases)
-                    else:
-                        print(
-                            f"Code Output - Desired Output Mismatch\nCode output:\t{output}\nDesired output:\t{desired_output}"
-                        )
-                        # Get AI feedback on test case mismatch
-                        mismatch_analysis = get_test_case_feedback(
-                            test_case, output, desired_output
-                        )
-                        if mismatch_analysis["status"] == "success":
-                            test_case_feedback += mismatch_analysis["feedback"]
-                        else:
-                            test_case_feedback += (
-                                "Unable to analyze test case mismatch."
-                            )
-                        marks = 0.0
-                else:  # Contains single output
-                    if output == desired_output:
-                        test_cases_passed += 1
-                        marks = float(question_data.marks) / len(test_cases)
-                    else:
-                        print(
-                            f"Code Output - Desired Output Mismatch\nCode output:\t{output}\nDesired output:\t{desired_output}"
-                        )
-                        # Get AI feedback on test case mismatch
-                        mismatch_analysis = get_test_case_feedback(
-                            test_case, output, desired_output
-                        )
-                        if mismatch_analysis["status"] == "success":
-                            test_case_feedback += mismatch_analysis["feedback"]
-                        else:
-                            test_case_feedback += (
-                                "Unable to analyze test case mismatch."
-                            )
-                        marks = 0.0
-                test_case_id = test_case_row.id
-                # Save the marks to the database
-                current_date = datetime.today()
-                final_feedback = (
-                    "Code Feedback:\n"
-                    + code_feedback
-                    + "\n\nTest Case Feedback:\n"
-                    + test_case_feedback
-                )
-                submission = Submission(
-                    st_id=current_student_id,
-                    date=current_date,
-                    ass_id=assignment_id,
-                    ques_id=question_id,
-                    marks=marks,
-                    test_case_id=test_case_id,
-                    output=output,
-                    feedback=final_feedback,
-                )
-                db.session.add(submission)
-                db.session.commit()
-
-        flash(f"File uploaded and evaluated. You received {marks} marks.")
         return redirect(url_for("view_assignment_student", assignment_id=assignment_id))
 
     flash("Invalid file format. Only .c files are allowed.", "error")
     return redirect(url_for("view_assignment_student", assignment_id=assignment_id))
 
 
+@app.route("/grading_status/<job_id>", methods=["GET"])
+@login_required
+def grading_status(job_id):
+    if not isinstance(current_user, Student):
+        flash("Access denied. Students only.", "danger")
+        return redirect(url_for("index"))
+
+    job = get_job(job_id)
+    if job is None or job.student_id != current_user.id:
+        abort(404)
+
+    job_data = job.to_dict()
+    if request.args.get("format") == "json" or (
+        request.accept_mimetypes.best == "application/json"
+    ):
+        return jsonify(job_data)
+    return render_template("grading_status.html", job=job_data)
+
+
+@app.route("/teacher/cache_stats", methods=["GET"])
+@login_required
+def cache_stats():
+    if not isinstance(current_user, Teacher):
+        flash("Access denied. Teachers only.", "danger")
+        return redirect(url_for("index"))
+
+    # ?question_id= narrows the shared hints down to one question
+    question_id = request.args.get("question_id", type=int)
+    if question_id is None:
+        shared_feedback = get_all_shared_stats()
+    else:
+        shared_feedback = {question_id: get_shared_stats(question_id)}
+    return jsonify(
+        {
+            "compile_cache": get_cache_stats(),
+            "result_cache": get_result_stats(),
+            "feedback_cache": get_feedback_stats(),
+            "shared_feedback": shared_feedback,
+            "hints": get_hint_stats(),
+            "llm_usage": get_usage_stats(),
+        }
+    )
+
+
+@app.route("/regrade/question/<int:question_id>", methods=["POST"])
+@login_required
+def regrade_question(question_id):
+    if not isinstance(current_user, Teacher):
+        flash("Access denied. Teachers only.", "danger")
+        return redirect(url_for("index"))
+
+    question = Question.query.get_or_404(question_id)
+    job = start_regrade(
+        question_id=question.id, with_feedback="with_feedback" in request.form
+    )
+    flash(f"Regrade {job.id} of question {question.id} started.", "success")
+    return redirect(url_for("view_assignment", assignment_id=question.ass_id))
+
+
+@app.route("/regrade/assignment/<int:assignment_id>", methods=["POST"])
+@login_required
+def regrade_assignment(assignment_id):
+    if not isinstance(current_user, Teacher):
+        flash("Access denied. Teachers only.", "danger")
+        return redirect(url_for("index"))
+
+    assignment = Assignment.query.get_or_404(assignment_id)
+    job = start_regrade(
+        assignment_id=assignment.id, with_feedback="with_feedback" in request.form
+    )
+    flash(f"Regrade {job.id} of assignment {assignment.topic} started.", "success")
+    return redirect(url_for("view_assignment", assignment_id=assignment.id))
+
+
+@app.route("/regrade_status/<job_id>", methods=["GET"])
+@login_required
+def regrade_status(job_id):
+    if not isinstance(current_user, Teacher):
+        flash("Access denied. Teachers only.", "danger")
+        return redirect(url_for("index"))
+
+    job = get_regrade_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
 @app.route("/run_code/<int:question_id>/<int:assignment_id>", methods=["POST"])
 @login_required
 def run_code(question_id, assignment_id):
@@ -729,228 +810,117 @@ def run_code(question_id, assignment_id):
         return redirect(url_for("view_assignment_student", assignment_id=assignment_id))
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(
-            f"{assignment_id}_{current_student_id}_{question_id}.c"
-        )
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        file.save(filepath)
-
-        # Get AI feedback on code quality
-        code_analysis = get_code_feedback(filepath)
-        if code_analysis["status"] == "success":
-            code_feedback = code_analysis["feedback"]
-        else:
-            code_feedback = "Unable to analyze code quality."
-
-        # Run the .c file evaluation
-        compile_process = Popen(
-            ["gcc", filepath, "-o", filepath + ".out"], stdout=PIPE, stderr=PIPE
+        filepath = save_upload(file, assignment_id, current_student_id, question_id)
+        try:
+            return run_code_streaming(filepath, question_id, assignment_id)
+        finally:
+            # A Run is not a submission, so its file is not kept
+            os.remove(filepath)
+
+
+def run_code_streaming(filepath, question_id, assignment_id):
+    """
+    Run an uploaded file against the test cases without waiting on the LLM.
+    The verdicts are rendered right away; the page then fetches the code
+    review and hints from run_code_feedback as they stream in. The review
+    works on the source read here, so the file may go once this returns.
+
+    Args:
+        filepath (str): Path of the saved .c file
+        question_id (int): Question being answered
+        assignment_id (int): Assignment the question belongs to
+
+    Returns:
+        str: The rendered run_code.html
+    """
+    question_data = Question.query.get_or_404(question_id)
+    with open(filepath, "r") as file:
+        source = file.read()
+    feedback = start_session(current_user.id, source, question_id)
+    page = {
+        "assignment_id": assignment_id,
+        "student_id": current_user.id,
+        "question": question_data.question,
+        "feedback_stream": url_for("run_code_feedback", session_id=feedback.id),
+    }
+
+    compiled = compile_source(filepath)
+    if not compiled.ok:
+        # Hints from the rules are shown at once, the LLM's are streamed
+        compilation_feedback = local_hints(compiled.diagnostics)
+        if compilation_feedback is None:
+            feedback.error_type = "compilation"
+            feedback.errors = compiled.errors
+        return render_template(
+            "run_code.html",
+            submissions=[],
+            error_type="compilation",
+            error_message=compiled.errors,
+            error_feedback=compilation_feedback,
+            **page,
         )
-        compile_output, compile_errors = compile_process.communicate()
-
-        if compile_process.returncode != 0:
-            # Get AI feedback on compilation errors
-            error_analysis = get_compilation_feedback(compile_errors.decode("utf-8"))
-            if error_analysis["status"] == "success":
-                compilation_feedback = error_analysis["feedback"]
-            else:
-                compilation_feedback = "Unable to analyze compilation errors."
 
+    test_cases = Testcase.query.filter_by(ques_id=question_id).all()
+    inputs = [prepare_input(tc.case) for tc in test_cases]
+    expected_outputs = [expectation_for(tc) for tc in test_cases]
+    results = run_testcases_cached(compiled, test_cases, inputs, expected_outputs)
+    compiled.discard()
+    submissions = []
+    for idx, (test_case_row, result) in enumerate(zip(test_cases, results)):
+        test_case = inputs[idx] if inputs[idx] is not None else test_case_row.case
+        if result.verdict != OK:
+            error_feedback = VERDICT_FEEDBACK.get(result.verdict)
+            if result.verdict == RE:
+                feedback.error_type = "runtime"
+                feedback.errors = result.errors
+                feedback.test_input = test_case
+            feedback.mismatches = []
             return render_template(
                 "run_code.html",
-                assignment_id=assignment_id,
-                student_id=current_student_id,
-                question=Question.query.get(question_id).question,
                 submissions=[],
-                error_type="compilation",
-                error_message=compile_errors.decode("utf-8"),
-                error_feedback=compilation_feedback,
+                error_type=ERROR_TYPES[result.verdict],
+                error_message=result.message,
+                error_feedback=error_feedback,
+                **page,
             )
 
-        # Now, run the compiled program with test cases
-        test_cases = Testcase.query.filter_by(ques_id=question_id).all()
-        question_data = Question.query.filter_by(id=question_id).first()
-        submissions = []
-        for idx, test_case_row in enumerate(test_cases):
-            submission_data = dict()
-            print(f"TEST CASE {idx + 1}:")
-            test_case = test_case_row.case
-            test_case_feedback = ""
-            if "<>" in test_case:  # No input required
-                print("Running program:", filepath + ".out")
-                run_process = Popen(
-                    [filepath + ".out"],
-                    stdin=PIPE,
-                    stdout=PIPE,
-                    stderr=PIPE,
-                    encoding="utf-8",
-                )
-                try:
-                    output, errors = run_process.communicate(timeout=10)
-                except subprocess.TimeoutExpired:
-                    return render_template(
-                        "run_code.html",
-                        assignment_id=assignment_id,
-                        student_id=current_student_id,
-                        question=question_data.question,
-                        submissions=[],
-                        error_type="timeout",
-                        error_message="Code execution timed out after 10 seconds",
-                        error_feedback="Your code took too long to execute. Please check for infinite loops or inefficient algorithms.",
-                    )
-            elif ";" in test_case:  # Contains multiple inputs
-                test_case = "\n".join(test_case.split(";"))
-                print("Running program:", filepath + ".out", "<", test_case)
-                run_process = Popen(
-                    [filepath + ".out"],
-                    stdin=PIPE,
-                    stdout=PIPE,
-                    stderr=PIPE,
-                    text=True,
-                    encoding="utf-8",
-                )
-                try:
-                    output, errors = run_process.communicate(
-                        timeout=10, input=test_case
-                    )
-                except subprocess.TimeoutExpired:
-                    return render_template(
-                        "run_code.html",
-                        assignment_id=assignment_id,
-                        student_id=current_student_id,
-                        question=question_data.question,
-                        submissions=[],
-                        error_type="timeout",
-                        error_message="Code execution timed out after 10 seconds",
-                        error_feedback="Your code took too long to execute. Please check for infinite loops or inefficient algorithms.",
-                    )
-            else:  # Contains single input
-                print("Running program:", filepath + ".out", "<", test_case)
-                run_process = Popen(
-                    [filepath + ".out"],
-                    stdin=PIPE,
-                    stdout=PIPE,
-                    stderr=PIPE,
-                    text=True,
-                    encoding="utf-8",
-                )
-                try:
-                    output, errors = run_process.communicate(
-                        timeout=10, input=test_case
-                    )
-                except subprocess.TimeoutExpired:
-                    return render_template(
-                        "run_code.html",
-                        assignment_id=assignment_id,
-                        student_id=current_student_id,
-                        question=question_data.question,
-                        submissions=[],
-                        error_type="timeout",
-                        error_message="Code execution timed out after 10 seconds",
-                        error_feedback="Your code took too long to execute. Please check for infinite loops or inefficient algorithms.",
-                    )
-
-            desired_output = test_case_row.output
-            submission_data["case"] = test_case
-            submission_data["output"] = desired_output
-            submission_data["st_output"] = output
-            if run_process.returncode != 0:
-                # Get AI feedback on runtime errors
-                print("Runtime errors:", errors)
-                print("Runtime output:", output)
-                error_analysis = get_runtime_feedback(errors, test_case)
-                if error_analysis["status"] == "success":
-                    runtime_err_feedback = error_analysis["feedback"]
-                else:
-                    runtime_err_feedback = "Unable to analyze runtime errors."
-
-                return render_template(
-                    "run_code.html",
-                    assignment_id=assignment_id,
-                    student_id=current_student_id,
-                    question=question_data.question,
-                    submissions=[],
-                    error_type="runtime",
-                    error_message=errors,
-                    error_feedback=runtime_err_feedback,
-                )
-            else:  # Code ran without runtime errors
-                output = output
-                print("Run output:", output)
-                if desired_output == "<>":  # Any output is acceptable
-                    submission_data["status"] = "Correct"
-                elif ";" in desired_output:  # Contains multiple outputs
-                    desired_output = "\n".join(desired_output.split(";"))
-                    if output == desired_output:
-                        submission_data["status"] = "Correct"
-                    else:
-                        print(
-                            f"Code Output - Desired Output Mismatch\nCode output:\t{output}\nDesired output:\t{desired_output}"
-                        )
-                        # Get AI feedback on test case mismatch
-                        mismatch_analysis = get_test_case_feedback(
-                            test_case, output, desired_output
-                        )
-                        if mismatch_analysis["status"] == "success":
-                            test_case_feedback = mismatch_analysis["feedback"]
-                        else:
-                            test_case_feedback = "Unable to analyze test case mismatch."
-                        submission_data["status"] = "Incorrect"
-                else:  # Contains single output
-                    try:
-                        output = float(output)
-                        desired_output = float(desired_output)
-                        if output == desired_output:
-                            submission_data["status"] = "Correct"
-                        else:
-                            print(
-                                f"Code Output - Desired Output Mismatch\nCode output:\t{output}\nDesired output:\t{desired_output}"
-                            )
-                            # Get AI feedback on test case mismatch
-                            mismatch_analysis = get_test_case_feedback(
-                                test_case, output, desired_output
-                            )
-                            if mismatch_analysis["status"] == "success":
-                                test_case_feedback = mismatch_analysis["feedback"]
-                            else:
-                                test_case_feedback = (
-                                    "Unable to analyze test case mismatch."
-                                )
-                            submission_data["status"] = "Incorrect"
-                    except Exception:
-                        if output == desired_output:
-                            submission_data["status"] = "Correct"
-                        else:
-                            print(
-                                f"Code Output - Desired Output Mismatch\nCode output:\t{output}\nDesired output:\t{desired_output}"
-                            )
-                            # Get AI feedback on test case mismatch
-                            mismatch_analysis = get_test_case_feedback(
-                                test_case, output, desired_output
-                            )
-                            if mismatch_analysis["status"] == "success":
-                                test_case_feedback = mismatch_analysis["feedback"]
-                            else:
-                                test_case_feedback = (
-                                    "Unable to analyze test case mismatch."
-                                )
-                            submission_data["status"] = "Incorrect"
-                submission_data["feedback"] = (
-                    "Code feedback: <br>"
-                    + code_feedback
-                    + "\n<br>Test Case feedback: <br>"
-                    + test_case_feedback
-                )
-                submissions.append(submission_data)
-
-        return render_template(
-            "run_code.html",
-            assignment_id=assignment_id,
-            student_id=current_student_id,
-            question=question_data.question,
-            submissions=submissions,
+        expectation = expected_outputs[idx]
+        if expectation is None or result.output_matches:
+            status = "Correct"
+        else:
+            status = "Incorrect"
+            feedback.mismatches.append(
+                (idx, test_case, result.output, expectation.text)
+            )
+        submissions.append(
+            {
+                "case": test_case,
+                "output": test_case_row.output,
+                "st_output": result.output,
+                "status": status,
+                "feedback": None,
+            }
         )
 
+    return render_template("run_code.html", submissions=submissions, **page)
+
+
+@app.route("/run_code_feedback/<session_id>", methods=["GET"])
+@login_required
+def run_code_feedback(session_id):
+    if not isinstance(current_user, Student):
+        flash("Access denied. Students only.", "danger")
+        return redirect(url_for("index"))
+
+    feedback = take_session(session_id, current_user.id)
+    if feedback is None:
+        abort(404)
+    return Response(
+        stream_feedback(feedback),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @app.route("/view_all_student_marks", methods=["GET"])
 @login_required
@@ -961,6 +931,9 @@ def view_all_student_marks():
 
     students = Student.query.all()
     assignments = Assignment.query.all()
+    # Latest-attempt totals of every (student, assignment) pair, kept
+    # up to date as submissions are graded
+    gradebook = get_gradebook()
 
     # Collect marks for each student for each assignment
     student_marks = {}
@@ -973,17 +946,8 @@ def view_all_student_marks():
         }
 
         for assignment in assignments:
-            # Check if submission exists for student and assignment
-            total_marks = (
-                db.session.query(func.sum(Submission.marks))
-                .filter(
-                    Submission.st_id == student.id, Submission.ass_id == assignment.id
-                )
-                .scalar()
-            )
-
             # Fallback to 0 if no submission
-            total_marks = total_marks if total_marks is not None else 0
+            total_marks = gradebook.get((student.id, assignment.id), 0)
 
             assignment_info = {
                 "topic": assignment.topic,
@@ -1001,6 +965,23 @@ def view_all_student_marks():
     )
 
 
+def gzip_stream(chunks):
+    """
+    Gzip a streamed response chunk by chunk.
+
+    Args:
+        chunks (iterable): str chunks of the response body
+
+    Yields:
+        bytes: gzip data, flushed after every chunk so the client receives
+        rows as they are produced
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
 @app.route("/download_group_csv/<int:group>")
 @login_required
 def download_group_csv(group):
@@ -1012,39 +993,40 @@ def download_group_csv(group):
     group_name = "A1" if group == 1 else "A2"
     date_field = "date1" if group == 1 else "date2"
 
-    # Fetch data for the specified group of students
-    students = Student.query.filter_by(group=group_name).all()
-    assignments = Assignment.query.all()
+    # Only the assignments are loaded up front; the students and their marks
+    # are streamed from a single query as the response is sent
+    assignments = Assignment.query.order_by(Assignment.id).all()
+    header = ["Sl. No.", "Student Name", "Student Roll"] + [
+        f"Day {i + 1} ({a.topic}, {getattr(a, date_field)})"
+        for i, a in enumerate(assignments)
+    ]
+    rows = iter_group_marks(group_name, [assignment.id for assignment in assignments])
+
+    def generate_csv():
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for index, (name, roll, marks) in enumerate(rows, start=1):
+            writer.writerow([index, name, roll] + marks)
+            if index % EXPORT_BATCH_SIZE == 0:
+                # Send each full batch before fetching the next one
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
 
-    # Create the CSV data in memory
-    csv_data = StringIO()
-    writer = csv.writer(csv_data)
-
-    # Write header row with dynamic assignment days and dates
-    writer.writerow(
-        ["Sl. No.", "Student Name", "Student Roll"]
-        + [
-            f"Day {i + 1} ({a.topic}, {getattr(a, date_field)})"
-            for i, a in enumerate(assignments)
-        ]
-    )
-
-    # Write student data for each student in the group
-    for index, student in enumerate(students, start=1):
-        row = [index, student.name, student.roll]
-        for assignment in assignments:
-            submission = Submission.query.filter_by(
-                st_id=student.id, ass_id=assignment.id
-            ).all()
-            total_marks = sum(sub.marks for sub in submission) if submission else 0
-            row.append(total_marks)
-        writer.writerow(row)
-
-    # Return the CSV data as a downloadable response
-    csv_data.seek(0)
     filename = f"Group_{group_name}_Marks.csv"
+    headers = {
+        "Content-Disposition": f"attachment;filename={filename}",
+        "Vary": "Accept-Encoding",
+    }
+    body = generate_csv()
+    if "gzip" in request.accept_encodings:
+        headers["Content-Encoding"] = "gzip"
+        body = gzip_stream(body)
     return Response(
-        csv_data,
+        stream_with_context(body),
         mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment;filename={filename}"},
+        headers=headers,
     )
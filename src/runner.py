@@ -0,0 +1,372 @@
+import math
+import os
+import pwd
+import resource
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from subprocess import PIPE, Popen
+
+from capture import TRUNCATION_MARKER, OutputCapture
+
+# Seconds a single test case may run before it is killed
+RUN_TIMEOUT = 10
+# Address space a student program may map (RLIMIT_AS)
+RUN_MEMORY_LIMIT = int(os.environ.get("RUN_MEMORY_LIMIT_MB", "256")) * 1024 * 1024
+# Bytes a run may print on stdout or on stderr; more than this is OLE
+RUN_OUTPUT_LIMIT = int(os.environ.get("RUN_OUTPUT_LIMIT_BYTES", str(1024 * 1024)))
+# Bytes of stdout kept as a preview, sized to fit Submission.output
+OUTPUT_PREVIEW_BYTES = 1000 - len(TRUNCATION_MARKER)
+# Bytes of stderr kept for error messages and feedback
+ERROR_PREVIEW_BYTES = 4096
+# Largest file a student program may write (RLIMIT_FSIZE)
+RUN_FILE_SIZE_LIMIT = int(os.environ.get("RUN_FILE_SIZE_LIMIT_BYTES", str(1024 * 1024)))
+# Processes the grading user may own before fork() fails (RLIMIT_NPROC).
+# The count covers every run of that user at once, not a single test case.
+# The default 0 forbids fork() altogether; the program itself still runs.
+RUN_MAX_PROCESSES = int(os.environ.get("RUN_MAX_PROCESSES", "0"))
+# Unprivileged account student programs run as when the grader is root,
+# since the kernel does not apply RLIMIT_NPROC to root
+RUN_USER = os.environ.get("RUN_USER", "nobody")
+
+# Run verdicts
+OK = "OK"
+TLE = "TLE"  # time limit exceeded
+MLE = "MLE"  # memory limit exceeded
+OLE = "OLE"  # output limit exceeded
+RE = "RE"  # runtime error
+
+# error_type shown on the result pages for each failed verdict
+ERROR_TYPES = {TLE: "timeout", MLE: "memory", OLE: "output", RE: "runtime"}
+
+VERDICT_FEEDBACK = {
+    TLE: "Your code took too long to execute. Please check for infinite loops or inefficient algorithms.",
+    MLE: "Your code used more memory than allowed. Please check for very large arrays or allocations inside loops.",
+    OLE: "Your code printed far more output than expected. Please check for print statements inside infinite or very long loops.",
+}
+
+VERDICT_MESSAGES = {
+    TLE: f"Code execution timed out after {RUN_TIMEOUT} seconds",
+    MLE: f"Memory limit of {RUN_MEMORY_LIMIT // (1024 * 1024)} MB exceeded",
+    OLE: f"Output limit of {RUN_OUTPUT_LIMIT // 1024} KB exceeded",
+}
+
+# Upper bound on test cases of one submission running at the same time
+MAX_TESTCASE_WORKERS = int(os.environ.get("MAX_TESTCASE_WORKERS", "8"))
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+class RunResult:
+    """Outcome of running a compiled program on one test case."""
+
+    def __init__(
+        self,
+        returncode,
+        output,
+        errors,
+        verdict,
+        output_size=None,
+        output_digest=None,
+        output_matches=None,
+        wall_time=None,
+        user_time=None,
+        sys_time=None,
+        max_rss_kb=None,
+        cached=False,
+    ):
+        self.returncode = returncode
+        self.output = output  # preview, see OutputCapture
+        self.errors = errors
+        self.verdict = verdict
+        self.output_size = output_size
+        self.output_digest = output_digest
+        # Whether stdout equals the expected output; None when none was given
+        self.output_matches = output_matches
+        # Resource usage of the child as reported by wait4()
+        self.wall_time = wall_time
+        self.user_time = user_time
+        self.sys_time = sys_time
+        self.max_rss_kb = max_rss_kb
+        # True when the result was reused instead of running the program
+        self.cached = cached
+
+    def telemetry(self):
+        """
+        Return the resource usage and output summary fields as a dict. A
+        cached result did not run, so only its output summary is reported.
+        """
+        measured = not self.cached
+        return {
+            "wall_time": self.wall_time if measured else None,
+            "user_time": self.user_time if measured else None,
+            "sys_time": self.sys_time if measured else None,
+            "max_rss_kb": self.max_rss_kb if measured else None,
+            "output_size": self.output_size,
+            "output_digest": self.output_digest,
+        }
+
+    @property
+    def timed_out(self):
+        return self.verdict == TLE
+
+    @property
+    def message(self):
+        """Return a short explanation of a failed run for the student."""
+        return VERDICT_MESSAGES.get(self.verdict, self.errors)
+
+
+def prepare_input(case):
+    """
+    Turn a stored test case into the text fed to the program.
+
+    Args:
+        case (str): Testcase.case as entered by the teacher
+
+    Returns:
+        str: Program input, or None when the case takes no input ("<>")
+    """
+    if "<>" in case:  # No input required
+        return None
+    if ";" in case:  # Contains multiple inputs
+        return "\n".join(case.split(";"))
+    return case
+
+
+def run_testcase(binary_path, stdin_data, expected=None, timeout=RUN_TIMEOUT):
+    """
+    Run a compiled program once with the given input under the CPU, memory,
+    process and output limits configured above.
+
+    Args:
+        binary_path (str): Path to the compiled program
+        stdin_data (str, optional): Text written to the program's stdin
+        expected (Expectation, optional): What stdout is compared against
+            as it streams
+        timeout (int): Seconds before the program is killed
+
+    Returns:
+        RunResult: Exit code, output preview and digest, stderr and verdict
+    """
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+    try:
+        return _run(binary_path, stdin_data, expected, timeout)
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+
+
+def _limited(binary_path, cpu_seconds):
+    # prlimit(1) sets the limits on itself and then execs the program, so no
+    # Python code runs between fork and exec in this multi-threaded process
+    return [
+        "prlimit",
+        f"--cpu={cpu_seconds}:{cpu_seconds + 1}",
+        f"--as={RUN_MEMORY_LIMIT}",
+        f"--nproc={RUN_MAX_PROCESSES}",
+        f"--fsize={RUN_FILE_SIZE_LIMIT}",
+        "--",
+        os.path.abspath(binary_path),
+    ]
+
+
+@lru_cache(maxsize=1)
+def _run_as():
+    # Popen arguments switching to RUN_USER; switching needs root, and
+    # without root there is nothing to drop
+    if os.geteuid() != 0:
+        return {}
+    user = pwd.getpwnam(RUN_USER)
+    return {"user": user.pw_uid, "group": user.pw_gid, "extra_groups": []}
+
+
+def _run(binary_path, stdin_data, expected, timeout):
+    # The child is reaped with os.wait4() instead of Popen.wait() so that its
+    # CPU time and peak RSS can be recorded alongside the output. Linux folds
+    # the memory the child inherited before exec into ru_maxrss, so the peak
+    # RSS never reads lower than the size of the grading process itself.
+    inherited_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.monotonic()
+    cpu_seconds = math.ceil(timeout)
+    run_process = Popen(
+        _limited(binary_path, cpu_seconds),
+        stdin=PIPE,
+        stdout=PIPE,
+        stderr=PIPE,
+        start_new_session=True,
+        **_run_as(),
+    )
+    stopped_for = []
+    # Held while signalling the session, which is only safe until the child
+    # is reaped: after that its pid, the session's id, may be reused
+    session_lock = threading.Lock()
+    reaped = False
+
+    def stop(verdict):
+        stopped_for.append(verdict)
+        with session_lock:
+            if not reaped:
+                _kill_session(run_process.pid)
+
+    timer = threading.Timer(timeout, stop, args=(TLE,))
+    timer.start()
+    stdout = OutputCapture(
+        OUTPUT_PREVIEW_BYTES, expected.comparator() if expected is not None else None
+    )
+    stderr = OutputCapture(ERROR_PREVIEW_BYTES)
+    io_threads = [
+        threading.Thread(target=_feed, args=(run_process.stdin, stdin_data)),
+        threading.Thread(target=_drain, args=(run_process.stdout, stdout, stop)),
+        threading.Thread(target=_drain, args=(run_process.stderr, stderr, stop)),
+    ]
+    for thread in io_threads:
+        thread.start()
+    try:
+        # Wait for the exit but leave the child unreaped, so that its pid
+        # still names the session below
+        os.waitid(os.P_PID, run_process.pid, os.WEXITED | os.WNOWAIT)
+    finally:
+        timer.cancel()
+    wall_time = time.monotonic() - started
+    with session_lock:
+        # Anything the program left running would keep our pipes open
+        _kill_session(run_process.pid)
+        _, status, rusage = os.wait4(run_process.pid, 0)
+        reaped = True
+    run_process.returncode = os.waitstatus_to_exitcode(status)
+    for thread in io_threads:
+        thread.join()
+
+    returncode = run_process.returncode
+    errors = stderr.preview()
+    cpu_time = rusage.ru_utime + rusage.ru_stime
+    if stopped_for:
+        verdict = stopped_for[0]
+    elif returncode == -signal.SIGXCPU or (
+        returncode == -signal.SIGKILL and cpu_time >= cpu_seconds
+    ):
+        verdict = TLE  # soft or hard RLIMIT_CPU
+    elif returncode == -signal.SIGXFSZ:
+        verdict = OLE
+    elif returncode != 0 and _out_of_memory(rusage.ru_maxrss, inherited_rss_kb, errors):
+        verdict = MLE
+    elif returncode != 0:
+        verdict = RE
+    else:
+        verdict = OK
+
+    return RunResult(
+        returncode,
+        stdout.preview(),
+        errors,
+        verdict,
+        output_size=stdout.size,
+        output_digest=stdout.digest,
+        output_matches=stdout.matches,
+        wall_time=wall_time,
+        user_time=rusage.ru_utime,
+        sys_time=rusage.ru_stime,
+        max_rss_kb=rusage.ru_maxrss,
+    )
+
+
+def _out_of_memory(max_rss_kb, inherited_rss_kb, errors):
+    # A failed allocation under RLIMIT_AS usually surfaces as a crash, so
+    # treat a crash as MLE when the program was near the limit or said so.
+    # The peak RSS only belongs to the program once it exceeds what the
+    # child inherited from the grader.
+    if max_rss_kb > inherited_rss_kb and max_rss_kb * 1024 >= 0.9 * RUN_MEMORY_LIMIT:
+        return True
+    lowered = errors.lower()
+    return "cannot allocate memory" in lowered or "out of memory" in lowered
+
+
+def _feed(stream, data):
+    try:
+        if data is not None:
+            stream.write(data.encode("utf-8"))
+    except BrokenPipeError:
+        pass  # the program exited without reading all of its input
+    finally:
+        try:
+            stream.close()
+        except BrokenPipeError:
+            pass
+
+
+def _kill_session(pid):
+    try:
+        # The whole session, in case the program managed to fork
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _drain(stream, capture, stop):
+    # Read as the program writes and stop it once it prints more than
+    # RUN_OUTPUT_LIMIT; the capture keeps only a preview, so memory per run
+    # stays flat however much is printed.
+    with stream:
+        for chunk in iter(lambda: stream.read1(65536), b""):
+            if capture.feed(chunk) > RUN_OUTPUT_LIMIT:
+                stop(OLE)
+                break
+
+
+def pool_size(num_testcases):
+    """
+    Pick how many test cases to run at once from the cores available to this
+    process, minus what the host and other submissions are already using.
+
+    Args:
+        num_testcases (int): Number of test cases to run
+
+    Returns:
+        int: Number of worker threads, at least 1
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        load = 0.0
+    with _in_flight_lock:
+        busy = max(load, _in_flight)
+    free = int(cpus - busy)
+    return max(1, min(num_testcases, free, MAX_TESTCASE_WORKERS))
+
+
+def run_testcases(binary_path, inputs, expected_outputs=None, timeout=RUN_TIMEOUT):
+    """
+    Run a compiled program on several inputs concurrently.
+
+    Args:
+        binary_path (str): Path to the compiled program
+        inputs (list): Program inputs as returned by prepare_input
+        expected_outputs (list, optional): Expectation (or None) per input
+        timeout (int): Seconds before each run is killed
+
+    Returns:
+        list: RunResult for every input, in the same order as inputs
+    """
+    if not inputs:
+        return []
+    if expected_outputs is None:
+        expected_outputs = [None] * len(inputs)
+    with ThreadPoolExecutor(max_workers=pool_size(len(inputs))) as executor:
+        return list(
+            executor.map(
+                lambda stdin_data, expected: run_testcase(
+                    binary_path, stdin_data, expected, timeout
+                ),
+                inputs,
+                expected_outputs,
+            )
+        )
@@ -0,0 +1,239 @@
+import os
+
+import click
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import app, db
+from models import (
+    Assignment,
+    Question,
+    Student,
+    StudentAssignmentScore,
+    Submission,
+    Testcase,
+)
+
+# Rows fetched per round trip when streaming a gradebook export
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "500"))
+
+_submissions = Submission.__table__
+_testcases = Testcase.__table__
+_scores = StudentAssignmentScore.__table__
+_UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def get_gradebook(student_ids=None):
+    """
+    Read every student's assignment totals from the summary table.
+
+    Args:
+        student_ids (list, optional): Only read these students
+
+    Returns:
+        dict: (student id, assignment id) -> marks of the latest attempts;
+        pairs without any marks are missing
+    """
+    query = db.session.query(
+        StudentAssignmentScore.st_id,
+        StudentAssignmentScore.ass_id,
+        StudentAssignmentScore.marks,
+    )
+    if student_ids is not None:
+        query = query.filter(StudentAssignmentScore.st_id.in_(student_ids))
+    return {(st_id, ass_id): marks for st_id, ass_id, marks in query}
+
+
+def iter_group_marks(group_name, assignment_ids):
+    """
+    Stream the marks of a group of students, one student at a time.
+
+    The students and their totals come from a single query read in batches of
+    EXPORT_BATCH_SIZE (a server-side cursor on PostgreSQL), so memory use does
+    not grow with the size of the group.
+
+    Args:
+        group_name (str): Student group, e.g. "A1"
+        assignment_ids (list): Assignments to report, in column order
+
+    Yields:
+        tuple: (student name, student roll, list of marks per assignment)
+    """
+    query = (
+        db.session.query(
+            Student.id,
+            Student.name,
+            Student.roll,
+            StudentAssignmentScore.ass_id,
+            StudentAssignmentScore.marks,
+        )
+        .outerjoin(StudentAssignmentScore, StudentAssignmentScore.st_id == Student.id)
+        .filter(Student.group == group_name)
+        .order_by(Student.id)
+        .yield_per(EXPORT_BATCH_SIZE)
+    )
+    columns = {ass_id: idx for idx, ass_id in enumerate(assignment_ids)}
+    current, name, roll, marks = None, None, None, None
+    for st_id, st_name, st_roll, ass_id, total in query:
+        if st_id != current:
+            if current is not None:
+                yield name, roll, marks
+            current, name, roll = st_id, st_name, st_roll
+            marks = [0] * len(assignment_ids)
+        if ass_id in columns:
+            marks[columns[ass_id]] = total
+    if current is not None:
+        yield name, roll, marks
+
+
+def rebuild_scores():
+    """
+    Recompute the summary table from the latest attempt at every test case,
+    e.g. to fill it for submissions stored before it existed.
+
+    Returns:
+        int: Number of (student, assignment) totals written
+    """
+    connection = db.session.connection()
+    connection.execute(_scores.delete())
+    connection.execute(
+        _scores.insert().from_select(["st_id", "ass_id", "marks"], _totals())
+    )
+    db.session.commit()
+    return db.session.query(func.count(StudentAssignmentScore.id)).scalar()
+
+
+def rebuild_assignment(connection, ass_id):
+    """
+    Recompute the totals of one assignment, e.g. after one of its test cases
+    was deleted.
+
+    Args:
+        connection (Connection): Connection of the transaction that changed
+            the assignment, so the totals commit or roll back with it
+        ass_id (int): Assignment id
+    """
+    connection.execute(_scores.delete().where(_scores.c.ass_id == ass_id))
+    connection.execute(
+        _scores.insert().from_select(
+            ["st_id", "ass_id", "marks"],
+            _totals(_submissions.c.ass_id == ass_id),
+        )
+    )
+
+
+def _totals(*where):
+    # SUM of the latest attempt at every test case that still exists
+    latest = (
+        select(func.max(_submissions.c.id).label("id"))
+        .where(*where)
+        .group_by(
+            _submissions.c.st_id, _submissions.c.ques_id, _submissions.c.test_case_id
+        )
+        .subquery()
+    )
+    return (
+        select(
+            _submissions.c.st_id,
+            _submissions.c.ass_id,
+            func.sum(_submissions.c.marks),
+        )
+        .join(latest, _submissions.c.id == latest.c.id)
+        .join(_testcases, _testcases.c.id == _submissions.c.test_case_id)
+        .where(_submissions.c.st_id.isnot(None), _submissions.c.ass_id.isnot(None))
+        .group_by(_submissions.c.st_id, _submissions.c.ass_id)
+    )
+
+
+def refresh_total(connection, st_id, ass_id):
+    """
+    Recompute a student's assignment total from their latest attempts.
+
+    The total row is created if needed and locked first (SELECT ... FOR
+    UPDATE), so a concurrent writer of the same total waits for this
+    transaction to commit and then counts its submissions too; SQLite
+    serializes writers on its own.
+
+    Args:
+        connection (Connection): Connection of the transaction writing the
+            Submissions, so the total commits or rolls back with them
+        st_id (int): Student id
+        ass_id (int): Assignment id
+    """
+    this_total = (_scores.c.st_id == st_id, _scores.c.ass_id == ass_id)
+    upsert = _UPSERTS.get(connection.dialect.name)
+    if upsert is not None:
+        connection.execute(
+            upsert(_scores)
+            .values(st_id=st_id, ass_id=ass_id, marks=0)
+            .on_conflict_do_nothing(index_elements=["st_id", "ass_id"])
+        )
+    elif connection.execute(select(_scores.c.id).where(*this_total)).first() is None:
+        connection.execute(_scores.insert().values(st_id=st_id, ass_id=ass_id, marks=0))
+    connection.execute(select(_scores.c.id).where(*this_total).with_for_update())
+
+    total = connection.execute(
+        _totals(_submissions.c.st_id == st_id, _submissions.c.ass_id == ass_id)
+    ).first()
+    if total is None:
+        # No attempt counts any more; pairs without marks have no row
+        connection.execute(_scores.delete().where(*this_total))
+    else:
+        connection.execute(_scores.update().where(*this_total).values(marks=total[2]))
+
+
+@event.listens_for(Session, "before_flush")
+def _assignments_deleted(session, flush_context, instances):
+    # The totals reference the assignment, so they go before it does
+    for target in session.deleted:
+        if isinstance(target, Assignment) and target.id is not None:
+            session.connection().execute(
+                _scores.delete().where(_scores.c.ass_id == target.id)
+            )
+
+
+@event.listens_for(Session, "after_flush")
+def _grading_changed(session, flush_context):
+    # Written Submissions refresh their student's total. Deleting a test case
+    # or a question, or changing its marks, recomputes its assignment's totals
+    # from the stored Submissions, whose marks are left as they were graded.
+    connection = session.connection()
+    assignments, totals = set(), set()
+    for target in session.deleted:
+        if isinstance(target, Question):
+            assignments.add(target.ass_id)
+        elif isinstance(target, Testcase):
+            assignments.add(
+                connection.execute(
+                    select(Question.ass_id).where(Question.id == target.ques_id)
+                ).scalar()
+            )
+    for target in session.dirty:
+        if isinstance(target, Question) and _marks_changed(target):
+            assignments.add(target.ass_id)
+    for targets in (session.new, session.deleted, session.dirty):
+        for target in targets:
+            if not isinstance(target, Submission):
+                continue
+            if targets is session.dirty and not _marks_changed(target):
+                continue
+            if target.st_id is not None and target.ass_id is not None:
+                totals.add((target.st_id, target.ass_id))
+    assignments.discard(None)
+    for ass_id in assignments:
+        rebuild_assignment(connection, ass_id)
+    # In a fixed order, so two transactions never wait on each other's rows
+    for st_id, ass_id in sorted(totals):
+        if ass_id not in assignments:
+            refresh_total(connection, st_id, ass_id)
+
+
+def _marks_changed(target):
+    return inspect(target).attrs.marks.history.has_changes()
+
+
+@app.cli.command("rebuild-scores")
+def rebuild_scores_command():
+    """Recompute every student's assignment totals from the submissions."""
+    click.echo(f"Rebuilt {rebuild_scores()} assignment totals")
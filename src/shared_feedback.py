@@ -0,0 +1,130 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a shared hint is served before the LLM is asked again
+SHARED_FEEDBACK_TTL = int(os.environ.get("SHARED_FEEDBACK_TTL", str(24 * 3600)))
+# Hints kept across all questions; the least recently used are dropped first
+SHARED_FEEDBACK_MAX_ENTRIES = int(os.environ.get("SHARED_FEEDBACK_MAX_ENTRIES", "5000"))
+
+# What differs between students hitting the same error, in order. Identifiers
+# stay: hints name the variable or function at fault, so two students only
+# share a hint when they got the error on the same name.
+NORMALIZERS = [
+    # Source snippet and caret lines quoted under gcc diagnostics
+    (re.compile(r"^\s*\d*\s*\|.*$", re.MULTILINE), ""),
+    # uploads/3_17_5.c:4:2: and similar locations
+    (re.compile(r"\S+\.c:\d+(?::\d+)?:\s*"), ""),
+    (re.compile(r"\S+\.c:\(\.\w+\+0x[0-9a-f]+\):\s*"), ""),
+    # Temporary objects and binaries of the linker and runner
+    (re.compile(r"/tmp/\S+\.o\b"), "<object>"),
+    (re.compile(r"\S+\.c\.out\b"), "<binary>"),
+    (re.compile(r"\S+\.c\b"), "<file>"),
+    (re.compile(r"0x[0-9a-fA-F]+"), "<address>"),
+    (re.compile(r"\b(line|column|pid|PID)\s+\d+"), r"\1 <n>"),
+]
+
+_entries = OrderedDict()  # (question_id, kind, errors, test_input) -> entry
+_stats = {}  # question_id -> {"hits": n, "misses": n}
+_lock = threading.Lock()
+
+
+class SharedHint:
+    """An LLM hint served to every student of a question making that error."""
+
+    def __init__(self, feedback):
+        self.feedback = feedback
+        self.hits = 0
+        self.stored_at = time.monotonic()
+
+
+def normalize_errors(errors):
+    """
+    Strip what differs between two students making the same mistake.
+
+    Args:
+        errors (str): Compiler or runtime error text
+
+    Returns:
+        str: The errors without paths, line and column numbers, source
+        snippets and addresses, one message per line
+    """
+    for pattern, replacement in NORMALIZERS:
+        errors = pattern.sub(replacement, errors)
+    lines = [" ".join(line.split()) for line in errors.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def get_shared(question_id, kind, errors, test_input=None):
+    """
+    Look up the hint another student of the question got for the same error.
+
+    Args:
+        question_id (int): Question the code answers
+        kind (str): "compilation" or "runtime"
+        errors (str): Error text, normalized here
+        test_input (str, optional): Input that caused a runtime error
+
+    Returns:
+        str: The shared hint, or None
+    """
+    key = (question_id, kind, normalize_errors(errors), test_input)
+    with _lock:
+        counters = _stats.setdefault(question_id, {"hits": 0, "misses": 0})
+        entry = _entries.get(key)
+        if (
+            entry is not None
+            and time.monotonic() - entry.stored_at > SHARED_FEEDBACK_TTL
+        ):
+            del _entries[key]
+            entry = None
+        if entry is None:
+            counters["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        entry.hits += 1
+        counters["hits"] += 1
+        return entry.feedback
+
+
+def put_shared(question_id, kind, errors, feedback, test_input=None):
+    """Share a hint with the next students of the question making the error."""
+    key = (question_id, kind, normalize_errors(errors), test_input)
+    with _lock:
+        _entries[key] = SharedHint(feedback)
+        _entries.move_to_end(key)
+        while len(_entries) > SHARED_FEEDBACK_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def get_shared_stats(question_id):
+    """
+    Return the hit counters of a question and its most recurring errors.
+
+    Args:
+        question_id (int): The question
+
+    Returns:
+        dict: hits, misses, hit_rate, and for every stored error its kind,
+        normalized text and hits, most reused first
+    """
+    with _lock:
+        stats = dict(_stats.get(question_id, {"hits": 0, "misses": 0}))
+        errors = [
+            {"kind": kind, "errors": text, "hits": entry.hits}
+            for (qid, kind, text, _), entry in _entries.items()
+            if qid == question_id
+        ]
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["errors"] = sorted(errors, key=lambda error: error["hits"], reverse=True)
+    return stats
+
+
+def get_all_shared_stats():
+    """Return get_shared_stats() of every question hints were looked up for."""
+    with _lock:
+        question_ids = sorted(_stats)
+    return {question_id: get_shared_stats(question_id) for question_id in question_ids}
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import hashlib
+
+from capture import TRUNCATION_MARKER, OutputCapture
+from comparator import get_expectation
+
+
+def feed(capture, data, chunk_size):
+    for start in range(0, len(data), chunk_size):
+        capture.feed(data[start:start + chunk_size])
+    return capture
+
+
+def test_short_output_is_kept_whole():
+    capture = feed(OutputCapture(100), b'hello\nworld\n', 5)
+    assert capture.preview() == 'hello\nworld\n'
+    assert not capture.truncated
+    assert capture.size == 12
+    assert capture.digest == hashlib.sha256(b'hello\nworld\n').hexdigest()
+
+
+def test_long_output_keeps_a_preview_and_hashes_everything():
+    data = b''.join(b'line %d\n' % idx for idx in range(10000))
+    capture = feed(OutputCapture(64), data, 4096)
+    assert capture.truncated
+    assert capture.preview() == data[:64].decode() + TRUNCATION_MARKER
+    assert capture.size == len(data)
+    assert capture.digest == hashlib.sha256(data).hexdigest()
+    # The digest does not depend on how the stream was chunked
+    assert feed(OutputCapture(64), data, 7).digest == capture.digest
+
+
+def test_output_of_exactly_the_preview_size_is_not_truncated():
+    capture = feed(OutputCapture(4), b'abcd', 1)
+    assert capture.preview() == 'abcd'
+    assert feed(OutputCapture(4), b'abcde', 1).preview() == 'abcd' + TRUNCATION_MARKER
+
+
+def test_split_multibyte_character_is_replaced():
+    capture = OutputCapture(1)
+    capture.feed('é'.encode())
+    assert capture.preview() == '�' + TRUNCATION_MARKER
+
+
+def test_comparison_sees_the_whole_stream():
+    expected = ' '.join(str(idx) for idx in range(5000))
+    capture = feed(OutputCapture(16, get_expectation(expected).comparator()), expected.encode(), 1000)
+    assert capture.truncated and capture.matches is True
+    assert OutputCapture(16).matches is None
+
+    wrong = expected[:-1] + '0'
+    assert feed(OutputCapture(16, get_expectation(expected).comparator()), wrong.encode(), 1000).matches is False
@@ -0,0 +1,63 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import time
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+COOLDOWN = 0.05
+
+
+def open_breaker():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=COOLDOWN)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=COOLDOWN)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # resets the count
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.to_dict()['times_opened'] == 1
+
+
+def test_open_breaker_rejects_until_cooldown():
+    breaker = open_breaker()
+    assert not breaker.allow()
+    assert not breaker.allow()
+    assert breaker.to_dict()['rejected'] == 2
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = open_breaker()
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # the trial is still running
+
+
+def test_successful_trial_closes():
+    breaker = open_breaker()
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_opens_again():
+    breaker = open_breaker()
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.to_dict()['times_opened'] == 2
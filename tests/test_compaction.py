@@ -0,0 +1,77 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import re
+
+import pytest
+
+import compaction
+from compaction import CHARS_PER_TOKEN, estimate_tokens, get_compaction_stats, output_diff, truncate
+
+CODE = ''.join(f'int line_{idx} = {idx};\n' for idx in range(500))
+NOTE = re.compile(r'\.\.\. \[(\d+) lines, (\d+) characters omitted\] \.\.\.\n')
+
+
+@pytest.fixture(autouse=True)
+def stats(monkeypatch):
+    monkeypatch.setattr(compaction, '_stats', {})
+
+
+def test_short_text_is_unchanged():
+    assert truncate('int main;', 10) == 'int main;'
+    assert truncate(None, 10) == ''
+
+
+@pytest.mark.parametrize('max_tokens', [20, 100, 1000])
+def test_long_text_fits_its_budget(max_tokens):
+    compacted = truncate(CODE, max_tokens)
+    note = NOTE.search(compacted)
+    # Head and tail stay within the budget; only the note is added
+    assert len(compacted) - len(note.group(0)) <= max_tokens * CHARS_PER_TOKEN
+    head, tail = compacted[:note.start()], compacted[note.end():]
+    assert CODE.startswith(head) and CODE.endswith(tail)
+    # Both are cut on line boundaries, and the note counts what is missing
+    assert head.endswith('\n') and tail.startswith('int line_')
+    omitted = CODE[len(head):len(CODE) - len(tail)]
+    assert note.groups() == (str(omitted.count('\n')), str(len(omitted)))
+
+
+def test_text_without_lines_is_cut_by_characters():
+    compacted = truncate('x' * 1000, 10)
+    assert compacted.startswith('x' * 26 + '... [0 lines, 961 characters omitted] ...\n')
+    assert compacted.endswith('\n' + 'x' * 13)
+
+
+def test_sizes_are_recorded():
+    truncate('int main;', 10, part='code')
+    truncate(CODE, 100, part='code')
+    stats = get_compaction_stats()['code']
+    assert (stats['calls'], stats['truncated']) == (2, 1)
+    assert stats['tokens_before'] == estimate_tokens('int main;') + estimate_tokens(CODE)
+    assert stats['tokens_saved'] == stats['tokens_before'] - stats['tokens_after'] > 0
+
+
+def test_first_difference():
+    description = output_diff('1\n2\n5\n4', '1\n2\n3\n4')
+    summary, diff = description.split('\n', 1)
+    assert summary == "First difference at line 3 column 1: expected '3\\n4', got '5\\n4'"
+    assert '-3\n+5' in diff
+
+
+def test_output_stops_early_or_runs_on():
+    assert output_diff('1 2', '1 2 3').startswith(
+        "The output stops early, at line 1 column 4; expected next: ' 3'")
+    assert output_diff('1 2 3', '1 2').startswith("The output continues past the expected end: ' 3'")
+
+
+def test_whitespace_only():
+    assert output_diff('1 2', '1 2').startswith('The outputs only differ in whitespace')
+
+
+def test_diff_fits_its_budget():
+    expected = '\n'.join(str(idx) for idx in range(2000))
+    actual = '\n'.join(str(idx * 2) for idx in range(2000))
+    description = output_diff(actual, expected, max_tokens=50)
+    assert description.startswith('First difference at line 2 column 1')
+    note = NOTE.search(description)
+    assert len(description) - len(note.group(0)) <= 50 * CHARS_PER_TOKEN
@@ -0,0 +1,77 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import pytest
+
+from comparator import (CASE_INSENSITIVE, EXACT, NUMERIC, WHITESPACE, Expectation,
+                        get_expectation)
+
+
+def streamed(expectation, output, chunk_size):
+    """Feed an output to a fresh comparator a few bytes at a time."""
+    comparator = expectation.comparator()
+    data = output.encode('utf-8')
+    for start in range(0, len(data), chunk_size):
+        comparator.feed(data[start:start + chunk_size])
+    return comparator.finish()
+
+
+def test_exact():
+    expectation = Expectation('1 2\n3')
+    assert expectation.matches('1 2\n3')
+    assert not expectation.matches('1 2\n3\n')
+    assert not expectation.matches('1  2\n3')
+    assert not expectation.matches('1 2')
+
+
+def test_whitespace_mode_ignores_spacing_only():
+    expectation = Expectation('1 2\n3', WHITESPACE)
+    assert expectation.matches('  1\t2 3\n\n')
+    assert not expectation.matches('1 23')
+    assert not expectation.matches('1 2 3 4')
+
+
+def test_case_mode_ignores_case_only():
+    expectation = Expectation('Hello World', CASE_INSENSITIVE)
+    assert expectation.matches('hELLO wORLD')
+    assert not expectation.matches('Hello  World')
+
+
+def test_numeric_absolute_tolerance():
+    expectation = Expectation('3.14159 2', NUMERIC, abs_tol=0.001)
+    assert expectation.matches('3.1420 2.0005')
+    assert expectation.matches('3.14159\n2')
+    assert not expectation.matches('3.143 2')
+
+
+def test_numeric_relative_tolerance():
+    expectation = Expectation('1000000 0.001', NUMERIC, rel_tol=1e-3)
+    assert expectation.matches('1000900 0.000999')
+    assert not expectation.matches('1002000 0.001')
+
+
+def test_numeric_words_must_match_exactly():
+    expectation = Expectation('sum = 5.0', NUMERIC, abs_tol=0.1)
+    assert expectation.matches('sum = 5.04')
+    assert not expectation.matches('Sum = 5.04')
+    assert not expectation.matches('sum = 5.04 extra')
+
+
+@pytest.mark.parametrize('mode', [EXACT, WHITESPACE, CASE_INSENSITIVE, NUMERIC])
+@pytest.mark.parametrize('chunk_size', [1, 3, 64])
+def test_streaming_agrees_with_whole_output(mode, chunk_size):
+    """Tokens split across chunks are compared the same as in one piece."""
+    expectation = Expectation('12.5 abc 7\nxyz', mode)
+    for output in ['12.5 abc 7\nxyz', '12.5 abc 7 xyz', '12.50 ABC 7\nxyz', '12.5 abc 77\nxyz']:
+        assert streamed(expectation, output, chunk_size) == expectation.matches(output)
+
+
+def test_any_output_and_multiple_outputs():
+    assert get_expectation('<>') is None
+    assert get_expectation('1;2').matches('1\n2')
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        Expectation('1', 'fuzzy')
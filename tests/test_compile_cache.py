@@ -0,0 +1,85 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import shutil
+
+import pytest
+
+import compile_cache
+from compile_cache import cache_key, compile_source, get_cache_stats
+
+pytestmark = pytest.mark.skipif(shutil.which('gcc') is None, reason='needs gcc')
+
+PROGRAM = b'#include <stdio.h>\nint main(void) { puts("hi"); return 0; }\n'
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    """An empty cache directory and fresh counters for every test."""
+    monkeypatch.setattr(compile_cache, 'COMPILE_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(compile_cache, '_stats', dict.fromkeys(compile_cache._stats, 0))
+
+
+def source(tmp_path, name, text=PROGRAM):
+    path = tmp_path / name
+    path.write_bytes(text)
+    return str(path)
+
+
+def test_miss_then_hit(tmp_path):
+    first = compile_source(source(tmp_path, 'a.c'))
+    assert first.ok and not first.cached
+    assert first.key == cache_key(PROGRAM)
+
+    # Another student's identical file reuses the binary
+    second = compile_source(source(tmp_path, 'b.c'))
+    assert second.ok and second.cached
+    assert second.key == first.key
+    assert second.binary_path != first.binary_path
+
+    stats = get_cache_stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+    assert stats['hit_rate'] == 0.5
+    assert stats['size_bytes'] == os.path.getsize(first.entry)
+
+
+def test_compile_errors_are_not_cached(tmp_path):
+    result = compile_source(source(tmp_path, 'a.c', b'int main(void) { return x; }\n'))
+    assert not result.ok and result.binary_path is None
+    assert "'x' undeclared" in result.errors
+    assert get_cache_stats()['entries'] == 0
+    assert not compile_source(source(tmp_path, 'b.c', b'int main(void) { return x; }\n')).cached
+
+
+def test_binary_is_hard_linked_to_its_entry(tmp_path):
+    compile_source(source(tmp_path, 'a.c'))
+    result = compile_source(source(tmp_path, 'b.c'))
+    assert result.is_installed()
+    assert os.stat(result.entry).st_nlink >= 2
+
+    # Evicting the entry leaves the installed binary runnable
+    os.remove(result.entry)
+    assert os.access(result.binary_path, os.X_OK)
+    assert not result.is_installed()
+    result.discard()
+    assert not os.path.exists(result.binary_path)
+    result.discard()  # already gone
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    old = compile_source(source(tmp_path, 'old.c'))
+    used = compile_source(source(tmp_path, 'used.c', PROGRAM + b'/* used */\n'))
+    os.utime(old.entry, (1, 1))
+    os.utime(used.entry, (2, 2))
+    # A hit marks the entry as recently used again
+    assert compile_source(source(tmp_path, 'used2.c', PROGRAM + b'/* used */\n')).cached
+
+    size = os.path.getsize(old.entry)
+    monkeypatch.setattr(compile_cache, 'COMPILE_CACHE_MAX_BYTES', 2 * size + size // 2)
+    new = compile_source(source(tmp_path, 'new.c', PROGRAM + b'/* new */\n'))
+
+    assert not os.path.exists(old.entry)
+    assert os.path.exists(used.entry) and os.path.exists(new.entry)
+    stats = get_cache_stats()
+    assert (stats['evictions'], stats['entries']) == (1, 2)
+    assert stats['size_bytes'] <= stats['max_bytes']
@@ -0,0 +1,136 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import shutil
+import subprocess
+import tempfile
+
+import pytest
+
+from diagnostics import diagnostics_flags, local_hints, parse_gcc_output, render_diagnostics
+
+# Recorded from gcc 12 for a missing semicolon, so the parser is checked even without gcc
+RECORDED = (
+    '[{"kind": "error", "column-origin": 1, "children": [], "escape-source": false, '
+    '"locations": [{"finish": {"byte-column": 8, "display-column": 8, "line": 3, "file": "d.c", '
+    '"column": 8}, "caret": {"byte-column": 3, "display-column": 3, "line": 3, "file": "d.c", '
+    '"column": 3}}], "message": "expected \',\' or \';\' before \'return\'"}]\n'
+)
+# The same error as SARIF, the format of GCC 15, on two lines as gcc may wrap it
+RECORDED_SARIF = (
+    '{"version": "2.1.0", "runs": [{"tool": {"driver": {"name": "GNU C17"}}, "results": [\n'
+    '{"ruleId": "error", "level": "error", "message": {"text": "expected \',\' or \';\' before \'return\'"}, '
+    '"locations": [{"physicalLocation": {"artifactLocation": {"uri": "d.c"}, '
+    '"region": {"startLine": 3, "startColumn": 3, "endColumn": 9}}}]}]}]}\n'
+    "/usr/bin/ld: d.o: in function `main':\n"
+    "d.c:(.text+0x9): undefined reference to `f'\n"
+    'collect2: error: ld returned 1 exit status\n'
+)
+MISSING_SEMICOLON = 'int main(){\n  int a = 1\n  return a;\n}\n'
+
+needs_gcc = pytest.mark.skipif(shutil.which('gcc') is None, reason='needs gcc')
+# Every test compiling with gcc runs with its best format and with plain text
+formats = pytest.mark.parametrize('plain_text', [False, True], ids=['format', 'text'])
+
+
+def compile_errors(source, plain_text=False):
+    """Compile a source the way compile_source does and return gcc's stderr."""
+    flags = () if plain_text else diagnostics_flags()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'main.c')
+        with open(path, 'w') as file:
+            file.write(source)
+        process = subprocess.run(['gcc', *flags, path, '-o', path + '.out'],
+                                 capture_output=True, text=True, env={**os.environ, 'LC_ALL': 'C'})
+    assert process.returncode != 0
+    return process.stderr
+
+
+def test_recorded_json():
+    (diagnostic,) = parse_gcc_output(RECORDED)
+    assert (diagnostic.kind, diagnostic.file, diagnostic.line, diagnostic.column) == ('error', 'd.c', 3, 3)
+    assert diagnostic.is_error
+    rendered = render_diagnostics([diagnostic], MISSING_SEMICOLON).splitlines()
+    assert rendered == [
+        "d.c:3:3: error: expected ',' or ';' before 'return'",
+        '    3 |   return a;',
+        '      |   ^',
+    ]
+    assert local_hints([diagnostic]).startswith('Line 3: A statement or declaration is not finished.')
+
+
+def test_recorded_sarif():
+    error, undefined = parse_gcc_output(RECORDED_SARIF)
+    assert (error.kind, error.file, error.line, error.column) == ('error', 'd.c', 3, 3)
+    assert error.option is None
+    assert undefined.message == "undefined reference to `f'"
+    assert local_hints([error]).startswith('Line 3: A statement or declaration is not finished.')
+
+
+def test_recorded_text():
+    stderr = (
+        "d.c: In function 'main':\n"
+        "d.c:2:3: warning: implicit declaration of function 'printf' [-Wimplicit-function-declaration]\n"
+        '    2 |   printf("%d", 1);\n'
+        '      |   ^~~~~~\n'
+        "d.c:1:1: note: include '<stdio.h>' or provide a declaration of 'printf'\n"
+        '  +++ |+#include <stdio.h>\n'
+        "cc1: fatal error: d.h: No such file or directory\n"
+    )
+    warning, fatal = parse_gcc_output(stderr)
+    assert (warning.kind, warning.line, warning.column) == ('warning', 2, 3)
+    assert warning.option == '-Wimplicit-function-declaration'
+    assert [(note.kind, note.line) for note in warning.children] == [('note', 1)]
+    assert (fatal.kind, fatal.file, fatal.line, fatal.message) == (
+        'fatal error', 'cc1', None, 'd.h: No such file or directory')
+
+
+def test_format_is_probed_once(monkeypatch):
+    calls = []
+    diagnostics_flags.cache_clear()
+    monkeypatch.setattr(subprocess, 'run', lambda args, **kwargs: calls.append(args[1]) or
+                        subprocess.CompletedProcess(args, 0 if 'sarif' in args[1] else 1))
+    assert diagnostics_flags() == ('-fdiagnostics-format=sarif-stderr',)
+    assert diagnostics_flags() == ('-fdiagnostics-format=sarif-stderr',)
+    assert calls == ['-fdiagnostics-format=json', '-fdiagnostics-format=sarif-stderr']
+
+    diagnostics_flags.cache_clear()
+    monkeypatch.setattr(subprocess, 'run', lambda args, **kwargs: subprocess.CompletedProcess(args, 1))
+    assert diagnostics_flags() == ()
+    diagnostics_flags.cache_clear()
+
+
+@needs_gcc
+@formats
+def test_missing_semicolon(plain_text):
+    diagnostics = parse_gcc_output(compile_errors(MISSING_SEMICOLON, plain_text))
+    assert [d.line for d in diagnostics if d.is_error] == [3]
+    assert 'semicolon' in local_hints(diagnostics)
+
+
+@needs_gcc
+@formats
+def test_warnings_and_notes_are_kept(plain_text):
+    source = 'int main(){\n  printf("%d", 1);\n  return x;\n}\n'
+    diagnostics = parse_gcc_output(compile_errors(source, plain_text))
+    kinds = {d.kind for d in diagnostics} | {c.kind for d in diagnostics for c in d.children}
+    assert {'warning', 'error', 'note'} <= kinds
+    hints = local_hints(diagnostics)
+    assert '#include <stdio.h>' in hints
+    assert "'x' is used but never declared" in hints
+
+
+@needs_gcc
+@formats
+def test_linker_errors(plain_text):
+    """The linker prints plain text next to the diagnostics; undefined references still get a hint."""
+    diagnostics = parse_gcc_output(compile_errors('int f(void);\nint main(){ return f(); }\n', plain_text))
+    assert [d.message for d in diagnostics] == ['undefined reference to `f\'']
+    assert local_hints(diagnostics) is not None
+
+
+@needs_gcc
+@formats
+def test_unexplained_error_falls_back_to_llm(plain_text):
+    diagnostics = parse_gcc_output(compile_errors('int main(){ int a[2]; a = 0; return 0; }\n', plain_text))
+    assert diagnostics and local_hints(diagnostics) is None
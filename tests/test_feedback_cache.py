@@ -0,0 +1,85 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import threading
+from collections import OrderedDict
+
+import pytest
+
+import feedback_cache
+from feedback_cache import feedback_key, get_cache_stats, get_feedback, put_feedback
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    """An empty cache with its SQLite store in a temporary directory."""
+    monkeypatch.setattr(feedback_cache, 'FEEDBACK_CACHE_PATH', str(tmp_path / 'feedback.sqlite3'))
+    monkeypatch.setattr(feedback_cache, 'FEEDBACK_CACHE_MEMORY_ENTRIES', 2)
+    monkeypatch.setattr(feedback_cache, '_memory', OrderedDict())
+    monkeypatch.setattr(feedback_cache, '_stats', dict.fromkeys(feedback_cache._stats, 0))
+    monkeypatch.setattr(feedback_cache, '_local', threading.local())
+
+
+def test_key_covers_kind_model_and_prompt():
+    key = feedback_key('code', 'model', 'prompt')
+    assert feedback_key('code', 'model', 'prompt') == key
+    assert feedback_key('compilation', 'model', 'prompt') != key
+    assert feedback_key('code', 'other model', 'prompt') != key
+    assert feedback_key('code', 'model', 'other prompt') != key
+    # Parts are separated, so moving text between them changes the key
+    assert feedback_key('code', 'modelp', 'rompt') != key
+
+
+def test_miss_then_memory_hit():
+    key = feedback_key('code', 'model', 'prompt')
+    assert get_feedback(key) is None
+    put_feedback(key, 'code', 'Looks fine.', latency=2.0)
+    assert get_feedback(key) == 'Looks fine.'
+    stats = get_cache_stats()
+    assert (stats['misses'], stats['memory_hits'], stats['disk_hits']) == (1, 1, 0)
+    assert stats['saved_seconds'] == 2.0
+    assert stats['hit_rate'] == 0.5
+
+
+def test_disk_hit_is_promoted_to_memory():
+    """Another process, or this one after a restart, finds the feedback in SQLite."""
+    key = feedback_key('code', 'model', 'prompt')
+    put_feedback(key, 'code', 'Looks fine.', latency=1.0)
+    feedback_cache._memory.clear()
+
+    assert get_feedback(key) == 'Looks fine.'
+    assert key in feedback_cache._memory
+    assert get_feedback(key) == 'Looks fine.'
+    stats = get_cache_stats()
+    assert (stats['memory_hits'], stats['disk_hits']) == (1, 1)
+
+
+def test_memory_evicts_least_recently_used():
+    first, second, third = (feedback_key('code', 'model', str(n)) for n in range(3))
+    put_feedback(first, 'code', 'first', 0)
+    put_feedback(second, 'code', 'second', 0)
+    get_feedback(first)  # now second is the least recently used
+    put_feedback(third, 'code', 'third', 0)
+
+    assert list(feedback_cache._memory) == [first, third]
+    # Evicted from memory only; the store still has it
+    assert get_feedback(second) == 'second'
+    assert get_cache_stats()['disk_hits'] == 1
+
+
+def test_expired_feedback_is_a_miss(monkeypatch):
+    key = feedback_key('code', 'model', 'prompt')
+    put_feedback(key, 'code', 'Looks fine.', 0)
+    monkeypatch.setattr(feedback_cache, 'FEEDBACK_CACHE_TTL', -1)
+    assert get_feedback(key) is None
+    assert key not in feedback_cache._memory
+    assert get_cache_stats()['misses'] == 1
+
+
+def test_unreadable_store_is_a_miss(tmp_path, monkeypatch):
+    monkeypatch.setattr(feedback_cache, 'FEEDBACK_CACHE_PATH', str(tmp_path))  # a directory
+    key = feedback_key('code', 'model', 'prompt')
+    put_feedback(key, 'code', 'Looks fine.', 0)
+    feedback_cache._memory.clear()
+    assert get_feedback(key) is None
+    assert get_cache_stats()['errors'] == 2
@@ -0,0 +1,93 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import json
+
+import pytest
+
+import feedback_stream
+from feedback_stream import start_session, stream_feedback, take_session
+from llm import CodeContext
+
+
+def events(session):
+    """Split the SSE messages of a session into (event, data) pairs."""
+    parsed = []
+    for message in stream_feedback(session):
+        assert message.endswith('\n\n')
+        name, data = message[:-2].split('\n')
+        assert name.startswith('event: ') and data.startswith('data: ')
+        parsed.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return parsed
+
+
+@pytest.fixture(autouse=True)
+def llm(monkeypatch):
+    """Answer the feedback prompts locally, streaming them in two pieces."""
+    def streamed(text, on_token):
+        for piece in (text[:4], text[4:]):
+            on_token(piece)
+        return {'status': 'success', 'feedback': text}
+
+    def code_feedback(filepath, on_token=None, source=None):
+        analysis = streamed('Review of ' + source, on_token)
+        return dict(analysis, context=CodeContext(source, analysis['feedback']))
+
+    monkeypatch.setattr(feedback_stream, 'get_code_feedback', code_feedback)
+    monkeypatch.setattr(feedback_stream, 'get_compilation_feedback',
+                        lambda context, errors, on_token=None, question_id=None:
+                        streamed('Fix ' + errors, on_token))
+    monkeypatch.setattr(feedback_stream, 'get_runtime_feedback',
+                        lambda context, errors, test_input, on_token=None, question_id=None:
+                        streamed(f'Crash on {test_input}', on_token))
+    monkeypatch.setattr(feedback_stream, 'get_batch_test_case_feedback',
+                        lambda context, mismatches: {'status': 'success',
+                                                     'feedback': [f'Expected {m[2]}' for m in mismatches]})
+
+
+def test_review_streams_then_ends():
+    session = start_session(1, 'int main;')
+    assert events(session) == [
+        ('review', {'delta': 'Revi'}),
+        ('review', {'delta': 'ew of int main;'}),
+        ('review_done', {'text': 'Review of int main;'}),
+        ('done', {}),
+    ]
+
+
+def test_compilation_hint_follows_the_review():
+    session = start_session(1, 'x')
+    session.error_type, session.errors = 'compilation', 'missing ;'
+    names = [name for name, _ in events(session)]
+    assert names == ['review', 'review', 'review_done', 'hint', 'hint', 'hint_done', 'done']
+
+
+def test_runtime_hint():
+    session = start_session(1, 'x')
+    session.error_type, session.errors, session.test_input = 'runtime', 'Segmentation fault', '1 2'
+    assert ('hint_done', {'text': 'Crash on 1 2'}) in events(session)
+
+
+def test_mismatch_hints_come_in_one_event():
+    session = start_session(1, 'x')
+    session.mismatches = [(0, '1 2', '2', '3'), (2, '2 2', '0', '4')]
+    hints = [data for name, data in events(session) if name == 'hints']
+    assert hints == [{'hints': {'0': 'Expected 3', '2': 'Expected 4'}}]
+
+
+def test_failure_still_ends_the_stream(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('model unavailable')
+
+    monkeypatch.setattr(feedback_stream, 'get_code_feedback', fail)
+    assert events(start_session(1, 'x')) == [
+        ('failed', {'message': 'Unable to load feedback.'}),
+        ('done', {}),
+    ]
+
+
+def test_session_is_taken_once_by_its_student():
+    session = start_session(1, 'x')
+    assert take_session(session.id, 2) is None
+    assert take_session(session.id, 1) is session
+    assert take_session(session.id, 1) is None
@@ -0,0 +1,302 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from datetime import date
+
+# The gradebook tests run against their own in-memory database
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+os.environ.setdefault('SECRET_KEY', 'test')
+
+import pytest
+from sqlalchemy import event
+from app import app, check_and_insert_teacher
+import models
+import routes
+from models import db, Teacher, Student, Assignment, Question, Submission
+
+
+def add_cohort(num_students, num_assignments):
+    """Add students and assignments, each student with one submission per assignment."""
+    assignments = []
+    for idx in range(num_assignments):
+        assignment = Assignment(topic=f'Topic {idx}', date1=date(2024, 1, 1), date2=date(2024, 1, 2),
+                                due_date1=date(2024, 1, 8), due_date2=date(2024, 1, 9),
+                                total_marks=10, num_questions=1)
+        question = Question(assignment=assignment, question='Add two numbers', marks=10)
+        testcase = models.Testcase(question=question, case='1;2', output='3')
+        db.session.add_all([assignment, question, testcase])
+        assignments.append((assignment, question, testcase))
+    for idx in range(num_students):
+        student = Student(roll=f'R{num_students}_{idx}', name=f'Student {idx}', group='A1' if idx % 2 else 'A2',
+                          email_id=f's{num_students}_{idx}@example.com', password='x')
+        db.session.add(student)
+        db.session.flush()
+        for assignment, question, testcase in assignments:
+            db.session.add(Submission(st_id=student.id, ass_id=assignment.id, ques_id=question.id,
+                                      test_case_id=testcase.id, date=date(2024, 1, 3), marks=5))
+    db.session.commit()
+
+
+def gradebook_query_count():
+    """Load the gradebook as a teacher and return how many SQL statements it ran."""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    client = app.test_client()
+    with app.app_context():
+        teacher = Teacher.query.first()
+        event.listen(db.engine, 'before_cursor_execute', count)
+    with client.session_transaction() as session:
+        session['_user_id'] = f'teacher:{teacher.id}'
+        session['_fresh'] = True
+    try:
+        response = client.get('/view_all_student_marks')
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_gradebook_query_count_is_constant():
+    """The gradebook must not run a query per student or per assignment."""
+    with app.app_context():
+        db.create_all()
+        # Otherwise the first request inserts the default teacher
+        check_and_insert_teacher()
+        add_cohort(2, 2)
+    small = gradebook_query_count()
+
+    with app.app_context():
+        add_cohort(20, 6)
+    large = gradebook_query_count()
+
+    assert large == small
+
+
+def test_scores_count_latest_attempt():
+    """Resubmitting or regrading a test case replaces its marks in the total."""
+    from scores import get_gradebook, rebuild_scores
+
+    with app.app_context():
+        db.create_all()
+        add_cohort(1, 1)
+        student = Student.query.order_by(Student.id.desc()).first()
+        first = Submission.query.filter_by(st_id=student.id).one()
+        key = (student.id, first.ass_id)
+        assert get_gradebook([student.id])[key] == 5
+
+        # A second attempt supersedes the first
+        db.session.add(Submission(st_id=student.id, ass_id=first.ass_id, ques_id=first.ques_id,
+                                  test_case_id=first.test_case_id, date=date(2024, 1, 4), marks=8))
+        db.session.commit()
+        assert get_gradebook([student.id])[key] == 8
+
+        # Regrading the older attempt does not change the total
+        first.marks = 0
+        db.session.commit()
+        assert get_gradebook([student.id])[key] == 8
+
+        latest = Submission.query.filter_by(st_id=student.id).order_by(Submission.id.desc()).first()
+        latest.marks = 10
+        db.session.commit()
+        assert get_gradebook([student.id])[key] == 10
+
+        incremental = get_gradebook()
+        rebuild_scores()
+        assert get_gradebook() == incremental
+
+
+def test_group_csv_is_streamed():
+    """The group export streams its rows, gzipped when the client accepts it."""
+    import gzip
+
+    with app.app_context():
+        db.create_all()
+        check_and_insert_teacher()
+        add_cohort(4, 2)
+        teacher = Teacher.query.first()
+        roster = [student.roll for student in Student.query.filter_by(group='A1').order_by(Student.id)]
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = f'teacher:{teacher.id}'
+        session['_fresh'] = True
+    response = client.get('/download_group_csv/1', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.get_data()).decode().splitlines()
+    assert [line.split(',')[2] for line in lines[1:]] == roster
+
+
+@pytest.fixture(scope='module')
+def export_cohort():
+    with app.app_context():
+        db.create_all()
+        check_and_insert_teacher()
+        add_cohort(6, 1)
+        return Teacher.query.first().id, Student.query.filter_by(group='A1').count()
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 500])
+def test_group_csv_is_sent_in_batches(monkeypatch, export_cohort, batch_size):
+    """Every EXPORT_BATCH_SIZE rows are sent as one chunk, the header with the first."""
+    teacher_id, num_rows = export_cohort
+    monkeypatch.setattr(routes, 'EXPORT_BATCH_SIZE', batch_size)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = f'teacher:{teacher_id}'
+        session['_fresh'] = True
+    response = client.get('/download_group_csv/1')
+    chunks = [chunk.decode() for chunk in response.response]
+    rows_per_chunk = [chunk.count('\n') for chunk in chunks]
+    expected = [batch_size] * (num_rows // batch_size) + ([num_rows % batch_size] if num_rows % batch_size else [])
+    expected[0] += 1  # the header
+    assert rows_per_chunk == expected
+
+
+def add_assignment(student, num_questions, num_testcases):
+    """Add an assignment the student attempted twice, scoring 1 then 2 per test case."""
+    assignment = Assignment(topic='Loops', date1=date(2024, 1, 1), date2=date(2024, 1, 2),
+                            due_date1=date(2100, 1, 8), due_date2=date(2100, 1, 9),
+                            total_marks=10, num_questions=num_questions)
+    db.session.add(assignment)
+    for idx in range(num_questions):
+        question = Question(assignment=assignment, question=f'Question {idx}', marks=10)
+        testcases = [models.Testcase(question=question, case=str(num), output=str(num))
+                     for num in range(num_testcases)]
+        db.session.add_all([question] + testcases)
+        db.session.flush()
+        for marks in (1, 2):
+            db.session.add_all([Submission(st_id=student.id, ass_id=assignment.id, ques_id=question.id,
+                                           test_case_id=testcase.id, date=date(2024, 1, 3), marks=marks)
+                                for testcase in testcases])
+    db.session.commit()
+    return assignment.id
+
+
+def test_assignment_page_query_count_is_constant():
+    """A student's assignment page loads the latest attempts without a query per test case."""
+    with app.app_context():
+        db.create_all()
+        check_and_insert_teacher()
+        student = Student(roll='R_page', name='Page Student', group='A1',
+                          email_id='page@example.com', password='x')
+        db.session.add(student)
+        db.session.flush()
+        student_id = student.id
+        small_id = add_assignment(student, 1, 1)
+        large_id = add_assignment(student, 4, 5)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = f'student:{student_id}'
+        session['_fresh'] = True
+
+    def page_query_count(assignment_id):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            response = client.get(f'/view_assignment_student/{assignment_id}')
+        finally:
+            with app.app_context():
+                event.remove(db.engine, 'before_cursor_execute', count)
+        assert response.status_code == 200
+        return len(statements), response.get_data(as_text=True)
+
+    small, _ = page_query_count(small_id)
+    large, page = page_query_count(large_id)
+    assert large == small
+    # Only the latest attempt at each of the 20 test cases counts
+    assert page.count('<strong>Marks:</strong> 2') == 20
+    assert '<strong>Total Marks Gained:</strong> 40' in page
+
+
+def test_scores_follow_question_changes():
+    """Deleting a test case updates the totals; changing a question's marks keeps the graded marks."""
+    from scores import get_gradebook, rebuild_scores
+
+    with app.app_context():
+        db.create_all()
+        student = Student(roll='R_edit', name='Edit Student', group='A1',
+                          email_id='edit@example.com', password='x')
+        db.session.add(student)
+        db.session.flush()
+        assignment_id = add_assignment(student, 1, 2)  # 2 marks on each test case
+        key = (student.id, assignment_id)
+        assert get_gradebook([student.id])[key] == 4
+
+        question = Question.query.filter_by(ass_id=assignment_id).one()
+        question.marks = 20
+        db.session.commit()
+        assert get_gradebook([student.id])[key] == 4
+        assert {submission.marks for submission in Submission.query.filter_by(ques_id=question.id)} == {1, 2}
+
+        db.session.delete(question.testcases[0])
+        db.session.commit()
+        assert get_gradebook([student.id])[key] == 2
+
+        incremental = get_gradebook()
+        rebuild_scores()
+        assert get_gradebook() == incremental
+
+        db.session.delete(Assignment.query.get(assignment_id))
+        db.session.commit()
+        assert key not in get_gradebook([student.id])
+
+
+def test_scores_of_interleaved_sessions(tmp_path):
+    """Two sessions writing the same total at once both end up counted."""
+    import threading
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from scores import _scores, _totals
+
+    engine = create_engine(f'sqlite:///{tmp_path}/scores.db', connect_args={'timeout': 10})
+    db.metadata.create_all(engine)
+    with Session(engine) as session:
+        student = Student(roll='R_race', name='Race Student', group='A1',
+                          email_id='race@example.com', password='x')
+        assignment = Assignment(topic='Race', total_marks=10, num_questions=1)
+        question = Question(assignment=assignment, question='Race', marks=10)
+        testcases = [models.Testcase(question=question, case=str(num), output=str(num)) for num in range(2)]
+        session.add_all([student, assignment, question] + testcases)
+        session.commit()
+        ids = dict(st_id=student.id, ass_id=assignment.id, ques_id=question.id, date=date(2024, 1, 3))
+        testcase_ids = [testcase.id for testcase in testcases]
+
+    def interleave(first_attempt, second_attempt):
+        """Write (test case id, marks) attempts; the second while the first is still uncommitted."""
+        first = Session(engine)
+        first.add(Submission(test_case_id=first_attempt[0], marks=first_attempt[1], **ids))
+        first.flush()
+
+        def second():
+            with Session(engine) as session:
+                session.add(Submission(test_case_id=second_attempt[0], marks=second_attempt[1], **ids))
+                session.commit()
+
+        thread = threading.Thread(target=second)
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()  # waiting for the first session's transaction
+        first.commit()
+        first.close()
+        thread.join()
+        with engine.connect() as connection:
+            stored = connection.execute(_scores.select().with_only_columns(_scores.c.marks)).scalar()
+            assert stored == connection.execute(_totals()).one()[2]
+            return stored
+
+    # Different test cases: both attempts count
+    assert interleave((testcase_ids[0], 3), (testcase_ids[1], 4)) == 7
+    # The same test case: only the later attempt counts
+    assert interleave((testcase_ids[0], 5), (testcase_ids[0], 1)) == 5
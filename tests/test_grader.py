@@ -0,0 +1,39 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import time
+from concurrent.futures import Future
+
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+import app  # noqa: F401 - grader is imported by the app's routes
+from grader import CODE_FEEDBACK_FAILED, review_context
+from llm import CodeContext
+
+
+def review(source='int main;'):
+    future = Future()
+    future.source = source
+    return future
+
+
+def test_finished_review_gives_its_context():
+    finished = review()
+    context = CodeContext('int main;', 'Looks fine.')
+    finished.set_result({'status': 'success', 'feedback': 'Looks fine.', 'context': context})
+    assert review_context(finished, timeout=0) is context
+
+
+def test_stuck_review_falls_back_to_the_code():
+    started = time.monotonic()
+    context = review_context(review(), timeout=0.1)
+    assert time.monotonic() - started < 1
+    assert (context.code_content, context.code_analysis) == ('int main;', CODE_FEEDBACK_FAILED)
+
+
+def test_failed_review_falls_back_to_the_code():
+    failed = review()
+    failed.set_exception(RuntimeError('model unavailable'))
+    context = review_context(failed, timeout=0)
+    assert (context.code_content, context.code_analysis) == ('int main;', CODE_FEEDBACK_FAILED)
@@ -0,0 +1,182 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import hashlib
+import io
+import shutil
+import tempfile
+import uuid
+from datetime import date
+from types import SimpleNamespace
+
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+import pytest
+
+from app import app
+import compile_cache
+import grader
+import models
+import routes  # noqa: F401 - registers the routes
+from llm import CodeContext
+from models import db, Assignment, Question, Student
+
+pytestmark = pytest.mark.skipif(shutil.which('gcc') is None or shutil.which('prlimit') is None,
+                                reason='needs gcc and prlimit')
+
+ADD = '#include <stdio.h>\nint main(){int a, b; scanf("%d %d", &a, &b); printf("%d", a + b); return 0;}\n'
+MISSING_SEMICOLON = 'int main(){\n  int a = 1\n  return a;\n}\n'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A logged in student, with uploads and binaries where the run user can read them."""
+    directory = tempfile.mkdtemp()
+    os.chmod(directory, 0o755)
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', directory)
+    monkeypatch.setattr(compile_cache, 'COMPILE_CACHE_DIR', os.path.join(directory, 'cache'))
+    # The in-memory test database shares one connection between threads, so
+    # jobs are run by wait_for rather than racing the requests' transactions
+    queued = []
+    monkeypatch.setattr(grader, '_executor', SimpleNamespace(
+        submit=lambda function, *args: queued.append((function, args))))
+    # The code review and hints come from the LLM; answer them locally
+    monkeypatch.setattr(grader, 'get_code_feedback', lambda filepath, source=None: {
+        'status': 'success', 'feedback': 'Looks fine.', 'context': CodeContext(source, 'Looks fine.')})
+    monkeypatch.setattr(grader, 'get_compilation_feedback', lambda *args, **kwargs: {
+        'status': 'success', 'feedback': 'Check the syntax.'})
+    monkeypatch.setattr(grader, 'get_batch_test_case_feedback', lambda context, mismatches: {
+        'status': 'success', 'feedback': ['Check the sum.'] * len(mismatches)})
+
+    with app.app_context():
+        db.create_all()
+        name = uuid.uuid4().hex
+        student = Student(roll=f'R_job_{name}', name='Job Student', group='A1',
+                          email_id=f'job_{name}@example.com', password='x')
+        assignment = Assignment(topic='Jobs', date1=date(2024, 1, 1), date2=date(2024, 1, 2),
+                                due_date1=date(2100, 1, 8), due_date2=date(2100, 1, 9),
+                                total_marks=10, num_questions=1)
+        question = Question(assignment=assignment, question='Add two numbers', marks=10)
+        question.testcases = [models.Testcase(case='1;2', output='3'), models.Testcase(case='2;2', output='4')]
+        db.session.add_all([student, assignment, question])
+        db.session.commit()
+        ids = SimpleNamespace(student=student.id, assignment=assignment.id, question=question.id)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = f'student:{ids.student}'
+        session['_fresh'] = True
+    client.ids, client.queued = ids, queued
+    yield client
+    shutil.rmtree(directory)
+
+
+def upload(client, source):
+    """Submit a source file and return the id of the grading job it queued."""
+    ids = client.ids
+    response = client.post(f'/upload_submission/{ids.question}/{ids.assignment}',
+                           data={'file': (io.BytesIO(source.encode()), 'main.c')})
+    assert response.status_code == 302
+    (job,) = [job for job in grader.get_latest_jobs(ids.student, ids.assignment).values()]
+    return job.id
+
+
+def wait_for(client, job_id):
+    """Run the queued jobs, then return the JSON status of this one."""
+    assert grader.get_job(job_id).status == 'queued'
+    while client.queued:
+        function, args = client.queued.pop(0)
+        function(*args)
+    return client.get(f'/grading_status/{job_id}?format=json').get_json()
+
+
+def test_job_grades_every_testcase(client):
+    """An upload is queued, graded in the background and stored one Submission per test case."""
+    job_id = upload(client, ADD)
+    # The page refreshes itself while the job is waiting
+    page = client.get(f'/view_assignment_student/{client.ids.assignment}').get_data(as_text=True)
+    assert 'http-equiv="refresh"' in page
+    status = wait_for(client, job_id)
+    assert status['status'] == 'done'
+    assert (status['error_type'], status['error_message']) == (None, None)
+    assert (status['assignment_id'], status['question_id']) == (client.ids.assignment, client.ids.question)
+    assert status['marks'] == 10
+    assert [(tc['status'], tc['marks']) for tc in status['testcases']] == [('passed', 5), ('passed', 5)]
+    assert status['finished_at'] >= status['created_at']
+
+    with app.app_context():
+        submissions = models.Submission.query.filter_by(st_id=client.ids.student).all()
+        assert sorted(float(submission.marks) for submission in submissions) == [5, 5]
+        assert all('Looks fine.' in submission.feedback for submission in submissions)
+        assert all(submission.source_file for submission in submissions)
+
+    page = client.get(f'/view_assignment_student/{client.ids.assignment}').get_data(as_text=True)
+    assert '<strong>Total Marks Gained:</strong> 10' in page
+
+
+def test_wrong_answer_scores_zero_on_that_testcase(client):
+    """A mismatch scores 0 on that test case and gets the batched mismatch feedback."""
+    job_id = upload(client, ADD.replace('a + b', 'a * b'))
+    status = wait_for(client, job_id)
+    assert status['status'] == 'done'
+    assert [(tc['status'], tc['marks']) for tc in status['testcases']] == [('failed', 0), ('passed', 5)]
+    with app.app_context():
+        feedback = {float(submission.marks): submission.feedback
+                    for submission in models.Submission.query.filter_by(st_id=client.ids.student)}
+    assert feedback[0].endswith('Check the sum.')
+
+
+def test_status_of_another_students_job_is_hidden(client):
+    job_id = upload(client, ADD)
+    wait_for(client, job_id)
+    with app.app_context():
+        other = Student(roll='R_job_other', name='Other Student', group='A1',
+                        email_id='job_other@example.com', password='x')
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+    with client.session_transaction() as session:
+        session['_user_id'] = f'student:{other_id}'
+    assert client.get(f'/grading_status/{job_id}?format=json').status_code == 404
+
+
+def test_failed_job_is_shown_on_the_assignment_page(client):
+    """A compile error stores no Submission; the page shows it instead."""
+    job_id = upload(client, MISSING_SEMICOLON)
+    with client.session_transaction() as session:
+        (category, message), = session['_flashes']
+    assert f'/grading_status/{job_id}' in message
+
+    status = wait_for(client, job_id)
+    assert (status['status'], status['error_type']) == ('failed', 'compilation')
+
+    page = client.get(f'/view_assignment_student/{client.ids.assignment}').get_data(as_text=True)
+    assert 'Compilation Error' in page
+    assert "expected &#39;,&#39; or &#39;;&#39; before &#39;return&#39;" in page
+    assert f'/grading_status/{job_id}' in page
+    assert 'http-equiv="refresh"' not in page
+
+
+def test_runs_record_their_telemetry(client):
+    """Fresh runs store resource usage; a cached rerun only stores the output summary."""
+    source = ADD + f'/* {uuid.uuid4().hex} */\n'  # not run by any earlier test
+    for _ in range(2):
+        assert wait_for(client, upload(client, source))['status'] == 'done'
+
+    with app.app_context():
+        submissions = (models.Submission.query.filter_by(st_id=client.ids.student)
+                       .order_by(models.Submission.test_case_id, models.Submission.id).all())
+        # Each test case was run by the first upload and reused by the second
+        fresh, cached = submissions[0::2], submissions[1::2]
+        for submission in fresh:
+            telemetry = submission.telemetry
+            assert telemetry.wall_time > 0 and telemetry.max_rss_kb > 0
+            assert telemetry.user_time is not None and telemetry.sys_time is not None
+        for submission in cached:
+            assert submission.telemetry.wall_time is None and submission.telemetry.max_rss_kb is None
+        summaries = [(s.output, s.telemetry.output_size, s.telemetry.output_digest) for s in submissions]
+        assert summaries == [
+            (output, len(output), hashlib.sha256(output.encode()).hexdigest())
+            for output in ('3', '3', '4', '4')
+        ]
@@ -0,0 +1,119 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import tempfile
+from datetime import date
+
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+from flask import Flask
+from flask_migrate import Migrate, check, downgrade, upgrade
+from sqlalchemy import func, select
+import app as portal
+import models
+from models import db, Assignment, Question, Submission, StudentAssignmentScore
+
+# The migrations are applied to a database of their own, so the indexes
+# checked below are the ones a deployed database gets from `flask db upgrade`
+database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+migrated = Flask(__name__)
+migrated.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database.name}'
+db.init_app(migrated)
+Migrate(migrated, db, directory=portal.migrate.directory)
+
+
+def query_plan(statement):
+    """Return SQLite's EXPLAIN QUERY PLAN of a statement as one string."""
+    sql = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}'))
+    return '\n'.join(row[-1] for row in rows)
+
+
+def setup_module():
+    with migrated.app_context():
+        upgrade()
+
+
+def teardown_module():
+    with migrated.app_context():
+        db.engine.dispose()
+    os.unlink(database.name)
+
+
+def test_migrations_match_models():
+    """The head revision builds exactly the schema the models describe."""
+    with migrated.app_context():
+        check()
+
+
+def test_latest_attempt_uses_index():
+    """Latest attempt at a test case, as looked up when submissions are written."""
+    statement = (
+        select(Submission.marks)
+        .where(Submission.st_id == 1, Submission.ques_id == 2,
+               Submission.test_case_id == 3, Submission.id < 100)
+        .order_by(Submission.id.desc())
+        .limit(1)
+    )
+    with migrated.app_context():
+        plan = query_plan(statement)
+    assert 'INDEX ix_submission_st_id_ques_id_test_case_id_id (st_id=? AND ques_id=? AND test_case_id=?' in plan
+    assert 'TEMP B-TREE' not in plan  # ordered by the index, no sort
+
+
+def test_student_assignment_uses_index():
+    """A student's submissions for an assignment, as on their assignment page."""
+    statement = select(Submission.id, Submission.marks).where(
+        Submission.st_id == 1, Submission.ass_id == 2)
+    with migrated.app_context():
+        plan = query_plan(statement)
+    assert 'INDEX ix_submission_st_id_ass_id (st_id=? AND ass_id=?)' in plan
+
+
+def test_released_assignments_use_date_indexes():
+    """The dashboard lists the assignments released to the student's group."""
+    with migrated.app_context():
+        for column, index in ((Assignment.date1, 'ix_assignment_date1'),
+                              (Assignment.date2, 'ix_assignment_date2')):
+            plan = query_plan(select(Assignment.id).where(column <= date(2024, 1, 1)))
+            assert f'INDEX {index}' in plan
+
+
+def test_foreign_keys_use_indexes():
+    """Children are looked up by their parent's id without a table scan."""
+    lookups = [
+        (select(Question.id).where(Question.ass_id == 1), 'ix_question_ass_id'),
+        (select(models.Testcase.id).where(models.Testcase.ques_id == 1), 'ix_testcase_ques_id'),
+        (select(Submission.id).where(Submission.ass_id == 1), 'ix_submission_ass_id'),
+        (select(Submission.id).where(Submission.ques_id.in_([1, 2])), 'ix_submission_ques_id'),
+        (select(Submission.id).where(Submission.test_case_id == 1), 'ix_submission_test_case_id'),
+        (select(func.count(StudentAssignmentScore.id)).where(StudentAssignmentScore.ass_id == 1),
+         'ix_student_assignment_score_ass_id'),
+    ]
+    with migrated.app_context():
+        for statement, index in lookups:
+            plan = query_plan(statement)
+            assert f'INDEX {index}' in plan, plan
+
+
+def test_upgrade_from_initial_schema_backfills_totals():
+    """A database made by db.create_all() before this series upgrades in place."""
+    with migrated.app_context():
+        downgrade(revision='19ec23388b18')
+        for statement in (
+            "INSERT INTO assignment (id, topic) VALUES (1, 'Loops')",
+            "INSERT INTO question (id, ass_id, question, marks) VALUES (1, 1, 'Sum', 10)",
+            "INSERT INTO testcase (id, ques_id, \"case\", output) VALUES (1, 1, '1', '1')",
+            "INSERT INTO student (id, roll, name, email_id, password) VALUES (1, 'R1', 'S', 'e', 'p')",
+            "INSERT INTO submission (st_id, ass_id, ques_id, test_case_id, marks) VALUES (1, 1, 1, 1, 3)",
+            "INSERT INTO submission (st_id, ass_id, ques_id, test_case_id, marks) VALUES (1, 1, 1, 1, 7)",
+        ):
+            db.session.execute(db.text(statement))
+        db.session.commit()
+        db.session.remove()
+
+        upgrade()
+        check()
+        assert db.session.query(StudentAssignmentScore.marks).scalar() == 7
+        assert db.session.query(models.Testcase.compare_mode).scalar() == 'exact'
@@ -0,0 +1,119 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+import feedback_cache
+import llm
+from circuit_breaker import CLOSED, OPEN, CircuitBreaker
+from llm import CodeAnalyzer, LLMUnavailable, parse_hints
+
+UNANALYZED = 'Unable to analyze test case mismatch.'
+
+
+def test_hints_by_testcase_number():
+    text = 'Here you go:\n[{"testcase": 2, "hint": "Print a newline."}, {"testcase": 1, "hint": "Add, not multiply."}]\nDone.'
+    assert parse_hints(text, 2) == ['  Add, not multiply.', '  Print a newline.']
+
+
+def test_missing_and_unusable_items_keep_the_default():
+    text = '[{"testcase": 3, "hint": "Check the loop bound."}, "not an object", {"testcase": 1}, {"testcase": 9, "hint": "x"}]'
+    assert parse_hints(text, 3) == [UNANALYZED, UNANALYZED, '  Check the loop bound.']
+
+
+def test_position_is_used_without_a_number():
+    text = '[{"hint": "First."}, {"testcase": "two", "hint": "Second."}]'
+    assert parse_hints(text, 2) == ['  First.', '  Second.']
+
+
+@pytest.mark.parametrize('text', ['No hints today.', '] backwards [', '[{"testcase": 1, "hint": }]'])
+def test_response_without_a_json_array_is_rejected(text):
+    with pytest.raises(ValueError):
+        parse_hints(text, 1)
+
+
+class TestHedging:
+    """A late large-tier request is raced against the fast tier."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(feedback_cache, 'FEEDBACK_CACHE_PATH', str(tmp_path / 'feedback.sqlite3'))
+        monkeypatch.setattr(feedback_cache, '_memory', OrderedDict())
+        monkeypatch.setattr(feedback_cache, '_local', threading.local())
+        monkeypatch.setattr(llm, 'LLM_HEDGE_AFTER', 0.05)
+        monkeypatch.setattr(llm, '_breaker', CircuitBreaker(failure_threshold=2, cooldown=60))
+        monkeypatch.setattr(llm, '_hedge_stats', {'hedged': 0, 'fast_wins': 0})
+
+    @staticmethod
+    def model(name, delay=0.0, fails=False):
+        """A stand-in chat model answering with its own name after a delay."""
+        def respond(prompt_value):
+            runnable.calls += 1
+            time.sleep(delay)
+            if fails:
+                raise RuntimeError(f'{name} failed')
+            return AIMessage(content=f'Answer of {name}')
+
+        runnable = RunnableLambda(respond)
+        runnable.model, runnable.temperature, runnable.max_tokens, runnable.calls = name, 0.5, 1024, 0
+        return runnable
+
+    @staticmethod
+    def analyzer(large, fast):
+        analyzer = CodeAnalyzer.__new__(CodeAnalyzer)
+        analyzer.llms, analyzer.hedges = {'code': large}, {'code': fast}
+        return analyzer
+
+    @staticmethod
+    def ask(analyzer):
+        prompt = ChatPromptTemplate.from_messages([('human', 'Review {code}')])
+        return analyzer._invoke('code', prompt, {'code': 'int main;'}, formatter=str)
+
+    def test_fast_large_answer_is_not_hedged(self):
+        large, fast = self.model('large'), self.model('fast')
+        assert self.ask(self.analyzer(large, fast)) == 'Answer of large'
+        assert (large.calls, fast.calls) == (1, 0)
+        assert llm._hedge_stats == {'hedged': 0, 'fast_wins': 0}
+
+    def test_fast_tier_wins_a_late_request(self):
+        large, fast = self.model('large', delay=0.5), self.model('fast')
+        analyzer = self.analyzer(large, fast)
+        started = time.monotonic()
+        assert self.ask(analyzer) == 'Answer of fast'
+        assert time.monotonic() - started < 0.4
+        assert llm._hedge_stats == {'hedged': 1, 'fast_wins': 1}
+
+    def test_fast_answer_is_cached_under_the_fast_model(self):
+        large, fast = self.model('large', delay=0.5), self.model('fast')
+        analyzer = self.analyzer(large, fast)
+        self.ask(analyzer)
+        # The next identical request is not served the fast answer as the large model's
+        analyzer.llms['code'] = self.model('large')
+        assert self.ask(analyzer) == 'Answer of large'
+        assert self.ask(analyzer) == 'Answer of large'
+        assert analyzer.llms['code'].calls == 1
+
+    def test_failed_hedge_waits_for_the_large_tier(self):
+        large, fast = self.model('large', delay=0.2), self.model('fast', fails=True)
+        assert self.ask(self.analyzer(large, fast)) == 'Answer of large'
+        assert llm._hedge_stats == {'hedged': 1, 'fast_wins': 0}
+        # The failure counted, then the large tier's success closed the breaker again
+        assert llm._breaker.to_dict()['state'] == CLOSED
+
+    def test_both_tiers_failing_opens_the_breaker(self):
+        large, fast = self.model('large', delay=0.1, fails=True), self.model('fast', fails=True)
+        analyzer = self.analyzer(large, fast)
+        with pytest.raises(RuntimeError, match='large failed'):
+            self.ask(analyzer)
+        assert llm._breaker.state == OPEN
+        # An open breaker stops both tiers from being called at all
+        with pytest.raises(LLMUnavailable):
+            self.ask(analyzer)
+        assert (large.calls, fast.calls) == (1, 1)
@@ -0,0 +1,125 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import shutil
+import tempfile
+from datetime import date
+
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import app
+import compile_cache
+import models
+import regrade
+from models import db, Assignment, Question, Student, Submission
+from scores import get_gradebook
+
+pytestmark = pytest.mark.skipif(shutil.which('gcc') is None or shutil.which('prlimit') is None,
+                                reason='needs gcc and prlimit')
+
+SOURCES = {
+    'right': '#include <stdio.h>\nint main(){int a, b; scanf("%d %d", &a, &b); printf("%d", a + b); return 0;}\n',
+    'wrong': '#include <stdio.h>\nint main(){int a, b; scanf("%d %d", &a, &b); printf("%d", a * b); return 0;}\n',
+}
+
+
+@pytest.fixture
+def question(monkeypatch):
+    """
+    A question with two test cases, graded for three students: one right, one
+    wrong on the first test case and one whose source was never recorded.
+    """
+    directory = tempfile.mkdtemp()
+    os.chmod(directory, 0o755)
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', directory)
+    # The worker processes read the cache location from the environment
+    monkeypatch.setenv('COMPILE_CACHE_DIR', os.path.join(directory, 'cache'))
+    monkeypatch.setattr(compile_cache, 'COMPILE_CACHE_DIR', os.path.join(directory, 'cache'))
+    for name, source in SOURCES.items():
+        with open(os.path.join(directory, f'{name}.c'), 'w') as file:
+            file.write(source)
+
+    with app.app_context():
+        db.create_all()
+        assignment = Assignment(topic='Regrade', total_marks=10, num_questions=1)
+        question = Question(assignment=assignment, question='Add two numbers', marks=10)
+        question.testcases = [models.Testcase(case='2;2', output='4'), models.Testcase(case='1;2', output='3')]
+        db.session.add(question)
+        db.session.flush()
+        graded = {'right': (5, 5), 'wrong': (5, 0), None: (5, 5)}
+        students = []
+        for idx, (source_file, marks) in enumerate(graded.items()):
+            student = Student(roll=f'R_regrade_{idx}', name=f'Regrade {idx}', group='A1',
+                              email_id=f'regrade{idx}@example.com', password='x')
+            db.session.add(student)
+            db.session.flush()
+            students.append(student)
+            for testcase, testcase_marks in zip(question.testcases, marks):
+                db.session.add(Submission(
+                    st_id=student.id, ass_id=assignment.id, ques_id=question.id, test_case_id=testcase.id,
+                    date=date(2024, 1, 3), marks=testcase_marks, output='',
+                    feedback='Code Feedback:\nLooks fine.\n\nTest Case Feedback:\n',
+                    source_file=f'{source_file}.c' if source_file else None))
+        db.session.commit()
+        yield question
+        db.session.rollback()
+        Submission.query.filter_by(ques_id=question.id).delete()
+        db.session.delete(question.assignment)
+        for student in students:
+            db.session.delete(student)
+        db.session.commit()
+    shutil.rmtree(directory)
+
+
+def stored_marks(question):
+    return sorted((s.st_id, s.test_case_id, float(s.marks))
+                  for s in Submission.query.filter_by(ques_id=question.id))
+
+
+def test_unchanged_code_keeps_its_marks(question, monkeypatch):
+    """Regrading unchanged code rewrites every row in batches without changing a mark."""
+    before = stored_marks(question)
+    totals = get_gradebook()
+    commits = []
+
+    def count(session):
+        commits.append(session)
+
+    monkeypatch.setattr(regrade, 'REGRADE_BATCH_SIZE', 3)
+    event.listen(Session, 'after_commit', count)
+    try:
+        report = regrade.regrade(question_id=question.id, workers=2)
+    finally:
+        event.remove(Session, 'after_commit', count)
+
+    assert stored_marks(question) == before
+    assert get_gradebook() == totals
+    # Two sources of two test cases each: one batch of 4 rows, then the final commit
+    assert len(commits) == 2
+    assert (report['submissions'], report['testcases'], report['missing_sources']) == (2, 4, 1)
+    assert report['seconds'] > 0
+    assert report['submissions_per_sec'] == pytest.approx(report['submissions'] / report['seconds'])
+    for submission in Submission.query.filter(Submission.ques_id == question.id,
+                                              Submission.source_file.isnot(None)):
+        assert submission.feedback.startswith('Code Feedback:\nLooks fine.\n\nTest Case Feedback:\n'
+                                              + regrade.REGRADE_NOTE)
+
+
+def test_changed_testcase_regrades_marks_and_totals(question):
+    testcase = question.testcases[0]
+    testcase.case, testcase.output = '3;3', '9'  # 3 * 3 == 9, but 3 + 3 != 9
+    db.session.commit()
+
+    regrade.regrade(question_id=question.id, workers=2)
+    right, wrong = [student.id for student in Student.query.filter(
+        Student.roll.in_(['R_regrade_0', 'R_regrade_1'])).order_by(Student.roll)]
+    marks = {(st_id, testcase_id): value for st_id, testcase_id, value in stored_marks(question)}
+    assert marks[(right, testcase.id)] == 0
+    assert marks[(wrong, testcase.id)] == 5
+    totals = get_gradebook([right, wrong])
+    assert (totals[(right, question.ass_id)], totals[(wrong, question.ass_id)]) == (5, 5)
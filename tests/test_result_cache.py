@@ -0,0 +1,117 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from types import SimpleNamespace
+
+os.environ.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+import pytest
+
+from app import app
+import result_cache
+from comparator import expectation_for
+import models
+from models import db, Assignment, Question
+from runner import OK, TLE, RunResult, prepare_input
+
+# Stands in for a CompileResult whose binary is still the cached entry
+COMPILED = SimpleNamespace(key='binary', binary_path='main.out', is_installed=lambda: True)
+
+
+@pytest.fixture
+def question():
+    with app.app_context():
+        db.create_all()
+        question = Question(assignment=Assignment(topic='Cache'), question='Add', marks=2)
+        question.testcases = [models.Testcase(case='1;2', output='3'), models.Testcase(case='2;2', output='4')]
+        db.session.add(question)
+        db.session.commit()
+        yield question
+        db.session.rollback()
+        db.session.delete(question.assignment)
+        db.session.commit()
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Record the inputs every uncached run is given; each run prints the expected output."""
+    ran = []
+
+    def run_testcases(binary_path, inputs, expected_outputs, timeout):
+        ran.append(list(inputs))
+        return [RunResult(0, expected.text, '', OK, output_matches=True) for expected in expected_outputs]
+
+    monkeypatch.setattr(result_cache, 'run_testcases', run_testcases)
+    return ran
+
+
+def grade(question):
+    testcases = models.Testcase.query.filter_by(ques_id=question.id).order_by(models.Testcase.id).all()
+    return result_cache.run_testcases_cached(
+        COMPILED, testcases, [prepare_input(tc.case) for tc in testcases],
+        [expectation_for(tc) for tc in testcases])
+
+
+def test_key_covers_what_decides_the_verdict():
+    testcase = models.Testcase(case='1;2', output='3', compare_mode='exact', abs_tol=0.0, rel_tol=0.0)
+    key = result_cache.result_key('binary', testcase)
+    assert result_cache.result_key('binary', testcase) == key
+    for field, value in [('case', '1;3'), ('output', '4'), ('compare_mode', 'numeric'),
+                         ('abs_tol', 0.5), ('rel_tol', 0.1)]:
+        changed = models.Testcase(case='1;2', output='3', compare_mode='exact', abs_tol=0.0, rel_tol=0.0)
+        setattr(changed, field, value)
+        assert result_cache.result_key('binary', changed) != key, field
+    assert result_cache.result_key('other binary', testcase) != key
+    assert result_cache.result_key('binary', testcase, timeout=1) != key
+
+
+def test_results_are_reused(question, runs):
+    first = grade(question)
+    second = grade(question)
+    assert runs == [['1\n2', '2\n2']]
+    assert [r.cached for r in first] == [False, False]
+    assert [r.cached for r in second] == [True, True]
+
+
+def test_editing_a_testcase_invalidates_its_results(question, runs):
+    grade(question)
+    testcase = question.testcases[1]
+    testcase.case, testcase.output = '5;5', '10'
+    db.session.commit()
+
+    results = grade(question)
+    assert runs == [['1\n2', '2\n2'], ['5\n5']]  # only the edited test case runs again
+    assert [r.output for r in results] == ['3', '10']
+    assert [r.cached for r in results] == [True, False]
+
+
+def test_deleting_a_testcase_invalidates_its_results(question, runs):
+    grade(question)
+    testcase_id = question.testcases[0].id
+    db.session.delete(question.testcases[0])
+    db.session.commit()
+    assert testcase_id not in result_cache._by_testcase
+
+
+def test_timeouts_and_replaced_binaries_are_not_cached(question, monkeypatch):
+    calls = []
+
+    def run_testcases(binary_path, inputs, expected_outputs, timeout):
+        calls.append(len(inputs))
+        return [RunResult(-9, '', '', TLE) for _ in inputs]
+
+    monkeypatch.setattr(result_cache, 'run_testcases', run_testcases)
+    grade(question)
+    grade(question)
+    assert calls == [2, 2]
+
+    replaced = SimpleNamespace(key='replaced', binary_path='main.out', is_installed=lambda: False)
+    monkeypatch.setattr(result_cache, 'run_testcases',
+                        lambda binary_path, inputs, expected_outputs, timeout:
+                        [RunResult(0, 'x', '', OK) for _ in inputs])
+    testcases = models.Testcase.query.filter_by(ques_id=question.id).all()
+    for _ in range(2):
+        results = result_cache.run_testcases_cached(
+            replaced, testcases, [None] * len(testcases), [None] * len(testcases))
+        assert not any(r.cached for r in results)
@@ -0,0 +1,97 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import shutil
+import subprocess
+import tempfile
+
+import pytest
+
+import runner
+from runner import OK, TLE, MLE, OLE, RE
+
+pytestmark = pytest.mark.skipif(shutil.which('gcc') is None or shutil.which('prlimit') is None,
+                                reason='needs gcc and prlimit')
+
+PROGRAMS = {
+    'echo': '#include <stdio.h>\nint main(){int a, b; scanf("%d %d", &a, &b); printf("%d", a + b); return 0;}',
+    'spin': 'int main(){for(;;); return 0;}',
+    'sleep': '#include <unistd.h>\nint main(){sleep(60); return 0;}',
+    'hog': ('#include <stdlib.h>\n#include <string.h>\n'
+            'int main(){for(;;){char *p = malloc(1 << 20); if (!p) return 1; memset(p, 1, 1 << 20);}}'),
+    'flood': '#include <stdio.h>\nint main(){for(;;) puts("spam spam spam spam"); return 0;}',
+    'crash': 'int main(){int *p = 0; return *p;}',
+}
+
+
+@pytest.fixture(scope='module')
+def binaries():
+    """Compile every program once; the directory is readable by the unprivileged run user."""
+    directory = tempfile.mkdtemp()
+    os.chmod(directory, 0o755)
+    paths = {}
+    for name, source in PROGRAMS.items():
+        source_path = os.path.join(directory, f'{name}.c')
+        with open(source_path, 'w') as file:
+            file.write(source)
+        paths[name] = os.path.join(directory, f'{name}.out')
+        subprocess.run(['gcc', source_path, '-o', paths[name]], check=True)
+    yield paths
+    shutil.rmtree(directory)
+
+
+def test_ok(binaries):
+    result = runner.run_testcase(binaries['echo'], '2\n3', timeout=5)
+    assert (result.verdict, result.returncode, result.output) == (OK, 0, '5')
+    assert result.wall_time is not None and result.max_rss_kb > 0
+
+
+def test_time_limit(binaries):
+    """A program still running at the timeout is killed and reported as TLE."""
+    result = runner.run_testcase(binaries['spin'], None, timeout=1)
+    assert result.verdict == TLE
+    assert result.timed_out
+
+
+def test_memory_limit(binaries):
+    """Allocating past RLIMIT_AS fails, and the failure is reported as MLE, not RE."""
+    result = runner.run_testcase(binaries['hog'], None, timeout=5)
+    assert result.verdict == MLE
+    assert result.message.startswith('Memory limit')
+
+
+def test_output_limit(binaries):
+    """Printing past RUN_OUTPUT_LIMIT stops the program; only a preview is kept."""
+    result = runner.run_testcase(binaries['flood'], None, timeout=5)
+    assert result.verdict == OLE
+    assert result.output_size > runner.RUN_OUTPUT_LIMIT
+    assert len(result.output.encode('utf-8')) <= 1000
+
+
+def test_runtime_error(binaries):
+    result = runner.run_testcase(binaries['crash'], None, timeout=5)
+    assert result.verdict == RE
+    assert result.returncode < 0
+
+
+def test_run_testcases_keeps_order(binaries):
+    results = runner.run_testcases(binaries['echo'], ['1 2', '10 20', '-4 4'], timeout=5)
+    assert [result.output for result in results] == ['3', '30', '0']
+
+
+@pytest.mark.parametrize('program', ['echo', 'sleep'])
+def test_session_is_killed_before_the_child_is_reaped(binaries, monkeypatch, program):
+    """Until the child is reaped its pid cannot be reused, so killing its session is safe."""
+    states = []
+    kill_session = runner._kill_session
+
+    def record(pid):
+        with open(f'/proc/{pid}/stat') as stat:
+            states.append(stat.read().rsplit(')', 1)[1].split()[0])
+        kill_session(pid)
+
+    monkeypatch.setattr(runner, '_kill_session', record)
+    runner.run_testcase(binaries[program], '1 2', timeout=1)
+    # A timed out program is killed while it runs, then once more as a zombie
+    assert states[-1] == 'Z'
+    assert len(states) == (1 if program == 'echo' else 2)
@@ -0,0 +1,73 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from collections import OrderedDict
+
+import pytest
+
+import shared_feedback
+from shared_feedback import get_all_shared_stats, get_shared, get_shared_stats, normalize_errors, put_shared
+
+# The same mistake made by two students, in their own upload files
+FIRST = (
+    "uploads/3_17_5_0f3a.c: In function 'main':\n"
+    "uploads/3_17_5_0f3a.c:4:5: error: 'count' undeclared (first use in this function)\n"
+    "    4 |     count = 0;\n"
+    "      |     ^~~~~\n"
+)
+SECOND = (
+    "uploads/3_42_5_9b1c.c: In function 'main':\n"
+    "uploads/3_42_5_9b1c.c:9:13: error: 'count' undeclared (first use in this function)\n"
+    "    9 |             count = 0;\n"
+    "      |             ^~~~~\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def empty(monkeypatch):
+    monkeypatch.setattr(shared_feedback, '_entries', OrderedDict())
+    monkeypatch.setattr(shared_feedback, '_stats', {})
+
+
+def test_identical_errors_normalize_the_same():
+    assert normalize_errors(FIRST) == normalize_errors(SECOND) == (
+        "<file>: In function 'main':\nerror: 'count' undeclared (first use in this function)"
+    )
+
+
+def test_identifiers_are_kept():
+    assert normalize_errors(FIRST) != normalize_errors(FIRST.replace('count', 'total'))
+
+
+def test_runtime_details_are_stripped():
+    first = '/tmp/ccA1b2.o: in function `main\':\nmain.c:(.text+0x1f): undefined reference to `f\'\n'
+    second = '/tmp/ccZ9y8.o: in function `main\':\nother.c:(.text+0x4c): undefined reference to `f\'\n'
+    assert normalize_errors(first) == normalize_errors(second)
+    assert normalize_errors('uploads/1_2_3_ab.c.out: crashed at 0x7ffd1234, pid 4242') == (
+        '<binary>: crashed at <address>, pid <n>'
+    )
+
+
+def test_second_student_gets_the_shared_hint():
+    assert get_shared(5, 'compilation', FIRST) is None
+    put_shared(5, 'compilation', FIRST, 'Declare count first.')
+    assert get_shared(5, 'compilation', SECOND) == 'Declare count first.'
+    # Other questions, kinds and inputs do not share it
+    assert get_shared(6, 'compilation', SECOND) is None
+    assert get_shared(5, 'runtime', SECOND) is None
+    assert get_shared(5, 'compilation', SECOND, test_input='1 2') is None
+
+    stats = get_shared_stats(5)
+    assert (stats['hits'], stats['misses']) == (1, 3)
+    assert stats['errors'] == [{'kind': 'compilation', 'errors': normalize_errors(FIRST), 'hits': 1}]
+    assert set(get_all_shared_stats()) == {5, 6}
+
+
+def test_expired_and_evicted_hints(monkeypatch):
+    monkeypatch.setattr(shared_feedback, 'SHARED_FEEDBACK_MAX_ENTRIES', 1)
+    put_shared(5, 'compilation', FIRST, 'Declare count first.')
+    put_shared(5, 'runtime', 'Segmentation fault', 'Check the index.')
+    assert get_shared(5, 'compilation', FIRST) is None
+
+    monkeypatch.setattr(shared_feedback, 'SHARED_FEEDBACK_TTL', -1)
+    assert get_shared(5, 'runtime', 'Segmentation fault') is None